@@ -0,0 +1,11 @@
+-- Secondary indexes. nc_to_db drops these before a bulk load and creates them afterwards.
+-- forecast_values needs none: its primary key (run_id, leadtime_hours, cell_id) already covers the queries.
+
+-- query_forecast_db: variable and base time, model optional
+CREATE INDEX IF NOT EXISTS runs_variable_base_time ON runs(variable_name, base_time, model);
+
+-- query_forecast_db: cells inside query limits
+CREATE INDEX IF NOT EXISTS grid_cells_lat_lon ON grid_cells(lat, lon);
+
+-- query_analysis: variable and time range, covering the selected columns
+CREATE INDEX IF NOT EXISTS analysis_variable_datetime ON analysis(variable_name, datetime, lon, lat, value);
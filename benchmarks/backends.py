@@ -0,0 +1,130 @@
+"""Latency of geodata.get_dataframe reading the same forecast from netCDF, SQLite and the columnar store.
+
+Usage: python benchmarks/backends.py [--lat 420] [--lon 700] [--leadtimes 24] [--repeat 5]
+"""
+import io
+import os
+import sys
+import time
+import sqlite3
+import tempfile
+import contextlib
+from pathlib import Path
+from statistics import median
+from datetime import datetime
+from argparse import ArgumentParser
+
+from synthetic import synthetic_dataset
+import nc_to_db
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from src import geodata
+from src import columnar
+
+
+SCHEMA = Path(__file__).parent.parent / "air_quality.schema"
+BASE_TIME = datetime(2025, 5, 10)
+NC_PATH = Path("data/netcdf/cams-europe-air-quality-forecasts/EU-forecast-PM10-2025-05-10-24/ENS_FORECAST.nc") # Path query_forecast_nc reads
+
+
+def build(n_lat:int, n_lon:int, n_leadtimes:int):
+    """Writes the same synthetic file to every backend under the working directory."""
+    NC_PATH.parent.mkdir(parents=True)
+    synthetic_dataset(n_lat, n_lon, n_leadtimes, base_time=BASE_TIME).to_netcdf(NC_PATH)
+    with sqlite3.connect("AirQuality.db") as conn:
+        conn.executescript(SCHEMA.read_text())
+    conn.close()
+
+    timings = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        ds = nc_to_db._get_data_set(str(NC_PATH))
+        nc_to_db._store_chunks(ds, "AirQuality.db")
+        ds.close()
+        timings["db"] = time.perf_counter() - start
+        start = time.perf_counter()
+        nc_to_db.store_columnar(str(NC_PATH))
+        timings["columnar"] = time.perf_counter() - start
+
+    sizes = {
+        "nc": NC_PATH.stat().st_size,
+        "db": os.path.getsize("AirQuality.db"),
+        "columnar": sum(path.stat().st_size for path in Path("data/columnar").rglob("*") if path.is_file()),
+    }
+    for backend, size in sizes.items():
+        ingest = f", ingest {timings[backend]:.2f}sec" if backend in timings else ""
+        print(f"{backend:>8}: {size/2**20:.1f} MiB on disk{ingest}")
+
+
+def read_nc(query:geodata.ForecastQuery):
+    with geodata.xr.open_dataset(NC_PATH, engine="netcdf4") as ds:
+        return ds["pm10_conc"][query.leadtime, 0].values
+
+
+def read_db(query:geodata.ForecastQuery):
+    sql, parameters = geodata.forecast_sql(query)
+    with sqlite3.connect("AirQuality.db") as conn:
+        rows = conn.execute(sql, parameters).fetchall()
+    conn.close()
+    return rows
+
+
+def read_columnar(query:geodata.ForecastQuery):
+    return columnar.read_leadtime(columnar.run_dir(query.variable, "ENSEMBLE", query.time), query.leadtime).copy()
+
+
+# Only the values of a full map, without building the DataFrame
+READS = {"nc": read_nc, "db": read_db, "columnar": read_columnar}
+
+
+def measure_read(query:geodata.ForecastQuery, repeat:int):
+    print("\nfull map, read only")
+    for backend, read in READS.items():
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            read(query)
+            timings.append(time.perf_counter() - start)
+        print(f"{backend:>8}: median {median(timings)*1000:.1f}ms")
+
+
+def measure(name:str, query:geodata.ForecastQuery|geodata.ForecastMultiQuery, repeat:int):
+    print(f"\n{name}")
+    for backend in geodata.BACKENDS:
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            df = geodata.get_dataframe(query, backend, cache=False)
+            timings.append(time.perf_counter() - start)
+        print(f"{backend:>8}: {len(df)} rows, median {median(timings)*1000:.1f}ms")
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lat", type=int, default=420)
+    parser.add_argument("--lon", type=int, default=700)
+    parser.add_argument("--leadtimes", type=int, default=24)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    region = {"north": 66, "south": 62, "west": -20, "east": -10}
+    queries = {
+        "full map": geodata.ForecastQuery("PM10", BASE_TIME, 0, None, None),
+        "region": geodata.ForecastQuery("PM10", BASE_TIME, 0, None, region),
+        f"region, {min(args.leadtimes, 12)} leadtimes": geodata.ForecastMultiQuery("PM10", BASE_TIME, list(range(min(args.leadtimes, 12))), None, region),
+    }
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            build(args.lat, args.lon, args.leadtimes)
+            measure_read(queries["full map"], args.repeat)
+            for name, query in queries.items():
+                measure(name, query, args.repeat)
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    main()
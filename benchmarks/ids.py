@@ -0,0 +1,59 @@
+"""Time of building the plotly id column of a full-Europe frame: the old per-row
+DataFrame.apply, geodata.feature_ids and integer cams.cell_id ids.
+
+Usage: python benchmarks/ids.py [--lat 420] [--lon 700] [--repeat 5]
+"""
+import sys
+import time
+from pathlib import Path
+from statistics import median
+from argparse import ArgumentParser
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from src import cams
+from src import geodata
+
+
+def frame(n_lat:int, n_lon:int) -> pd.DataFrame:
+    longitudes = np.round((335.05 + 0.1 * np.arange(n_lon) + 180) % 360 - 180, 2)
+    latitudes = np.round(71.95 - 0.1 * np.arange(n_lat), 2)
+    lon, lat = np.meshgrid(longitudes, latitudes)
+    values = np.random.default_rng(0).random(lon.size, dtype=np.float32) * 30
+    return pd.DataFrame({"value": values, "lon": lon.ravel(), "lat": lat.ravel(), "leadtime": 0.0})
+
+
+def apply_ids(df:pd.DataFrame):
+    return df.apply(lambda row: f"[{row['lon']}, {row['lat']}]", axis=1)
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lat", type=int, default=420)
+    parser.add_argument("--lon", type=int, default=700)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    df = frame(args.lat, args.lon)
+    lon, lat = df["lon"].to_numpy(), df["lat"].to_numpy()
+    methods = {
+        "DataFrame.apply": lambda: apply_ids(df),
+        "feature_ids": lambda: geodata.feature_ids(lon, lat),
+        "cell_id": lambda: cams.cell_id(lon, lat),
+    }
+    assert (apply_ids(df).to_numpy() == geodata.feature_ids(lon, lat)).all()
+
+    print(f"{len(df)} rows")
+    for name, method in methods.items():
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            method()
+            timings.append(time.perf_counter() - start)
+        print(f"{name:>16}: median {median(timings)*1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
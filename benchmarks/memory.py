@@ -0,0 +1,87 @@
+"""Memory of a full-Europe multi-leadtime query result: today's DataFrame against geodata.ForecastResult
+and its compact frame. Peak is the most memory allocated while building the result (tracemalloc).
+
+Usage: python benchmarks/memory.py [--lat 420] [--lon 700] [--leadtimes 24] [--db]
+"""
+import io
+import os
+import sys
+import time
+import sqlite3
+import tempfile
+import contextlib
+import tracemalloc
+from pathlib import Path
+from argparse import ArgumentParser
+
+from backends import BASE_TIME, NC_PATH, SCHEMA
+from synthetic import synthetic_dataset
+import nc_to_db
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from src import geodata
+
+
+def traced(build):
+    """(result, seconds, peak bytes allocated) of build()."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, seconds, peak
+
+
+def report(name:str, size:int, seconds:float, peak:int):
+    print(f"{name:>22}: {size/2**20:8.1f} MiB, peak {peak/2**20:8.1f} MiB, {seconds*1000:8.1f}ms")
+
+
+def measure(query:geodata.ForecastQuery, backend:str):
+    print(f"\n{backend}")
+    df, seconds, peak = traced(lambda: geodata.get_dataframe(query, backend, cache=False))
+    report("DataFrame", int(df.memory_usage(deep=True).sum()), seconds, peak)
+    del df
+    result, seconds, peak = traced(lambda: geodata.query_result(query, backend))
+    report("ForecastResult", result.nbytes, seconds, peak)
+    compact, seconds, peak = traced(lambda: result.to_dataframe(compact=True))
+    report("compact to_dataframe", int(compact.memory_usage(deep=True).sum()), seconds, peak)
+    del compact
+    df, seconds, peak = traced(lambda: result.to_dataframe())
+    report("to_dataframe", int(df.memory_usage(deep=True).sum()), seconds, peak)
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lat", type=int, default=420)
+    parser.add_argument("--lon", type=int, default=700)
+    parser.add_argument("--leadtimes", type=int, default=24)
+    parser.add_argument("--db", action="store_true", help="Also measure the database backend. Ingesting takes a while.")
+    args = parser.parse_args()
+
+    query = geodata.ForecastQuery("PM10", BASE_TIME, list(range(args.leadtimes)), None, None)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            NC_PATH.parent.mkdir(parents=True)
+            synthetic_dataset(args.lat, args.lon, args.leadtimes, base_time=BASE_TIME).to_netcdf(NC_PATH)
+            print(f"{args.lat}x{args.lon} cells, {args.leadtimes} leadtimes")
+            measure(query, "nc")
+            if args.db:
+                with sqlite3.connect("AirQuality.db") as conn:
+                    conn.executescript(SCHEMA.read_text())
+                conn.close()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    ds = nc_to_db._get_data_set(str(NC_PATH))
+                    nc_to_db._store_chunks(ds, "AirQuality.db")
+                    ds.close()
+                geodata.set_database("AirQuality.db")
+                measure(query, "db")
+        finally:
+            geodata.DATASETS.clear()
+            os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""EXPLAIN QUERY PLAN and latency of geodata.query_forecast_db on a synthetic database,
+with and without the indexes in air_quality.indexes.sql.
+
+Usage: python benchmarks/query_plan.py [--lat 420] [--lon 700] [--leadtimes 24] [--runs 2] [--repeat 5]
+"""
+import os
+import sys
+import time
+import sqlite3
+import tempfile
+from pathlib import Path
+from statistics import median
+from datetime import datetime, timedelta
+from argparse import ArgumentParser
+
+from synthetic import synthetic_file, write_leadtime
+import nc_to_db
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from src import geodata
+
+
+SCHEMA = Path(__file__).parent.parent / "air_quality.schema"
+BASE_TIME = datetime(2025, 5, 10)
+
+
+def build_database(path:str, n_lat:int, n_lon:int, n_leadtimes:int, n_runs:int):
+    start = time.perf_counter()
+    rows = 0
+    with sqlite3.connect(path) as conn:
+        conn.executescript(SCHEMA.read_text())
+        for variable_name in ("PM10", "NO2"):
+            for day in range(n_runs):
+                meta, values = synthetic_file(n_lat, n_lon, n_leadtimes, variable_name, BASE_TIME + timedelta(days=day), seed=day)
+                run_id = nc_to_db._ensure_run(conn, meta)
+                for leadtime_idx in range(n_leadtimes):
+                    rows += write_leadtime(conn, run_id, meta, leadtime_idx, values[leadtime_idx])
+        nc_to_db.create_indexes(conn)
+    conn.close()
+    print(f"{rows} rows, {os.path.getsize(path)/2**20:.0f} MiB in {time.perf_counter()-start:.1f}sec")
+
+
+def measure(name:str, query:geodata.ForecastQuery, repeat:int):
+    sql, parameters = geodata.forecast_sql(query)
+    sql_timings = []
+    with sqlite3.connect("AirQuality.db") as conn:
+        plan = conn.execute("EXPLAIN QUERY PLAN " + sql, parameters).fetchall()
+        for _ in range(repeat):
+            start = time.perf_counter()
+            conn.execute(sql, parameters).fetchall()
+            sql_timings.append(time.perf_counter() - start)
+    conn.close()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        df = geodata.query_forecast_db(query)
+        timings.append(time.perf_counter() - start)
+    print(f"\n{name}: {len(df)} rows, SQL median {median(sql_timings)*1000:.1f}ms, query_forecast_db median {median(timings)*1000:.1f}ms")
+    for _, _, _, detail in plan:
+        print(f"    {detail}")
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lat", type=int, default=420)
+    parser.add_argument("--lon", type=int, default=700)
+    parser.add_argument("--leadtimes", type=int, default=24)
+    parser.add_argument("--runs", type=int, default=2, help="Runs per variable. Two variables are written.")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    queries = {
+        "full map": geodata.ForecastQuery("PM10", BASE_TIME, 0, None, None),
+        "full map, model": geodata.ForecastQuery("PM10", BASE_TIME, 0, "ENSEMBLE", None),
+        "region": geodata.ForecastQuery("PM10", BASE_TIME, 0, None, {"north": 66, "south": 62, "west": -20, "east": -10}),
+        "region, 12 leadtimes": geodata.ForecastQuery("PM10", BASE_TIME, list(range(12)), None, {"north": 66, "south": 62, "west": -20, "east": -10}),
+    }
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            build_database("AirQuality.db", args.lat, args.lon, args.leadtimes, args.runs)
+            for indexed in (True, False):
+                print(f"\n=== {'with' if indexed else 'without'} indexes ===")
+                if not indexed:
+                    with sqlite3.connect("AirQuality.db") as conn:
+                        nc_to_db.drop_indexes(conn)
+                    conn.close()
+                for name, query in queries.items():
+                    measure(name, query, args.repeat)
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    main()
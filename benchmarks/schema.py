@@ -0,0 +1,173 @@
+"""Ingest speed and database size of the forecast table layouts:
+md5 hash column, natural key (migrations/0001) and normalized runs/grid_cells/forecast_values (migrations/0002).
+
+Usage: python benchmarks/schema.py [--lat 200] [--lon 300] [--leadtimes 6]
+"""
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import tempfile
+from pathlib import Path
+from itertools import repeat
+from argparse import ArgumentParser
+
+import numpy as np
+
+from synthetic import synthetic_file, write_leadtime
+import nc_to_db
+
+
+SCHEMA = Path(__file__).parent.parent / "air_quality.schema"
+
+VOCABULARY = """
+INSERT INTO variables (short_name) VALUES ('PM10');
+INSERT INTO units (name) VALUES ('μg/m3');
+"""
+
+# forecasts table before migrations/0001_forecasts_natural_key.sql
+HASH_FORECASTS = """
+DROP TABLE forecast_values;
+DROP TABLE runs;
+DROP TABLE grid_cells;
+CREATE TABLE forecasts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    variable_name TEXT NOT NULL,
+    unit_name TEXT NOT NULL,
+    value REAL NOT NULL,
+    lon REAL NOT NULL,
+    lat REAL NOT NULL,
+    datetime NUMERIC,
+    leadtime NUMERIC,
+    model TEXT,
+    hash TEXT UNIQUE NOT NULL,
+    FOREIGN KEY(variable_name) REFERENCES variables(short_name),
+    FOREIGN KEY(unit_name) REFERENCES units(name)
+);
+"""
+HASH_INSERT = """INSERT OR IGNORE INTO forecasts 
+    (variable_name, unit_name, value, lon, lat, datetime, leadtime, model, hash) 
+    VALUES 
+    (?, ?, ?, ?, ?, ?, ?, ?, ?)"""
+
+# forecasts table after migrations/0001_forecasts_natural_key.sql
+NATURAL_KEY_FORECASTS = """
+DROP TABLE forecast_values;
+DROP TABLE runs;
+DROP TABLE grid_cells;
+CREATE TABLE forecasts (
+    variable_name TEXT NOT NULL,
+    unit_name TEXT NOT NULL,
+    value REAL NOT NULL,
+    lon REAL NOT NULL,
+    lat REAL NOT NULL,
+    datetime NUMERIC NOT NULL,
+    leadtime NUMERIC NOT NULL,
+    model TEXT NOT NULL,
+    PRIMARY KEY(variable_name, model, datetime, leadtime, lon, lat),
+    FOREIGN KEY(variable_name) REFERENCES variables(short_name),
+    FOREIGN KEY(unit_name) REFERENCES units(name)
+) WITHOUT ROWID;
+"""
+NATURAL_KEY_INSERT = """INSERT INTO forecasts 
+    (variable_name, unit_name, value, lon, lat, datetime, leadtime, model) 
+    VALUES 
+    (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(variable_name, model, datetime, leadtime, lon, lat) DO UPDATE SET value=excluded.value, unit_name=excluded.unit_name"""
+
+
+def hash_data_entry(entry:dict) -> str:
+    hash = hashlib.md5()
+    hash.update(json.dumps(entry, sort_keys=True).encode())
+    return hash.hexdigest()
+
+
+def text_columns(meta:nc_to_db.FileMeta):
+    """Row columns of the old forecasts table"""
+    lon_column = [cell[1] for cell in meta.cells]
+    lat_column = [cell[2] for cell in meta.cells]
+    leadtimes = [f"2025/05/{10 + hour // 24:02d} {hour % 24:02d}:00" for hour in meta.leadtime_hours]
+    return lon_column, lat_column, "2025/05/10 00:00", leadtimes
+
+
+def hash_layout(conn:sqlite3.Connection, meta:nc_to_db.FileMeta, values:np.ndarray):
+    conn.executescript(HASH_FORECASTS)
+    lon_column, lat_column, forecast_time, leadtimes = text_columns(meta)
+    def write(leadtime_idx:int):
+        def rows():
+            for value, lon, lat in zip(values[leadtime_idx].ravel().tolist(), lon_column, lat_column):
+                hash = hash_data_entry({
+                    "variable_name":meta.variable_name, "unit_name":meta.unit_name, "value":value, "lon":lon, "lat":lat,
+                    "time":forecast_time, "leadtime":leadtimes[leadtime_idx], "model":meta.model
+                })
+                yield (meta.variable_name, meta.unit_name, value, lon, lat, forecast_time, leadtimes[leadtime_idx], meta.model, hash)
+        with conn:
+            conn.executemany(HASH_INSERT, rows())
+    return write
+
+
+def natural_key_layout(conn:sqlite3.Connection, meta:nc_to_db.FileMeta, values:np.ndarray):
+    conn.executescript(NATURAL_KEY_FORECASTS)
+    lon_column, lat_column, forecast_time, leadtimes = text_columns(meta)
+    def write(leadtime_idx:int):
+        rows = zip(
+            repeat(meta.variable_name), repeat(meta.unit_name), values[leadtime_idx].ravel().tolist(), lon_column, lat_column,
+            repeat(forecast_time), repeat(leadtimes[leadtime_idx]), repeat(meta.model)
+        )
+        with conn:
+            conn.executemany(NATURAL_KEY_INSERT, rows)
+    return write
+
+
+def normalized_layout(conn:sqlite3.Connection, meta:nc_to_db.FileMeta, values:np.ndarray):
+    run_id = nc_to_db._ensure_run(conn, meta)
+    def write(leadtime_idx:int):
+        write_leadtime(conn, run_id, meta, leadtime_idx, values[leadtime_idx])
+    return write
+
+
+def run(path:str, layout, meta, values) -> list[float]:
+    with sqlite3.connect(path) as conn:
+        conn.executescript(SCHEMA.read_text() + VOCABULARY)
+        conn.execute("PRAGMA foreign_keys = ON;")
+        write = layout(conn, meta, values)
+        timings = []
+        for _ in range(2): # Fresh ingest, then re-ingest of the same file
+            start = time.perf_counter()
+            for leadtime_idx in range(len(values)):
+                write(leadtime_idx)
+            timings.append(time.perf_counter() - start)
+        conn.execute("VACUUM")
+    conn.close()
+    return timings
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lat", type=int, default=200)
+    parser.add_argument("--lon", type=int, default=300)
+    parser.add_argument("--leadtimes", type=int, default=6)
+    args = parser.parse_args()
+
+    meta, values = synthetic_file(args.lat, args.lon, args.leadtimes)
+    rows = values.size
+    print(f"{rows} rows ({args.leadtimes} leadtimes x {args.lat} x {args.lon})")
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, layout in (("md5 hash", hash_layout), ("natural key", natural_key_layout), ("normalized", normalized_layout)):
+            path = os.path.join(tmp, name.replace(" ", "_") + ".db")
+            results[name] = run(path, layout, meta, values), os.path.getsize(path)
+
+    print(f"{'':<12}{'ingest':>18}{'re-ingest':>18}{'size':>12}")
+    for name, ((first, second), size) in results.items():
+        print(f"{name:<12}{rows/first:>12.0f} rows/s{rows/second:>12.0f} rows/s{size/2**20:>9.1f} MiB")
+    (hash_first, hash_second), hash_size = results["md5 hash"]
+    for name in ("natural key", "normalized"):
+        (first, second), size = results[name]
+        print(f"{name} vs md5 hash: ingest {hash_first/first:.2f}x faster, re-ingest {hash_second/second:.2f}x, database {hash_size/size:.2f}x smaller")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""Synthetic CAMS-like forecasts for the benchmarks."""
+import sys
+from pathlib import Path
+from datetime import datetime
+
+import numpy as np
+import xarray as xr
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+import cams
+import nc_to_db
+
+
+def synthetic_file(n_lat:int, n_lon:int, n_leadtimes:int, variable_name:str="PM10", base_time:datetime=datetime(2025, 5, 10), seed:int=0) -> tuple[nc_to_db.FileMeta, np.ndarray]:
+    """FileMeta and (leadtime, lat, lon) values of a grid starting from the north-west corner of CAMS Europe."""
+    longitudes = 335.05 + 0.1 * np.arange(n_lon)
+    latitudes = 71.95 - 0.1 * np.arange(n_lat)
+    lon, lat = np.meshgrid(longitudes, latitudes)
+    cell_grid = cams.cell_id(lon, lat)
+    cells = np.round(np.stack((cell_grid.ravel(), (lon.ravel() + 180) % 360 - 180, lat.ravel()), axis=1), 2)
+    meta = nc_to_db.FileMeta(
+        path="synthetic.nc", nc_variable="pm10_conc", variable_name=variable_name, unit_name="μg/m3", model="ENSEMBLE",
+        base_time=cams.unix_time(base_time),
+        leadtime_hours=list(range(n_leadtimes)),
+        cells=[(int(id), lon, lat) for id, lon, lat in cells.tolist()],
+        cell_grid=cell_grid,
+    )
+    values = np.random.default_rng(seed).random((n_leadtimes, n_lat, n_lon), dtype=np.float32) * 30
+    return meta, values
+
+
+def write_leadtime(conn, run_id:int, meta:nc_to_db.FileMeta, leadtime_idx:int, values:np.ndarray) -> int:
+    """Writes a whole (lat, lon) slab as one chunk."""
+    chunk = nc_to_db.Chunk(leadtime_idx, 0, values.shape[0])
+    return nc_to_db._write_chunk(conn, run_id, meta, chunk, values)
+
+
+def synthetic_dataset(n_lat:int, n_lon:int, n_leadtimes:int, nc_variable:str="pm10_conc", base_time:datetime=datetime(2025, 5, 10), seed:int=0) -> xr.Dataset:
+    """Dataset laid out like a CAMS Europe forecast file: (time, level, latitude, longitude),
+    descending latitudes and longitudes in 0-360 wrapping around the prime meridian."""
+    longitudes = (np.round(335.05 + 0.1 * np.arange(n_lon), 2) % 360).astype(np.float32)
+    latitudes = np.round(71.95 - 0.1 * np.arange(n_lat), 2).astype(np.float32)
+    values = np.random.default_rng(seed).random((n_leadtimes, 1, n_lat, n_lon), dtype=np.float32) * 30
+    return xr.Dataset(
+        {nc_variable: (("time", "level", "latitude", "longitude"), values, {"units": "µg/m3"})},
+        coords={
+            "longitude": ("longitude", longitudes, {"units": "degrees_east"}),
+            "latitude": ("latitude", latitudes, {"units": "degrees_north"}),
+            "level": ("level", np.zeros(1, dtype=np.float32)),
+            "time": ("time", np.arange(n_leadtimes, dtype=np.float32), {"units": "hours"}),
+        },
+        attrs={"FORECAST": f"Europe, {base_time:%Y%m%d}+[0H_{n_leadtimes-1}H]", "source": "Data from ENSEMBLE model"},
+    )
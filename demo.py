@@ -7,7 +7,7 @@ from datetime import datetime, timedelta
 from src import geodata
 from src.geodata import ForecastMultiQuery, GeoJSON
 from src import crop_geojson
-from src.pollution import accumulation, Coordinate
+from src.pollution import Coordinate, GridIndex, TimeSeries
 
 # Region & data config
 CITY_REGIONS = {
@@ -41,12 +41,13 @@ df = geodata.get_dataframe(ForecastMultiQuery(
     model=None,
     limits=geojson["limits"]
 ))
-accumulative_exposure = [accumulation(
-    df, Coordinate(lon=2.35, lat=48.85), 
-    datetime(2025, 5, 10, 0, 0), datetime(2025, 5, 10, 1, 0) + timedelta(hours=i),
-    air_intake_cubics_per_minute=1)
-    for i in range(0, TIME_SPAN)
-]
+index = GridIndex(df)
+series = TimeSeries.of(index, datetime(2025, 5, 10, 0, 0), [Coordinate(lon=2.35, lat=48.85)])
+# Inhaled with 1 m3 of air per minute from midnight until every hour, every window in one call
+accumulative_exposure = (60 * series.integrate(
+    datetime(2025, 5, 10, 0, 0),
+    [datetime(2025, 5, 10, 1, 0) + timedelta(hours=i) for i in range(0, TIME_SPAN)]
+)[:, 0]).tolist()
 
 
 # Helper to build map figure
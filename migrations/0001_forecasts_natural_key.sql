@@ -0,0 +1,32 @@
+-- Replaces the md5 hash column of forecasts with a composite primary key.
+-- The table is stored WITHOUT ROWID so the key is the table and needs no separate index.
+-- Usage: Get-Content .\migrations\0001_forecasts_natural_key.sql | sqlite3 .\AirQuality.db
+PRAGMA foreign_keys = OFF;
+BEGIN;
+
+CREATE TABLE forecasts_natural_key (
+    variable_name TEXT NOT NULL,
+    unit_name TEXT NOT NULL,
+    value REAL NOT NULL,
+    lon REAL NOT NULL,
+    lat REAL NOT NULL,
+    datetime NUMERIC NOT NULL,
+    leadtime NUMERIC NOT NULL,
+    model TEXT NOT NULL,
+    PRIMARY KEY(variable_name, model, datetime, leadtime, lon, lat),
+    FOREIGN KEY(variable_name) REFERENCES variables(short_name),
+    FOREIGN KEY(unit_name) REFERENCES units(name)
+) WITHOUT ROWID;
+
+-- Rows that only differed by value collapse into the newest one, same as a re-ingest would do
+INSERT INTO forecasts_natural_key (variable_name, unit_name, value, lon, lat, datetime, leadtime, model)
+SELECT variable_name, unit_name, value, lon, lat, datetime, leadtime, COALESCE(model, 'ENSEMBLE')
+FROM forecasts WHERE true ORDER BY id
+ON CONFLICT(variable_name, model, datetime, leadtime, lon, lat) DO UPDATE SET value=excluded.value;
+
+DROP TABLE forecasts;
+ALTER TABLE forecasts_natural_key RENAME TO forecasts;
+
+COMMIT;
+PRAGMA foreign_keys = ON;
+VACUUM;
@@ -0,0 +1,77 @@
+-- Moves forecasts into runs, grid_cells and forecast_values (see air_quality.schema).
+-- Run after 0001_forecasts_natural_key.sql.
+-- Usage: Get-Content .\migrations\0002_normalized_forecasts.sql | sqlite3 .\AirQuality.db
+PRAGMA foreign_keys = OFF;
+BEGIN;
+
+CREATE TABLE grid_cells (
+    id INTEGER PRIMARY KEY NOT NULL,
+    lon REAL NOT NULL,
+    lat REAL NOT NULL
+);
+
+CREATE TABLE runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    variable_name TEXT NOT NULL,
+    unit_name TEXT NOT NULL,
+    model TEXT NOT NULL,
+    base_time INTEGER NOT NULL,
+    UNIQUE(variable_name, model, base_time),
+    FOREIGN KEY(variable_name) REFERENCES variables(short_name),
+    FOREIGN KEY(unit_name) REFERENCES units(name)
+);
+
+CREATE TABLE forecast_values (
+    run_id INTEGER NOT NULL,
+    leadtime_hours INTEGER NOT NULL,
+    cell_id INTEGER NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY(run_id, leadtime_hours, cell_id),
+    FOREIGN KEY(run_id) REFERENCES runs(id),
+    FOREIGN KEY(cell_id) REFERENCES grid_cells(id)
+) WITHOUT ROWID;
+
+-- Old rows store '%Y/%m/%d %H:%M' strings and longitudes in 0..360
+CREATE TEMP TABLE old_forecasts AS
+SELECT
+    variable_name,
+    unit_name,
+    model,
+    CAST(strftime('%s', replace(datetime, '/', '-')) AS INTEGER) AS base_time,
+    (CAST(strftime('%s', replace(leadtime, '/', '-')) AS INTEGER) - CAST(strftime('%s', replace(datetime, '/', '-')) AS INTEGER)) / 3600 AS leadtime_hours,
+    round(CASE WHEN lon >= 180 THEN lon - 360 ELSE lon END, 2) AS lon,
+    round(lat, 2) AS lat,
+    value
+FROM forecasts;
+
+-- Same formula as cams.cell_id
+INSERT OR IGNORE INTO grid_cells (id, lon, lat)
+SELECT DISTINCT
+    (CAST(round(lat * 100) AS INTEGER) + 9000) * 36000 + CAST(round(lon * 100) AS INTEGER) + 18000,
+    lon,
+    lat
+FROM old_forecasts;
+
+INSERT OR IGNORE INTO runs (variable_name, unit_name, model, base_time)
+SELECT DISTINCT variable_name, unit_name, model, base_time FROM old_forecasts;
+
+INSERT OR REPLACE INTO forecast_values (run_id, leadtime_hours, cell_id, value)
+SELECT
+    runs.id,
+    old_forecasts.leadtime_hours,
+    (CAST(round(old_forecasts.lat * 100) AS INTEGER) + 9000) * 36000 + CAST(round(old_forecasts.lon * 100) AS INTEGER) + 18000,
+    old_forecasts.value
+FROM old_forecasts
+JOIN runs ON runs.variable_name=old_forecasts.variable_name AND runs.model=old_forecasts.model AND runs.base_time=old_forecasts.base_time;
+
+DROP TABLE old_forecasts;
+DROP TABLE forecasts;
+
+-- Secondary indexes of air_quality.indexes.sql, so queries do not wait for the next ingest to create them
+CREATE INDEX IF NOT EXISTS runs_variable_base_time ON runs(variable_name, base_time, model);
+CREATE INDEX IF NOT EXISTS grid_cells_lat_lon ON grid_cells(lat, lon);
+CREATE INDEX IF NOT EXISTS analysis_variable_datetime ON analysis(variable_name, datetime, lon, lat, value);
+
+COMMIT;
+PRAGMA foreign_keys = ON;
+VACUUM;
@@ -0,0 +1,10 @@
+-- Adds the table nc_to_db records written chunks in.
+-- Usage: Get-Content .\migrations\0003_ingest_checkpoints.sql | sqlite3 .\AirQuality.db
+CREATE TABLE IF NOT EXISTS ingest_checkpoints (
+    run_id INTEGER NOT NULL,
+    leadtime_hours INTEGER NOT NULL,
+    lat_start INTEGER NOT NULL,
+    lat_stop INTEGER NOT NULL,
+    PRIMARY KEY(run_id, leadtime_hours, lat_start),
+    FOREIGN KEY(run_id) REFERENCES runs(id)
+);
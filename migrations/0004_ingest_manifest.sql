@@ -0,0 +1,9 @@
+-- Adds the table ingest_daemon keeps its file manifest in.
+-- Usage: Get-Content .\migrations\0004_ingest_manifest.sql | sqlite3 .\AirQuality.db
+CREATE TABLE IF NOT EXISTS ingest_manifest (
+    path TEXT PRIMARY KEY NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    checksum TEXT NOT NULL,
+    ingested_at INTEGER NOT NULL
+);
@@ -1,2 +1,3 @@
 Get-Content .\air_quality.schema | sqlite3 .\AirQuality.db
+Get-Content .\air_quality.indexes.sql | sqlite3 .\AirQuality.db
 py .\initdb.py
\ No newline at end of file
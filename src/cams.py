@@ -0,0 +1,113 @@
+from datetime import datetime, timezone
+
+import numpy as np
+import xarray as xr
+
+
+# netCDF variable name -> variable name used in queries (see geodata.ForecastQuery)
+VARIABLES = {
+    "pm2p5_conc": "PM2.5",
+    "pm2p5_no3_conc": "PM2.5 Nitrate",
+    "pm2p5_so4_conc": "PM2.5 Sulphate",
+    "ecres_conc": "PM2.5 REC",
+    "ectot_conc": "PM2.5 TEC",
+    "sia_conc": "PM2.5 SIA",
+    "pm2p5_total_om_conc": "PM2.5 TOM",
+    "pm10_conc": "PM10",
+    "dust": "PM10 Dust",
+    "pm10_ss_conc": "PM10 Salt",
+    "nh3_conc": "NH3",
+    "co_conc": "CO",
+    "hcho_conc": "HCHO",
+    "chocho_conc": "OCHCHO",
+    "no2_conc": "NO2",
+    "nmvoc_conc": "VOCs",
+    "o3_conc": "O3",
+    "nox_conc": "NO + NO2",
+    "so2_conc": "SO2",
+    "apg_conc": "Alder pollen",
+    "bpg_conc": "Birch pollen",
+    "gpg_conc": "Grass pollen",
+    "mpg_conc": "Mugwort pollen",
+    "opg_conc": "Olive pollen",
+    "rwpg_conc": "Ragweed pollen",
+}
+
+
+def data_variable(ds:xr.Dataset) -> str:
+    """Name of the gridded (time, level, latitude, longitude) field in a CAMS file."""
+    for name, variable in ds.data_vars.items():
+        if set(variable.dims) == {"time", "level", "latitude", "longitude"}:
+            return name
+    raise ValueError(f"No gridded forecast variable in dataset. Variables: {list(ds.data_vars)}")
+
+
+def variable_name(ds:xr.Dataset, nc_variable:str) -> str:
+    """Query name of the variable, e.g. 'pm10_conc' -> 'PM10'."""
+    if nc_variable in VARIABLES:
+        return VARIABLES[nc_variable]
+    return ds[nc_variable].attrs.get("species", nc_variable)
+
+
+def unit_name(ds:xr.Dataset, nc_variable:str) -> str:
+    units:str = ds[nc_variable].attrs.get("units", "")
+    return units.replace("µ", "μ") # CAMS writes micro sign, database uses greek mu
+
+
+def forecast_date(ds:xr.Dataset) -> datetime:
+    """Base time of the forecast run. FORECAST attribute looks like 'Europe, 20250510+[0H_96H]'"""
+    date:str = ds.FORECAST.split()[1].split("+")[0] # '20250510'
+    return datetime.strptime(date, "%Y%m%d")
+
+
+def model_name(ds:xr.Dataset) -> str:
+    """Model of the run. source attribute looks like 'Data from ENSEMBLE model'"""
+    words = ds.attrs.get("source", "").split()
+    if len(words) >= 3 and words[0] == "Data" and words[1] == "from":
+        return words[2]
+    return "ENSEMBLE"
+
+
+def leadtime_hours(ds:xr.Dataset) -> np.ndarray:
+    """Leadtimes as float hours whether xarray decoded them to timedelta64 or not."""
+    times = ds.time.values
+    if np.issubdtype(times.dtype, np.timedelta64):
+        return times / np.timedelta64(1, "h")
+    return times.astype(np.float64)
+
+
+def describe(ds:xr.Dataset) -> dict:
+    """Run and grid of a CAMS file from its header, the fields of a catalog.Entry. Only coordinates are read."""
+    nc_variable = data_variable(ds)
+    leadtimes = leadtime_hours(ds)
+    lon, lat = ds.longitude.values, ds.latitude.values
+    return {
+        "variable": variable_name(ds, nc_variable),
+        "model": model_name(ds),
+        "date": f"{forecast_date(ds):%Y-%m-%d}",
+        "first_leadtime": float(leadtimes.min()),
+        "last_leadtime": float(leadtimes.max()),
+        "n_lat": len(lat),
+        "n_lon": len(lon),
+        "north": float(lat.max()),
+        "south": float(lat.min()),
+        "west": float(lon.min()),
+        "east": float(lon.max()),
+    }
+
+
+def unix_time(time:datetime) -> int:
+    """Naive datetimes are UTC, like CAMS base times."""
+    return int(time.replace(tzinfo=timezone.utc).timestamp())
+
+
+def cell_id(lon, lat):
+    """Integer id of the grid cell centred at (lon, lat). Works for scalars and arrays.
+
+    Coordinates are rounded to 0.01 degrees and longitudes wrapped to [-180, 180),
+    so the id does not depend on which file or which longitude convention it came from."""
+    lon = (np.asarray(lon, dtype=np.float64) + 180) % 360 - 180
+    lat = np.asarray(lat, dtype=np.float64)
+    lon_idx = np.rint(lon * 100).astype(np.int64) + 18000
+    lat_idx = np.rint(lat * 100).astype(np.int64) + 9000
+    return lat_idx * 36000 + lon_idx
@@ -0,0 +1,226 @@
+"""Catalog of the netCDF files under a directory, read from their headers once.
+
+    catalog = Catalog("data/netcdf", describe)
+    catalog.find("PM10", datetime(2025, 5, 10))   # Entry of the file, or None
+    catalog.by_name("ENS_FORECAST.nc")            # every file with that name
+
+describe(path) reads the header of one file and returns the Entry fields after
+path, size and mtime_ns (see cams.describe). Files it cannot read are still
+listed, with None fields. The index is kept next to the files in .catalog.json,
+so a new process only reads the headers of files added or changed since.
+
+refresh() walks the directory again. Files whose size and mtime did not change
+keep their entry, directories whose mtime did not change are not listed again
+unless they have subdirectories. Lookups refresh when they find a file that
+changed. A lookup that misses refreshes too, at most once every miss_interval
+seconds, so a query asking again and again for a run that is not there does not
+walk the tree every time. A file that lands is found within miss_interval.
+"""
+import os
+import json
+import time
+import threading
+from pathlib import Path
+from datetime import date, datetime
+from collections import namedtuple
+from typing import Callable, Optional
+
+
+INDEX = ".catalog.json"
+VERSION = 1
+MISS_INTERVAL = 5.0 # Seconds between the refreshes of lookups that miss
+
+Entry = namedtuple("Entry", [
+    "path", "size", "mtime_ns",
+    "variable", "model", "date", # Query name of the variable, model name and ISO base date of the run
+    "first_leadtime", "last_leadtime", # Hours
+    "n_lat", "n_lon", "north", "south", "west", "east", # Grid shape and cell centre bounds as in the file
+], defaults=[None] * 11)
+
+Describe = Callable[[str], dict]
+
+
+def _iso(day:date|datetime|str) -> str:
+    return day if isinstance(day, str) else f"{day:%Y-%m-%d}"
+
+
+class Catalog:
+    """Index of every *.nc file under root. Thread safe."""
+
+    def __init__(self, root:str|Path, describe:Describe, index_path:Optional[str|Path]=None, miss_interval:float=MISS_INTERVAL):
+        self.root = Path(root).absolute()
+        self.describe = describe
+        self.index_path = Path(index_path) if index_path else self.root / INDEX
+        self.miss_interval = miss_interval
+        self._lock = threading.RLock()
+        self._entries:dict[str, Entry] = {} # absolute path -> Entry
+        self._dirs:dict[str, int] = {} # absolute directory -> mtime_ns when its files were listed
+        self._runs:dict[tuple[str, str], list[Entry]] = {} # (variable, date) -> entries, best match first
+        self._names:dict[str, list[Entry]] = {} # file name -> entries
+        self._loaded = False
+        self._refreshed_at = float("-inf") # time.monotonic() of the last refresh
+        self.refreshes = 0
+        self.described = 0
+
+    def _load(self):
+        """Entries of the index file. A missing or unreadable index only means every header is read again."""
+        self._loaded = True
+        try:
+            index = json.loads(self.index_path.read_text())
+        except (OSError, ValueError):
+            return
+        if index.get("version") != VERSION: return
+        self._entries = {str(self.root / row[0]): Entry(str(self.root / row[0]), *row[1:]) for row in index["entries"]}
+        self._dirs = {str(self.root / directory): mtime_ns for directory, mtime_ns in index["dirs"].items()}
+        self._reindex()
+
+    def _save(self):
+        index = {
+            "version": VERSION,
+            "entries": [[os.path.relpath(entry.path, self.root), *entry[1:]] for entry in self._entries.values()],
+            "dirs": {os.path.relpath(directory, self.root): mtime_ns for directory, mtime_ns in self._dirs.items()},
+        }
+        tmp = self.index_path.with_name(f"{self.index_path.name}.{os.getpid()}.tmp")
+        try:
+            tmp.write_text(json.dumps(index))
+            os.replace(tmp, self.index_path)
+        except OSError:
+            pass # Read-only data directory. The catalog still works, it is rebuilt by the next process
+
+    def _reindex(self):
+        runs:dict[tuple[str, str], list[Entry]] = {}
+        names:dict[str, list[Entry]] = {}
+        for path in sorted(self._entries):
+            entry = self._entries[path]
+            names.setdefault(os.path.basename(path), []).append(entry)
+            if entry.variable is not None and entry.date is not None:
+                runs.setdefault((entry.variable, entry.date), []).append(entry)
+        for (variable, _), entries in runs.items():
+            # Directories named after the variable first, like <region>-forecast-<variable>-<date>-<last leadtime>
+            entries.sort(key=lambda entry: f"-{variable}-" not in entry.path)
+        self._runs, self._names = runs, names
+
+    def _entry(self, path:str, stat:os.stat_result) -> Entry:
+        try:
+            fields = self.describe(path)
+        except (OSError, ValueError, KeyError, AttributeError, IndexError):
+            fields = {} # Not a CAMS forecast, listed without a run
+        self.described += 1
+        return Entry(path, stat.st_size, stat.st_mtime_ns, **fields)
+
+    def _walk(self, directory:str, found:dict[str, os.stat_result], dirs:dict[str, int], listed:dict[str, list[str]]):
+        """Files under directory. Unchanged directories without subdirectories reuse the files listed last time."""
+        try:
+            mtime_ns = os.stat(directory).st_mtime_ns
+        except FileNotFoundError:
+            return
+        dirs[directory] = mtime_ns
+        if self._dirs.get(directory) == mtime_ns and directory in listed:
+            for path in listed[directory]:
+                try:
+                    found[path] = os.stat(path)
+                except FileNotFoundError:
+                    pass
+            return
+        with os.scandir(directory) as it:
+            for item in it:
+                if item.is_dir():
+                    self._walk(item.path, found, dirs, listed)
+                elif item.name.endswith(".nc") and item.is_file():
+                    found[item.path] = item.stat()
+
+    def refresh(self) -> int:
+        """Walks root and reads the headers of new and changed files. Returns the number of files that changed."""
+        with self._lock:
+            if not self._loaded: self._load()
+            found:dict[str, os.stat_result] = {}
+            dirs:dict[str, int] = {}
+            listed:dict[str, list[str]] = {} # Directories of files only -> their files
+            for path in self._entries:
+                listed.setdefault(os.path.dirname(path), []).append(path)
+            for directory in self._dirs:
+                listed.pop(os.path.dirname(directory), None) # Has subdirectories, listed again
+            if self.root.is_dir():
+                self._walk(str(self.root), found, dirs, listed)
+            entries = {}
+            changed = 0
+            for path, stat in found.items():
+                entry = self._entries.get(path)
+                if entry is None or entry.size != stat.st_size or entry.mtime_ns != stat.st_mtime_ns:
+                    entry = self._entry(path, stat)
+                    changed += 1
+                entries[path] = entry
+            changed += len(self._entries.keys() - entries.keys())
+            self.refreshes += 1
+            self._refreshed_at = time.monotonic()
+            if changed or dirs != self._dirs:
+                self._entries, self._dirs = entries, dirs
+                self._reindex()
+                self._save()
+            return changed
+
+    def _ensure(self):
+        with self._lock:
+            if not self._loaded:
+                self._load()
+                self.refresh() # Once per process, the index may be older than the files
+
+    def _refresh_on_miss(self):
+        """Refreshes unless the last refresh is less than miss_interval seconds old. Call with the lock held."""
+        if time.monotonic() - self._refreshed_at >= self.miss_interval:
+            self.refresh()
+
+    @staticmethod
+    def _fresh(entry:Entry) -> bool:
+        try:
+            stat = os.stat(entry.path)
+        except FileNotFoundError:
+            return False
+        return stat.st_size == entry.size and stat.st_mtime_ns == entry.mtime_ns
+
+    def _match(self, variable:str, day:str, model:Optional[str]) -> Optional[Entry]:
+        for entry in self._runs.get((variable, day), ()):
+            if model is None or entry.model == model:
+                return entry
+        return None
+
+    def find(self, variable:str, day:date|datetime|str, model:Optional[str]=None) -> Optional[Entry]:
+        """File of the run of variable from day, any model when model is None. A dictionary lookup,
+        the directory is walked again when the file changed since it was read or, throttled, when it is not known."""
+        self._ensure()
+        day = _iso(day)
+        with self._lock:
+            entry = self._match(variable, day, model)
+        if entry is not None and self._fresh(entry):
+            return entry
+        with self._lock:
+            if entry is None: self._refresh_on_miss()
+            else: self.refresh()
+            return self._match(variable, day, model)
+
+    def by_name(self, name:str) -> list[Entry]:
+        """Every file called name, e.g. ENS_FORECAST.nc."""
+        self._ensure()
+        with self._lock:
+            entries = self._names.get(name, [])
+        if entries and all(self._fresh(entry) for entry in entries):
+            return list(entries)
+        with self._lock:
+            if not entries: self._refresh_on_miss()
+            else: self.refresh()
+            return list(self._names.get(name, []))
+
+    def entries(self) -> list[Entry]:
+        """Every file under root, ordered by path. Walks the directory, files come and go between calls."""
+        with self._lock:
+            if not self._loaded: self._load()
+            self.refresh()
+            return [self._entries[path] for path in sorted(self._entries)]
+
+    def __contains__(self, path:str|Path) -> bool:
+        self._ensure()
+        path = str(Path(path).absolute())
+        with self._lock:
+            if path in self._entries: return True
+            self._refresh_on_miss()
+            return path in self._entries
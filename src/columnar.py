@@ -0,0 +1,63 @@
+"""Columnar store of forecast fields: one .npy array per variable, run and leadtime.
+
+    data/columnar/<variable>/<model>/<YYYYmmddHH>/coords.npz      longitude and latitude of the grid
+    data/columnar/<variable>/<model>/<YYYYmmddHH>/leadtime_000.npy (lat, lon) float32 values
+
+A map frame is one sequential read of one file. Arrays are loaded memory mapped,
+so cropping to a region only touches the rows inside it.
+"""
+import os
+from pathlib import Path
+from datetime import datetime
+
+import numpy as np
+
+
+ROOT = Path("data") / "columnar"
+COORDS = "coords.npz"
+
+
+def run_dir(variable_name:str, model:str, base_time:datetime, root:Path=ROOT) -> Path:
+    return Path(root) / variable_name / model / base_time.strftime("%Y%m%d%H")
+
+
+def leadtime_path(directory:Path, leadtime_hours:int) -> Path:
+    return Path(directory) / f"leadtime_{int(leadtime_hours):03d}.npy"
+
+
+def _replace(path:Path, save):
+    """Writes next to the target and renames, so readers never see a half written file."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp, "wb") as file:
+        save(file)
+    os.replace(tmp, path)
+
+
+def write_coords(directory:Path, longitudes:np.ndarray, latitudes:np.ndarray):
+    """Longitudes in [-180, 180) and latitudes in the order of the value rows and columns."""
+    _replace(Path(directory) / COORDS, lambda file: np.savez(
+        file, longitude=np.asarray(longitudes, dtype=np.float64), latitude=np.asarray(latitudes, dtype=np.float64)
+    ))
+
+
+def write_leadtime(directory:Path, leadtime_hours:int, values:np.ndarray):
+    _replace(leadtime_path(directory, leadtime_hours), lambda file: np.save(file, np.ascontiguousarray(values, dtype=np.float32)))
+
+
+def read_coords(directory:Path) -> tuple[np.ndarray, np.ndarray]:
+    """(longitudes, latitudes) of the run."""
+    with np.load(Path(directory) / COORDS) as coords:
+        return coords["longitude"], coords["latitude"]
+
+
+def read_leadtime(directory:Path, leadtime_hours:int) -> np.ndarray:
+    """(lat, lon) values of one leadtime, memory mapped."""
+    path = leadtime_path(directory, leadtime_hours)
+    if not path.exists():
+        raise FileNotFoundError(f"No columnar data for leadtime {leadtime_hours} in {directory}")
+    return np.load(path, mmap_mode="r")
+
+
+def leadtimes(directory:Path) -> list[int]:
+    return sorted(int(path.stem.split("_")[1]) for path in Path(directory).glob("leadtime_*.npy"))
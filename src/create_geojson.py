@@ -1,6 +1,5 @@
 import os
 import json
-import time
 import glob
 from pathlib import Path
 from pprint import pprint
@@ -11,7 +10,9 @@ from typing import TypeAlias, Literal
 import numpy as np
 import pandas as pd
 import xarray as xr
-import plotly.express as px
+
+import cams
+import metrics
 
 
 
@@ -23,8 +24,9 @@ def _get_data_set(path:str) -> xr.Dataset:
 
 
 def get_squares(ds:xr.Dataset) -> list[list]:
-    """Creates new coordinates to make squares around original points."""
-    longitudes = ds.variables["longitude"].data.tolist()
+    """Creates new coordinates to make squares around original points.
+    Longitudes are wrapped to [-180, 180) like the query results, whatever convention the file uses."""
+    longitudes = np.round((ds.variables["longitude"].data.astype(np.float64) + 180) % 360 - 180, 2).tolist()
     latitudes = ds.variables["latitude"].data.tolist()
     coordinates = np.array(np.meshgrid(longitudes, latitudes)).T.reshape(-1, 2)
 
@@ -44,25 +46,27 @@ def get_squares(ds:xr.Dataset) -> list[list]:
 
 GeoJSON: TypeAlias = dict[Literal["id", "type", "geometry"]]
 Measurements: TypeAlias = list[list]
-def _get_geodata(ds:xr.Dataset) -> GeoJSON:
+def _get_geodata(ds:xr.Dataset, cell_ids:bool=False) -> GeoJSON:
+    """cell_ids writes integer cams.cell_id ids instead of '[lon, lat]' strings, see geodata.get_dataframe(cell_ids=True)."""
     print("Creating new geojson...")
     shapes = get_squares(ds)
+    if cell_ids:
+        centroids = np.array([centroid for centroid, _ in shapes])
+        ids = cams.cell_id(centroids[:, 0], centroids[:, 1]).tolist()
 
     geojson:GeoJSON = { # sijainnit id:llä
         "type": "FeatureCollection",
         "features": [],
         "limits": None
     }
-    start_time = time.perf_counter()
-    idx = 0
-    for centroid, boundary in shapes:
-        idx += 1
-        print(f"{idx:03d}/{len(shapes)} {time.perf_counter()-start_time}sec", end="\r")
+    progress = metrics.Progress("geojson", total=len(shapes))
+    for idx, (centroid, boundary) in enumerate(shapes):
+        progress.add(rows=1)
         centroid = [round(centroid[0], 2), round(centroid[1], 2)]
         # Add to geojson
         geojson["features"].append(
             {
-                "id": str(centroid), # NOTE 
+                "id": ids[idx] if cell_ids else str(centroid), # NOTE 
                 "type": "Feature",
                 "geometry": {
                     "type": "Polygon",
@@ -71,18 +75,18 @@ def _get_geodata(ds:xr.Dataset) -> GeoJSON:
                 }
             }
         )
-    print(f"{idx:03d}/{len(shapes)} {time.perf_counter()-start_time}sec")
+    progress.close()
 
     return geojson
 
 
 
-def from_forecast(origin:str, target:str):
+def from_forecast(origin:str, target:str, cell_ids:bool=False):
     print("Reading dataset...")
     dataset:xr.Dataset = _get_data_set(origin)
 
     print("Getting geojson...")
-    geojson = _get_geodata(dataset)
+    geojson = _get_geodata(dataset, cell_ids)
 
     print("Writing geojson...")
     with open(target, "w") as file:
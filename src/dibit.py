@@ -3,6 +3,7 @@ from pathlib import Path
 from pprint import pprint
 from argparse import ArgumentParser
 
+import metrics
 import nc_to_db
 import find_nc_files
 
@@ -13,15 +14,33 @@ def main():
                     prog='Map It',
                     description='Creates geojsons from netCDF'
     )
-    parser.add_argument("filepath", help="Filename or path. Can be partial path. File is expected to be in data-folder.")
+    parser.add_argument("filepath", nargs="*", help="Filename or path. Can be partial path. File is expected to be in data-folder.")
+    parser.add_argument("--all", action="store_true", help="Store every file in data/netcdf -folder.")
+    parser.add_argument("--workers", type=int, default=None, help="Processes reading files. Defaults to CPU count.")
+    parser.add_argument("--chunk-mb", type=int, default=nc_to_db.MAX_CHUNK_BYTES // 2**20, help="Memory ceiling of one chunk in MiB.")
+    parser.add_argument("--restart", action="store_true", help="Ignore checkpoints of earlier ingests and write everything again.")
+    parser.add_argument("--columnar", action="store_true", help="Write to the columnar store in data/columnar instead of the database.")
+    metrics.add_arguments(parser)
     args = parser.parse_args()
-    filename:str = args.filepath
+    metrics.configure_from(args)
 
     target = "AirQuality.db"
-    origin = find_nc_files.find_nc_file(filename)
-    
-    nc_to_db.store_to_database(origin, target)
-
+    max_chunk_bytes = args.chunk_mb * 2**20
+    if not args.all and not args.filepath:
+        parser.error("Give filepath or --all")
+    if args.columnar:
+        paths = find_nc_files.nc_files() if args.all else [find_nc_files.find_nc_file(filename) for filename in args.filepath]
+        nc_to_db.store_columnar_files(paths, args.workers)
+        return
+    if args.all:
+        nc_to_db.store_directory(target, args.workers, max_chunk_bytes, args.restart)
+        return
+
+    origins = [find_nc_files.find_nc_file(filename) for filename in args.filepath]
+    if len(origins) == 1:
+        nc_to_db.store_to_database(origins[0], target, max_chunk_bytes, args.restart)
+    else:
+        nc_to_db.store_files(origins, target, args.workers, max_chunk_bytes, args.restart)
 
 
 if __name__ == "__main__":
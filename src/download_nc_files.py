@@ -7,6 +7,8 @@ import hashlib
 import pathlib
 from zipfile import ZipFile 
 
+import metrics
+import generation
 import country_codes
 
 
@@ -22,10 +24,14 @@ def main(dataset:str, request:dict, cdsapirc_file=None):
     if not os.path.exists(path): os.mkdir(path)
 
     path = path / data_file
+    progress = metrics.Progress("download", total=2)
     if not os.path.exists(path): get_data(dataset, request, path, cdsapirc_file)
+    progress.chunk(bytes_read=path.stat().st_size)
 
-    unzip(path)
+    progress.chunk(bytes_read=unzip(path))
     os.remove(path)
+    progress.close()
+    generation.touch() # query_forecast_nc reads the new file directly
     print(f"Tiedosto {data_file} on ladattu.")
     
 
@@ -101,9 +107,11 @@ def get_data(dataset, request, data_file, cdsapirc_file):
         data_file)
     
 
-def unzip(path:pathlib.Path):
+def unzip(path:pathlib.Path) -> int:
+    """Extracts next to the zip. Returns bytes extracted."""
     with ZipFile(path) as zObject:
         zObject.extractall(path=path.with_suffix("")) 
+        return sum(info.file_size for info in zObject.infolist())
 
 
 if __name__ == "__main__":
@@ -1,55 +1,89 @@
-import glob
 from pathlib import Path
 
+import xarray as xr
 
+import cams
+import catalog
 
-def find_nc_file(filename:str) -> Path:
-    """Takes filename, partial or full path and find correct file from data-folder."""
+
+NETCDF_DIR = Path("data") / "netcdf"
+_catalogs:dict[Path, catalog.Catalog] = {}
+
+
+def _describe(path:str) -> dict:
+    with xr.open_dataset(path, engine="netcdf4", decode_timedelta=False) as ds:
+        return cams.describe(ds)
+
+
+def nc_catalog() -> catalog.Catalog:
+    """Catalog of data/netcdf, kept in data/netcdf/.catalog.json between runs."""
+    root = NETCDF_DIR.absolute()
+    if root not in _catalogs:
+        _catalogs[root] = catalog.Catalog(root, _describe)
+    return _catalogs[root]
+
+
+def nc_files() -> list[Path]:
+    """Every netCDF file in data-folder: data/netcdf/<dataset>/<request>/<model>.nc"""
+    root = NETCDF_DIR.absolute()
+    paths = (Path(entry.path) for entry in nc_catalog().entries())
+    return [path for path in paths if len(path.relative_to(root).parts) == 3]
+
+
+def find_nc_file(filename:str, interactive:bool=True) -> Path:
+    """Takes filename, partial or full path and find correct file from data-folder.
+    When not interactive, raises instead of asking another filename from the user."""
     print(f"\nSearching {filename=}")
 
     #dir_path = os.path.dirname(os.path.realpath(__file__))
-    netcdf_files = [Path(file).absolute() for file in glob.glob(f"data/netcdf/*/*/*.nc")]
+    files = nc_catalog()
     filepath = Path(filename).with_suffix(".nc")
 
     if filepath.is_absolute():
         # 1) Absolute and found
-        if filepath in netcdf_files: return filepath
+        if filepath in files: return filepath
         # 2) Absolute and not found
         else:
             print("Filepath not found in data/netcdf -folder")
+            if not interactive: raise FileNotFoundError(f"{filepath} not found in data/netcdf -folder")
             filename = input("Please give another filename: ")
             return find_nc_file(filename)
     
+    # Every match has the same file name, the catalog knows the files of each name
+    named = [Path(entry.path) for entry in files.by_name(filepath.name)]
     if filepath.parent == Path("."):
-        matches = [file for file in netcdf_files if file.name == filepath.name]
+        matches = named
         if len(matches) > 1:
             # 3) Can't specify which file
             print(f"Found multiple files with the same name:")
             for match in matches:
                 print(match)
+            if not interactive: raise ValueError(f"Found multiple files with the same name: {filepath.name}")
             filename = input("Please give another filename: ")
             return find_nc_file(filename)
         elif matches: 
             # 4) Found match for ambiguous name
             print("Found only one file matching name:")
             print(f"{matches[0]}")
+            if not interactive: return matches[0]
             confirmation = input("Is this correct file? (y/n): ").lower()
             if confirmation == "y" or confirmation == "yes":
                 return matches[0]
             else:
                 # 5) User rejected the match
                 print("Try one of these:")
-                for file in netcdf_files[:20]:
+                for file in nc_files()[:20]:
                     print(file)
                 filename = input("Please give another filename: ")
                 return find_nc_file(filename)
     
-    matches = [file for file in netcdf_files if str(file).endswith(str(filepath))]
+    matches = [file for file in named if str(file).endswith(str(filepath))]
     if len(matches) > 1:
         # 6) Found multiple files
         print(f"Found multiple files with the same name:")
         for match in matches:
             print(match)
+        if not interactive: raise ValueError(f"Found multiple files matching {filepath}")
         filename = input("Please give more specific name: ")
         return find_nc_file(filename)
     if matches:
@@ -58,8 +92,9 @@ def find_nc_file(filename:str) -> Path:
     
     print("No matches found.")
     print("Try one of these:")
-    for file in netcdf_files[:20]:
+    for file in nc_files()[:20]:
         print(file)
+    if not interactive: raise FileNotFoundError(f"No matches found for {filepath}")
     filename = input("Please give more specific name: ")
     return find_nc_file(filename)
 
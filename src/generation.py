@@ -0,0 +1,27 @@
+"""Data generation stamp. Writers touch it after new data lands, caches drop results older than it.
+
+The stamp is a file so the ingest processes and the Dash process agree on it
+without talking to each other.
+"""
+import os
+import time
+from pathlib import Path
+
+
+STAMP = Path("data") / ".generation"
+
+
+def touch():
+    """Marks everything cached so far as stale."""
+    STAMP.parent.mkdir(parents=True, exist_ok=True)
+    tmp = STAMP.with_name(f"{STAMP.name}.{os.getpid()}.tmp")
+    tmp.write_text(str(time.time_ns()))
+    os.replace(tmp, STAMP)
+
+
+def current() -> int:
+    """Generation of the data, 0 before the first touch. One stat call."""
+    try:
+        return STAMP.stat().st_mtime_ns
+    except FileNotFoundError:
+        return 0
@@ -1,21 +1,78 @@
 import os
+import sys
 import json
 import glob
-import copy
-import sqlite3
+import time
+import asyncio
+import hashlib
+import functools
+import threading
 import pandas as pd
+from pathlib import Path
 from dataclasses import dataclass
-from datetime import datetime, timedelta
-from typing import TypeAlias, Literal, Optional
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import TypeAlias, Literal, Optional, Iterator
 
 import numpy as np
 import xarray as xr
+import scipy.sparse
+
+from src import cams
+from src import catalog
+from src import columnar
+from src import country_codes
+from src import generation
+from src import hyperslab
+from src import sqlite_pool
 
 
 GeoJSON: TypeAlias = dict[Literal["type", "center", "features", "limits"]]
 GeoJSONlimits: TypeAlias = dict[Literal["north", "south", "west", "east"]]
 
-@dataclass
+
+@dataclass(frozen=True)
+class Limits:
+    """Hashable bounding box. Reads like the GeoJSONlimits dict it replaces: limits["north"]."""
+    north: float
+    south: float
+    west: float
+    east: float
+
+    def __getitem__(self, key:Literal["north", "south", "west", "east"]) -> float:
+        if key not in ("north", "south", "west", "east"):
+            raise KeyError(key)
+        return getattr(self, key)
+
+    @classmethod
+    def of(cls, limits:Optional["GeoJSONlimits|Limits"]) -> Optional["Limits"]:
+        if limits is None or isinstance(limits, Limits):
+            return limits
+        return cls(*(float(limits[key]) for key in ("north", "south", "west", "east")))
+
+
+def _freeze(query, **converters):
+    """Replaces mutable fields of a frozen query in __post_init__, so equal queries hash equal."""
+    for name, convert in converters.items():
+        object.__setattr__(query, name, convert(getattr(query, name)))
+
+
+def _tuple_or_int(leadtime:int|list[int]) -> int|tuple[int, ...]:
+    return tuple(int(hour) for hour in leadtime) if isinstance(leadtime, (list, tuple, np.ndarray)) else int(leadtime)
+
+
+def _variable_tuple(variables:str|list[str]) -> tuple[str, ...]:
+    variables = (variables,) if isinstance(variables, str) else tuple(variables)
+    if not variables or len(set(variables)) != len(variables):
+        raise ValueError(f"Variables must be distinct and at least one: {variables}")
+    return variables
+
+
+# Queries are immutable and hashable so they can key the result cache.
+# Limits may be given as a dict and leadtimes as a list, they are stored as Limits and tuples
+
+@dataclass(frozen=True)
 class ForecastQuery:
     variable: Literal['PM2.5'
                     'PM2.5 Nitrate'
@@ -43,11 +100,14 @@ class ForecastQuery:
                     'Olive pollen'
                     'Ragweed pollen']
     time: datetime
-    leadtime: int|list[int] # 0 zero means at 00:00 o'clock tec.
+    leadtime: int|tuple[int, ...] # 0 zero means at 00:00 o'clock tec.
     model: Optional[str]
-    limits: Optional[GeoJSONlimits]
+    limits: Optional[Limits]
 
-@dataclass
+    def __post_init__(self):
+        _freeze(self, leadtime=_tuple_or_int, limits=Limits.of)
+
+@dataclass(frozen=True)
 class ForecastMultiQuery:
     variable: Literal['PM2.5'
                     'PM2.5 Nitrate'
@@ -75,11 +135,26 @@ class ForecastMultiQuery:
                     'Olive pollen'
                     'Ragweed pollen']
     time: datetime
-    leadtimes: list[int] # 0 zero means at 00:00 o'clock tec.
+    leadtimes: tuple[int, ...] # 0 zero means at 00:00 o'clock tec.
     model: Optional[str]
-    limits: Optional[GeoJSONlimits]
+    limits: Optional[Limits]
+
+    def __post_init__(self):
+        _freeze(self, leadtimes=_tuple_or_int, limits=Limits.of)
 
-@dataclass
+@dataclass(frozen=True)
+class ForecastVariablesQuery:
+    """Several variables of one run on one grid, e.g. ("PM10", "PM2.5", "NO2", "O3") for an air quality index."""
+    variables: tuple[str, ...] # Names of ForecastQuery.variable
+    time: datetime
+    leadtimes: tuple[int, ...]
+    model: Optional[str]
+    limits: Optional[Limits]
+
+    def __post_init__(self):
+        _freeze(self, variables=_variable_tuple, leadtimes=_tuple_or_int, limits=Limits.of)
+
+@dataclass(frozen=True)
 class AnalysisQuery:
     variable: Literal['PM2.5'
                     'PM2.5 Nitrate'
@@ -107,109 +182,1034 @@ class AnalysisQuery:
                     'Olive pollen'
                     'Ragweed pollen']
     start_time: datetime
-    end_time: datetime
-
-
-
-def query_forecast_db(query:ForecastQuery):
-    leadtime = query.time + timedelta(hours=query.leadtimes)
-    with sqlite3.connect("AirQuality.db") as conn:
-        cursor = conn.cursor()
-        parameters = {
-            "variable": query.variable,
-            "datetime": query.time.strftime("%Y/%m/%d %H:%M"), 
-            "leadtime": leadtime.strftime("%Y/%m/%d %H:%M"), 
-            "model": query.model
-        }
-        if not query.model:
-            parameters.pop("model")
-            sql = f"""
-                SELECT variable_name, value, lon, lat, leadtime 
-                FROM forecasts 
-                WHERE variable_name=:variable AND datetime=:datetime AND leadtime<=:leadtime
-            """
+    end_time: datetime # Exclusive
+    resolution: Literal["hourly", "daily", "monthly"] = "daily"
+    percentiles: tuple[float, ...] = () # e.g. (50, 95)
+    limits: Optional[Limits] = None
+    per_cell: bool = False # Aggregate every cell separately instead of the whole area
+
+    def __post_init__(self):
+        _freeze(self, percentiles=lambda percentiles: tuple(float(q) for q in percentiles), limits=Limits.of)
+
+
+
+FORECAST_SQL = """
+    SELECT runs.variable_name, forecast_values.value, grid_cells.lon, grid_cells.lat, forecast_values.leadtime_hours 
+    FROM runs 
+    JOIN forecast_values ON forecast_values.run_id=runs.id 
+    JOIN grid_cells ON grid_cells.id=forecast_values.cell_id 
+    WHERE runs.variable_name IN (SELECT value FROM json_each(:variables)) AND runs.base_time=:base_time 
+    AND forecast_values.leadtime_hours IN (SELECT value FROM json_each(:leadtimes))"""
+
+# CROSS JOINs fix the join order: cells come from grid_cells_lat_lon and every value is a primary key lookup
+REGION_FORECAST_SQL = """
+    WITH hours(leadtime_hours) AS (SELECT value FROM json_each(:leadtimes))
+    SELECT runs.variable_name, forecast_values.value, grid_cells.lon, grid_cells.lat, forecast_values.leadtime_hours 
+    FROM runs 
+    CROSS JOIN hours 
+    CROSS JOIN grid_cells 
+    CROSS JOIN forecast_values 
+    WHERE runs.variable_name IN (SELECT value FROM json_each(:variables)) AND runs.base_time=:base_time 
+    AND grid_cells.lon>:west AND grid_cells.lon<:east AND grid_cells.lat<:north AND grid_cells.lat>:south 
+    AND forecast_values.run_id=runs.id AND forecast_values.leadtime_hours=hours.leadtime_hours AND forecast_values.cell_id=grid_cells.id"""
+
+# Runs of several models never mix in one grid. A query without a model reads one run per variable,
+# the one _result_model names: ENSEMBLE when the database has it, otherwise the first model by name
+RUN_ORDER = "model!='ENSEMBLE', model"
+ONE_RUN_SQL = f""" 
+    AND runs.id=(SELECT chosen.id FROM runs AS chosen 
+        WHERE chosen.variable_name=runs.variable_name AND chosen.base_time=runs.base_time ORDER BY {RUN_ORDER} LIMIT 1)"""
+
+
+def _leadtimes(query:ForecastQuery|ForecastMultiQuery|ForecastVariablesQuery) -> list[int]:
+    """Leadtimes of the query as a list. ForecastQuery.leadtime may be a single hour."""
+    leadtimes = query.leadtime if isinstance(query, ForecastQuery) else query.leadtimes
+    return [int(hour) for hour in leadtimes] if isinstance(leadtimes, (list, tuple)) else [int(leadtimes)]
+
+
+def _variables(query:ForecastQuery|ForecastMultiQuery|ForecastVariablesQuery) -> list[str]:
+    return list(query.variables) if isinstance(query, ForecastVariablesQuery) else [query.variable]
+
+
+def forecast_sql(query:ForecastQuery|ForecastVariablesQuery) -> tuple[str, dict]:
+    """SQL and parameters query_forecast_db runs for the query."""
+    sql = FORECAST_SQL
+    parameters = {
+        "variables": json.dumps(_variables(query)),
+        "base_time": cams.unix_time(query.time), 
+        "leadtimes": json.dumps(_leadtimes(query))
+    }
+    if query.limits:
+        sql = REGION_FORECAST_SQL
+        parameters.update({key: query.limits[key] for key in ("north", "south", "west", "east")})
+    if query.model:
+        sql += " AND runs.model=:model"
+        parameters["model"] = query.model
+    else:
+        sql += ONE_RUN_SQL
+    return sql, parameters
+
+
+def feature_ids(lon:np.ndarray, lat:np.ndarray) -> np.ndarray:
+    """Plotly ids '[lon, lat]' matching str([lon, lat]) of the GeoJSON features.
+    Every distinct longitude and latitude is formatted once and the strings are broadcast to the rows."""
+    lon_unique, lon_inverse = np.unique(lon, return_inverse=True)
+    lat_unique, lat_inverse = np.unique(lat, return_inverse=True)
+    lon_text = np.array([f"[{lon}, " for lon in lon_unique.tolist()], dtype=object)
+    lat_text = np.array([f"{lat}]" for lat in lat_unique.tolist()], dtype=object)
+    return lon_text[lon_inverse.ravel()] + lat_text[lat_inverse.ravel()]
+
+
+DB_POOL = sqlite_pool.ConnectionPool("AirQuality.db")
+
+
+def set_database(path:str|Path, **pool_options):
+    """Points query_forecast_db to another database file. pool_options go to sqlite_pool.ConnectionPool."""
+    global DB_POOL
+    DB_POOL = sqlite_pool.ConnectionPool(path, **pool_options)
+    RESULTS.clear()
+
+
+def pool_stats() -> dict:
+    return DB_POOL.stats()
+
+
+def query_forecast_db(query:ForecastQuery, cell_ids:bool=False):
+    """Rows of the database in the frame of the gridded backends: the same columns and dtypes,
+    ordered by leadtime, then latitude row and longitude. Cells without a value are left out."""
+    return _db_result(query, query.model).to_dataframe(cell_ids) # The frame has no model column, skip looking it up
+
+
+MAX_OPEN_DATASETS = 8
+FORECASTS_DIR = Path("data") / "netcdf" / "cams-europe-air-quality-forecasts"
+
+
+class DatasetCache:
+    """Process wide LRU of open netCDF datasets keyed by path. Thread safe.
+
+    A dataset is opened again when the mtime of its file changes. At most max_open
+    handles stay open, the least recently used is closed first. A closed xarray
+    dataset reopens its file if a thread still reads from it, so eviction is safe."""
+
+    def __init__(self, max_open:int=MAX_OPEN_DATASETS):
+        self.max_open = max_open
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._datasets:OrderedDict[str, tuple[int, xr.Dataset]] = OrderedDict()
+
+    def get(self, path:str|Path) -> xr.Dataset:
+        path = str(Path(path).absolute())
+        mtime_ns = os.stat(path).st_mtime_ns
+        with self._lock:
+            cached = self._datasets.get(path)
+            if cached and cached[0] == mtime_ns:
+                self._datasets.move_to_end(path)
+                self.hits += 1
+                return cached[1]
+            if cached:
+                self._datasets.pop(path)[1].close()
+            self.misses += 1
+            ds = xr.open_dataset(path, engine="netcdf4", decode_timedelta=False, cache=False) # Nothing read stays in the handle
+            self._datasets[path] = (mtime_ns, ds)
+            while len(self._datasets) > self.max_open:
+                _, (_, evicted) = self._datasets.popitem(last=False)
+                evicted.close()
+            return ds
+
+    def clear(self):
+        with self._lock:
+            for _, ds in self._datasets.values():
+                ds.close()
+            self._datasets.clear()
+
+    def __len__(self):
+        return len(self._datasets)
+
+
+DATASETS = DatasetCache()
+
+_catalogs:dict[Path, catalog.Catalog] = {} # FORECASTS_DIR -> its catalog
+_catalogs_lock = threading.Lock()
+
+
+def forecast_catalog() -> catalog.Catalog:
+    """Catalog of the files under FORECASTS_DIR. Headers are read through DATASETS, so the first query of a file finds it open."""
+    root = FORECASTS_DIR.absolute()
+    with _catalogs_lock:
+        if root not in _catalogs:
+            _catalogs[root] = catalog.Catalog(root, lambda path: cams.describe(DATASETS.get(path)))
+        return _catalogs[root]
+
+
+def forecast_entry(variable:str, time:datetime, model:Optional[str]=None) -> catalog.Entry:
+    """Catalog entry of the forecast run: its file, leadtimes and grid. Raises FileNotFoundError if there is none."""
+    entry = forecast_catalog().find(variable, time, model)
+    if entry is None:
+        raise FileNotFoundError(f"No netCDF forecast of {variable} {model or ''} from {time:%Y-%m-%d} in {FORECASTS_DIR}")
+    return entry
+
+
+def forecast_path(variable:str, time:datetime, model:Optional[str]=None) -> Path:
+    """netCDF file of the forecast run. Downloads are unzipped to
+    data/netcdf/cams-europe-air-quality-forecasts/<region>-forecast-<variable>-<date>-<last leadtime>/<model>.nc
+    but the variable in the directory name is not always the query name, so the file header decides (see catalog)."""
+    return Path(forecast_entry(variable, time, model).path)
+
+
+ForecastSlab = namedtuple("ForecastSlab", ["values", "leadtimes", "longitudes", "latitudes"]) # values are (leadtime, lat, lon)
+
+
+def _leadtime_indices(ds:xr.Dataset, leadtimes:np.ndarray, path:Path) -> np.ndarray:
+    """Time indices of the leadtime hours in the dataset. ValueError if some are missing."""
+    hours = cams.leadtime_hours(ds)
+    indices = np.searchsorted(hours, leadtimes)
+    if np.any(indices >= len(hours)) or np.any(hours[np.minimum(indices, len(hours) - 1)] != leadtimes):
+        raise ValueError(f"Leadtimes {leadtimes.tolist()} not all in {path}")
+    return indices
+
+
+def read_slab_nc(query:ForecastQuery|ForecastMultiQuery) -> ForecastSlab:
+    """Every leadtime of the query inside its limits in one indexed read of the netCDF file."""
+    path = forecast_path(query.variable, query.time, query.model)
+    ds = DATASETS.get(path)
+    window = grid_window(ds["longitude"].values, ds["latitude"].values, query.limits)
+    leadtimes = np.unique(_leadtimes(query)) # Ascending, frames are ordered by leadtime
+    indices = _leadtime_indices(ds, leadtimes, path)
+    values = hyperslab.read(ds[cams.data_variable(ds)], (indices, 0, window.lat, window.lon)) # Reads only the window
+    return ForecastSlab(values, leadtimes, window.longitudes, window.latitudes)
+
+
+def read_slab_columnar(query:ForecastQuery|ForecastMultiQuery) -> ForecastSlab:
+    """Every leadtime of the query inside its limits from the columnar store, one sequential read per leadtime."""
+    directory = columnar.run_dir(query.variable, query.model or "ENSEMBLE", query.time)
+    window = grid_window(*columnar.read_coords(directory), query.limits)
+    leadtimes = np.unique(_leadtimes(query)) # Ascending, frames are ordered by leadtime
+    values = np.stack([columnar.read_leadtime(directory, hour)[window.lat, window.lon] for hour in leadtimes.tolist()]) # lat lon, memory mapped
+    return ForecastSlab(values, leadtimes, window.longitudes, window.latitudes)
+
+
+def _same_grid(grid:tuple[np.ndarray, np.ndarray], other:tuple[np.ndarray, np.ndarray], source:str, other_source:str):
+    if not all(np.array_equal(axis, other_axis) for axis, other_axis in zip(grid, other)):
+        raise ValueError(f"{other_source} is not on the grid of {source}, the variables can not share one window")
+
+
+def read_variables_nc(query:ForecastVariablesQuery) -> ForecastSlab:
+    """Every variable of the query from its own netCDF file through one crop window. The files of a run
+    share the grid, it is checked once per file and the window is found once. values are (variable, leadtime, lat, lon)."""
+    paths = [forecast_path(variable, query.time, query.model) for variable in query.variables]
+    datasets = [DATASETS.get(path) for path in paths]
+    grid = (datasets[0]["longitude"].values, datasets[0]["latitude"].values)
+    for path, ds in zip(paths[1:], datasets[1:]):
+        _same_grid(grid, (ds["longitude"].values, ds["latitude"].values), paths[0], path)
+    window = grid_window(*grid, query.limits)
+    leadtimes = np.unique(_leadtimes(query))
+    values = np.empty((len(paths), len(leadtimes), len(window.latitudes), len(window.longitudes)), dtype=np.float32)
+    for layer, (path, ds) in enumerate(zip(paths, datasets)):
+        hyperslab.read(ds[cams.data_variable(ds)], (_leadtime_indices(ds, leadtimes, path), 0, window.lat, window.lon), out=values[layer])
+    return ForecastSlab(values, leadtimes, window.longitudes, window.latitudes)
+
+
+def read_variables_columnar(query:ForecastVariablesQuery) -> ForecastSlab:
+    """read_variables_nc from the columnar store."""
+    directories = [columnar.run_dir(variable, query.model or "ENSEMBLE", query.time) for variable in query.variables]
+    grid = columnar.read_coords(directories[0])
+    for directory in directories[1:]:
+        _same_grid(grid, columnar.read_coords(directory), directories[0], directory)
+    window = grid_window(*grid, query.limits)
+    leadtimes = np.unique(_leadtimes(query))
+    values = np.empty((len(directories), len(leadtimes), len(window.latitudes), len(window.longitudes)), dtype=np.float32)
+    for layer, directory in enumerate(directories):
+        for idx, hour in enumerate(leadtimes.tolist()):
+            values[layer, idx] = columnar.read_leadtime(directory, hour)[window.lat, window.lon]
+    return ForecastSlab(values, leadtimes, window.longitudes, window.latitudes)
+
+
+def query_forecast_nc(query:ForecastQuery, cell_ids:bool=False):
+    return _slab_result(query, read_slab_nc(query), query.model).to_dataframe(cell_ids) # The frame has no model column, skip looking it up
+
+
+def query_forecast_columnar(query:ForecastQuery, cell_ids:bool=False):
+    return _slab_result(query, read_slab_columnar(query), query.model).to_dataframe(cell_ids)
+
+
+GridWindow = namedtuple("GridWindow", ["lat", "lon", "longitudes", "latitudes"])
+
+
+def _between(axis:np.ndarray, low:float, high:float) -> slice:
+    """Indices of an ascending axis strictly between low and high."""
+    return slice(int(np.searchsorted(axis, low, side="right")), int(np.searchsorted(axis, high, side="left")))
+
+
+def grid_window(longitudes:np.ndarray, latitudes:np.ndarray, limits:Optional[GeoJSONlimits]) -> GridWindow:
+    """Index window of the grid cells strictly inside limits, found by binary search.
+
+    Latitudes are descending as in CAMS files. Longitudes may be 0-360 or -180-180,
+    limits and the returned longitudes are -180-180. lat is a slice and lon a slice too,
+    unless the window continues across the seam of a 0-360 axis, then it is an index array.
+    Index values with values[window.lat, window.lon]; slices keep it a view.
+    No limits gives the whole grid."""
+    longitudes = (np.asarray(longitudes, dtype=np.float64) + 180) % 360 - 180
+    latitudes = np.asarray(latitudes, dtype=np.float64)
+    if not limits:
+        return GridWindow(slice(None), slice(None), longitudes, latitudes)
+
+    # Descending latitudes: search the reversed view and map the indices back
+    ascending = _between(latitudes[::-1], limits["south"], limits["north"])
+    lat = slice(len(latitudes) - ascending.stop, len(latitudes) - ascending.start)
+
+    seam = np.flatnonzero(np.diff(longitudes) < 0)
+    if not len(seam):
+        # CAMS Europe runs from 335.05 to 44.95, which is ascending once wrapped
+        lon = _between(longitudes, limits["west"], limits["east"])
+    else:
+        # A 0-360 axis wraps to [0, 180) followed by [-180, 0). West of the seam comes first
+        seam = int(seam[0]) + 1
+        west = _between(longitudes[seam:], limits["west"], limits["east"])
+        east = _between(longitudes[:seam], limits["west"], limits["east"])
+        west = slice(west.start + seam, west.stop + seam)
+        if west.start == west.stop:
+            lon = east
+        elif east.start == east.stop:
+            lon = west
         else:
-            sql = f"""
-                SELECT variable_name, value, lon, lat, leadtime 
-                FROM forecasts 
-                WHERE variable_name=:variable AND datetime=:datetime AND leadtime<=:leadtime AND model=:model
-            """
-        results = cursor.execute(sql, parameters).fetchall()
-        df = pd.DataFrame(results, columns=["variable", "value", "lon", "lat", "leadtime"])
-        df['id'] = df.apply(lambda row: f"[{row['lon']}, {row['lat']}]", axis=1)
-        df = df[['id'] + [col for col in df.columns if col != 'id']]
-        return df
-
-
-def query_forecast_nc(query:ForecastQuery):
-    ds = xr.open_dataset("data/netcdf/cams-europe-air-quality-forecasts/EU-forecast-PM10-2025-05-10-24/ENS_FORECAST.nc", engine="netcdf4", decode_timedelta=False)
-    all_values = ds.variables["pm10_conc"][query.leadtimes][0].data # lat lon
-    all_longitudes = list(map(lambda lon: lon if lon < 180 else lon - 360, ds.variables["longitude"].data.tolist()))
-    all_latitudes:list = ds.variables["latitude"].data.tolist()
-
-    values = all_values
-    longitude = all_longitudes
-    latitude = all_latitudes
+            lon = np.r_[west, east]
+    return GridWindow(lat, lon, longitudes[lon], latitudes[lat])
+
+
+SLAB_READERS = {
+    "nc": read_slab_nc,
+    "columnar": read_slab_columnar,
+}
+
+VARIABLE_READERS = {
+    "nc": read_variables_nc,
+    "columnar": read_variables_columnar,
+}
+
+class _ArrayResult:
+    """Read-only arrays of a result, so results are shared instead of copied."""
+
+    def __post_init__(self):
+        for array in self._arrays():
+            array.flags.writeable = False
+
+    def _arrays(self) -> list[np.ndarray]:
+        return [value for value in vars(self).values() if isinstance(value, np.ndarray)]
+
+    @property
+    def nbytes(self) -> int:
+        return sum(array.nbytes for array in self._arrays())
+
+    def copy(self):
+        return self # Read-only, like ResultCache expects of a copy
+
+
+@dataclass(frozen=True, eq=False)
+class ForecastResult(_ArrayResult):
+    """Compact result of a forecast query: float32 values of every leadtime and cell, int16 leadtimes
+    and the coordinates once per cell instead of once per row. to_dataframe() builds a frame when one is needed.
+
+    values are (leadtime, cell) in the order of a slab, latitude row then longitude.
+    present marks the values a row based backend (db) returned, None when every cell has every leadtime.
+    The arrays are read-only, so results are shared instead of copied."""
+    variable: str
+    model: Optional[str]
+    leadtimes: np.ndarray
+    lon: np.ndarray
+    lat: np.ndarray
+    values: np.ndarray
+    present: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        """Rows of the frame."""
+        return self.values.size if self.present is None else int(self.present.sum())
+
+    def to_dataframe(self, cell_ids:bool=False, compact:bool=False) -> pd.DataFrame:
+        """Tidy frame ordered by leadtime, then cell. Columns id, value, lon, lat, leadtime like get_dataframe.
+        compact keeps float32 values and int16 leadtimes, makes the string ids and the coordinates
+        categorical, so every row holds small codes into the grid axes, and adds categorical variable
+        and model columns."""
+        n_leadtimes, n_cells = self.values.shape
+        ids = cams.cell_id(self.lon, self.lat) if cell_ids else feature_ids(self.lon, self.lat)
+        cell = np.tile(np.arange(n_cells, dtype=np.int32), n_leadtimes)
+        leadtime = np.repeat(self.leadtimes, n_cells)
+        values = self.values.ravel()
+        if self.present is not None:
+            rows = self.present.ravel()
+            cell, leadtime, values = cell[rows], leadtime[rows], values[rows]
+        if not compact:
+            return pd.DataFrame({
+                "id": ids[cell], "value": values.astype(np.float64), "lon": self.lon[cell], "lat": self.lat[cell], "leadtime": leadtime.astype(np.float64),
+            })
+        def label(name:Optional[str]) -> pd.Categorical:
+            return pd.Categorical.from_codes(np.full(len(cell), 0 if name is not None else -1, dtype=np.int8), categories=[name] if name is not None else [])
+
+        def coordinate(per_cell:np.ndarray) -> pd.Categorical:
+            axis, codes = np.unique(per_cell, return_inverse=True)
+            return pd.Categorical.from_codes(codes, categories=axis)[cell] # Codes are int16 for a CAMS axis
+
+        return pd.DataFrame({
+            "id": ids[cell] if cell_ids else pd.Categorical.from_codes(cell, categories=ids),
+            "value": values.copy(),
+            "lon": coordinate(self.lon),
+            "lat": coordinate(self.lat),
+            "leadtime": leadtime,
+            "variable": label(self.variable),
+            "model": label(self.model),
+        })
+
+
+@dataclass(frozen=True, eq=False)
+class ForecastVariables(_ArrayResult):
+    """Several variables of one run aligned on one grid: values are (variable, leadtime, cell) float32,
+    so result["NO2"] and result["O3"] line up cell by cell for composite indices.
+    Coordinates are once per cell. present marks the values the database returned, None when all are there."""
+    variables: tuple[str, ...]
+    models: tuple[Optional[str], ...]
+    leadtimes: np.ndarray
+    lon: np.ndarray
+    lat: np.ndarray
+    values: np.ndarray
+    present: Optional[np.ndarray] = None
+
+    def __getitem__(self, variable:str) -> np.ndarray:
+        """(leadtime, cell) values of one variable."""
+        return self.values[self.variables.index(variable)]
+
+    def __len__(self) -> int:
+        """Rows of the frame."""
+        return self.values[0].size if self.present is None else int(self.present.any(axis=0).sum())
+
+    def to_dataframe(self, cell_ids:bool=False) -> pd.DataFrame:
+        """Wide frame ordered by leadtime, then cell: id, lon, lat, leadtime and a column per variable.
+        Rows where no variable has a value are left out, a missing value of one variable is NaN."""
+        n_leadtimes, n_cells = self.values.shape[1:]
+        ids = cams.cell_id(self.lon, self.lat) if cell_ids else feature_ids(self.lon, self.lat)
+        cell = np.tile(np.arange(n_cells, dtype=np.int32), n_leadtimes)
+        leadtime = np.repeat(self.leadtimes, n_cells)
+        values = self.values.reshape(len(self.variables), -1)
+        if self.present is not None:
+            rows = self.present.any(axis=0).ravel()
+            cell, leadtime, values = cell[rows], leadtime[rows], values[:, rows]
+        columns = {"id": ids[cell], "lon": self.lon[cell], "lat": self.lat[cell], "leadtime": leadtime.astype(np.float64)}
+        columns.update({variable: values[layer].astype(np.float64) for layer, variable in enumerate(self.variables)})
+        return pd.DataFrame(columns)
+
+
+def _result_model(query:ForecastQuery, backend:str) -> Optional[str]:
+    """Model the backend read. A query without a model reads the run the catalog finds first (nc),
+    ENSEMBLE (columnar) or the run ONE_RUN_SQL picks (db)."""
+    if query.model:
+        return query.model
+    if backend == "nc":
+        return forecast_entry(query.variable, query.time).model
+    if backend == "columnar":
+        return "ENSEMBLE"
+    models = DB_POOL.execute(
+        f"SELECT model FROM runs WHERE variable_name=:variable AND base_time=:base_time ORDER BY {RUN_ORDER} LIMIT 1",
+        {"variable": query.variable, "base_time": cams.unix_time(query.time)}
+    )
+    return models[0][0] if models else None
+
+
+DbGrid = namedtuple("DbGrid", ["leadtimes", "lon", "lat", "values", "present"]) # values and present are (variable, leadtime, cell)
+
+
+def _db_grid(query:ForecastQuery|ForecastVariablesQuery) -> DbGrid:
+    """Rows of the database placed on the cells they cover, ordered like a slab: north to south, west to east.
+    Every variable of the query comes from the same SQL query."""
+    sql, parameters = forecast_sql(query)
+    variables = _variables(query)
+    dtypes = (np.int16, np.float32, np.float64, np.float64, np.int16) # variable, value, lon, lat, leadtime
+    chunks = [[np.empty(0, dtype=dtype)] for dtype in dtypes]
+    for rows in DB_POOL.iterate(sql, parameters): # Never every row as tuples at once
+        names, *columns = zip(*rows)
+        chunks[0].append(pd.Categorical(names, categories=variables).codes.astype(np.int16))
+        for chunk, column, dtype in zip(chunks[1:], columns, dtypes[1:]):
+            chunk.append(np.array(column, dtype=dtype))
+    layer, values, lon, lat, leadtime = (np.concatenate(chunk) for chunk in chunks)
+    leadtimes, leadtime_idx = np.unique(leadtime, return_inverse=True)
+    _, first, cell_idx = np.unique(cams.cell_id(lon, lat), return_index=True, return_inverse=True) # Integer keys sort fast
+    cells = np.column_stack([lon[first], lat[first]])
+    order = np.lexsort((cells[:, 0], -cells[:, 1]))
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    cell_idx = rank[cell_idx]
+
+    grid = np.full((len(variables), len(leadtimes), len(cells)), np.nan, dtype=np.float32)
+    present = np.zeros(grid.shape, dtype=bool)
+    grid[layer, leadtime_idx, cell_idx] = values
+    present[layer, leadtime_idx, cell_idx] = True
+    return DbGrid(leadtimes, cells[order, 0].copy(), cells[order, 1].copy(), grid, present)
+
+
+def _slab_result(query:ForecastQuery, slab:ForecastSlab, model:Optional[str]) -> ForecastResult:
+    """Result of a slab of a gridded backend. Coordinates are once per cell, latitude row then longitude."""
+    n_leadtimes, n_lat, n_lon = slab.values.shape
+    return ForecastResult(
+        query.variable, model, slab.leadtimes.astype(np.int16),
+        np.tile(np.round(slab.longitudes, 2), n_lat), np.repeat(np.round(slab.latitudes, 2), n_lon),
+        np.asarray(slab.values, dtype=np.float32).reshape(n_leadtimes, n_lat * n_lon),
+    )
+
+
+def _db_result(query:ForecastQuery, model:Optional[str]) -> ForecastResult:
+    grid = _db_grid(query)
+    present = grid.present[0]
+    return ForecastResult(
+        query.variable, model, grid.leadtimes, grid.lon, grid.lat, grid.values[0], None if present.all() else present
+    )
+
+
+def query_variables(query:ForecastVariablesQuery, backend:Optional[str]=None) -> ForecastVariables:
+    """Every variable of the query on one grid, read in one pass: one crop window for all the
+    files of the gridded backends, one SQL query for the database."""
+    backend = backend or BACKEND
+    models = tuple(_result_model(ForecastQuery(variable, query.time, 0, query.model, None), backend) for variable in query.variables)
+    if backend == "db":
+        grid = _db_grid(query)
+        return ForecastVariables(
+            query.variables, models, grid.leadtimes, grid.lon, grid.lat, grid.values, None if grid.present.all() else grid.present
+        )
+    if backend not in VARIABLE_READERS:
+        raise ValueError(f"Unknown backend {backend!r}. Choose from {list(BACKENDS)}")
+    slab = VARIABLE_READERS[backend](query)
+    n_variables, n_leadtimes, n_lat, n_lon = slab.values.shape
+    return ForecastVariables(
+        query.variables, models, slab.leadtimes.astype(np.int16),
+        np.tile(np.round(slab.longitudes, 2), n_lat), np.repeat(np.round(slab.latitudes, 2), n_lon),
+        slab.values.reshape(n_variables, n_leadtimes, n_lat * n_lon),
+    )
+
+
+def query_result(query:ForecastQuery|ForecastMultiQuery|ForecastVariablesQuery, backend:Optional[str]=None) -> ForecastResult|ForecastVariables:
+    """Compact result of a forecast query, see ForecastResult. ForecastVariables of a ForecastVariablesQuery."""
+    backend = backend or BACKEND
+    if isinstance(query, ForecastVariablesQuery):
+        return query_variables(query, backend)
+    if isinstance(query, ForecastMultiQuery):
+        query = ForecastQuery(query.variable, query.time, list(query.leadtimes), query.model, query.limits)
+    if backend == "db":
+        return _db_result(query, _result_model(query, "db"))
+    if backend not in SLAB_READERS:
+        raise ValueError(f"Unknown backend {backend!r}. Choose from {list(BACKENDS)}")
+    return _slab_result(query, SLAB_READERS[backend](query), _result_model(query, backend))
+
+
+RegionSeries = namedtuple("RegionSeries", ["leadtimes", "mean", "max", "percentiles", "cells"]) # percentiles: {q: array per leadtime}
+
+
+def polygon_mask(longitudes:np.ndarray, latitudes:np.ndarray, polygon:list[tuple[float, float]]) -> np.ndarray:
+    """(lat, lon) mask of the cell centres inside a polygon ring of (lon, lat) vertices, like a GeoJSON ring.
+    Even-odd ray casting, vectorized over the cells and looped over the edges."""
+    lon, lat = np.meshgrid(longitudes, latitudes)
+    ring = np.asarray(polygon, dtype=np.float64)
+    inside = np.zeros(lon.shape, dtype=bool)
+    for (x1, y1), (x2, y2) in zip(ring, np.roll(ring, -1, axis=0)):
+        if y1 == y2: continue # Horizontal edges never cross the ray
+        crosses = (y1 > lat) != (y2 > lat)
+        x_cross = x1 + (lat - y1) * (x2 - x1) / (y2 - y1)
+        inside ^= crosses & (lon < x_cross)
+    return inside
+
+
+def _weighted_percentiles(values:np.ndarray, weights:np.ndarray, percentiles:tuple[float, ...]) -> np.ndarray:
+    """(len(percentiles), rows) percentiles of every row of values, every value standing for its weight.
+    Values with zero weight are left out. The cumulative weight is taken at the middle of each value,
+    so equal weights give the Hazen percentile. Rows without weight give NaN."""
+    if not percentiles: return np.empty((0, len(values)))
+    order = np.argsort(np.where(weights > 0, values, np.inf), axis=1) # Weightless values last
+    values = np.take_along_axis(values, order, axis=1)
+    weights = np.take_along_axis(weights, order, axis=1)
+    cumulative = np.cumsum(weights, axis=1) - weights / 2
+    cumulative = np.where(weights > 0, cumulative, np.inf)
+    last = np.maximum((weights > 0).sum(axis=1) - 1, 0)
+    rows = np.arange(len(values))
+    result = np.full((len(percentiles), len(values)), np.nan)
+    for idx, q in enumerate(percentiles):
+        target = q / 100 * weights.sum(axis=1)
+        above = (cumulative < target[:, np.newaxis]).sum(axis=1) # First value at or past the target
+        high = np.minimum(above, last)
+        low = np.clip(above - 1, 0, last)
+        with np.errstate(invalid="ignore"): # inf - inf in rows without weight, they end up NaN
+            span = cumulative[rows, high] - cumulative[rows, low]
+        fraction = np.divide(target - cumulative[rows, low], span, out=np.zeros_like(target), where=span > 0)
+        result[idx] = values[rows, low] + np.clip(fraction, 0, 1) * (values[rows, high] - values[rows, low])
+    result[:, weights.sum(axis=1) == 0] = np.nan
+    return result
+
+
+def region_series(query:ForecastQuery|ForecastMultiQuery, percentiles:tuple[float, ...]=(), polygon:Optional[list[tuple[float, float]]]=None,
+                  weighted:bool=True, backend:Optional[str]=None) -> RegionSeries:
+    """Mean, max and percentiles over the query limits for every leadtime, straight from the gridded slab.
+
+    polygon restricts the area further to cells whose centre is inside it. If the query
+    has no limits, the bounding box of the polygon is read. weighted weighs cells by
+    cos(lat), the area of a 0.1 degree cell, so northern cells do not count extra.
+    Percentiles are weighted Hazen percentiles. Missing values (NaN) are left out.
+    Only the gridded backends (SLAB_READERS) are supported."""
+    backend = backend or BACKEND
+    if backend not in SLAB_READERS:
+        raise ValueError(f"region_series needs a gridded backend. Choose from {list(SLAB_READERS)}")
+    if polygon is not None and query.limits is None:
+        ring = np.asarray(polygon, dtype=np.float64)
+        limits = Limits(ring[:, 1].max() + 1e-9, ring[:, 1].min() - 1e-9, ring[:, 0].min() - 1e-9, ring[:, 0].max() + 1e-9)
+        query = ForecastQuery(query.variable, query.time, _tuple_or_int(_leadtimes(query)), query.model, limits)
+    slab = SLAB_READERS[backend](query)
+
+    n_leadtimes, n_lat, n_lon = slab.values.shape
+    weights = np.broadcast_to(np.cos(np.radians(slab.latitudes))[:, np.newaxis] if weighted else np.ones((n_lat, 1)), (n_lat, n_lon))
+    selected = np.ones((n_lat, n_lon), dtype=bool) if polygon is None else polygon_mask(slab.longitudes, slab.latitudes, polygon)
+    values = slab.values[:, selected].astype(np.float64) # (leadtime, cell), only the selected cells
+    weights = np.where(np.isnan(values), 0.0, weights[selected])
+    total = weights.sum(axis=1)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.nansum(values * weights, axis=1) / total
+    maximum = np.where(np.isnan(values), -np.inf, values).max(axis=1, initial=-np.inf)
+    maximum[np.isinf(maximum)] = np.nan # No values
+    quantiles = _weighted_percentiles(values, weights, percentiles)
+    return RegionSeries(slab.leadtimes, mean, maximum, dict(zip(percentiles, quantiles)), int(selected.sum()))
+
+
+# A region is limits (a box, cells strictly inside), one polygon ring of (lon, lat) vertices or a list of rings.
+# Rings are combined even-odd, so holes and the islands of a MultiPolygon both work
+Region: TypeAlias = "GeoJSONlimits|Limits|list[tuple[float, float]]|list[list[tuple[float, float]]]"
+
+WEIGHTS_DIR = Path("data") / "weights"
+
+RegionMatrix = namedtuple("RegionMatrix", ["names", "matrix", "cells"]) # matrix: scipy.sparse CSR (region, cell) of weights of the cells
+_region_matrices:dict[str, RegionMatrix] = {} # key -> matrix, every grid and region set this process has used
+
+
+def _is_box(region:Region) -> bool:
+    return isinstance(region, (dict, Limits))
+
+
+def _rings(region:Region) -> list:
+    return [region] if np.ndim(region[0][0]) == 0 else list(region)
+
+
+def region_mask(longitudes:np.ndarray, latitudes:np.ndarray, region:Region) -> np.ndarray:
+    """(lat, lon) mask of the cells of a region. Longitudes -180-180 like the slabs."""
+    if _is_box(region):
+        limits = Limits.of(region)
+        lat = (limits.south < latitudes) & (latitudes < limits.north)
+        lon = (limits.west < longitudes) & (longitudes < limits.east)
+        return lat[:, np.newaxis] & lon[np.newaxis, :]
+    mask = np.zeros((len(latitudes), len(longitudes)), dtype=bool)
+    for ring in _rings(region):
+        mask ^= polygon_mask(longitudes, latitudes, ring)
+    return mask
+
+
+def regions_limits(regions:dict[str, Region]) -> Limits:
+    """Bounding box of all the regions, so one read covers every one of them."""
+    boxes = []
+    for region in regions.values():
+        if _is_box(region):
+            boxes.append(Limits.of(region))
+            continue
+        ring = np.concatenate([np.asarray(ring, dtype=np.float64) for ring in _rings(region)])
+        boxes.append(Limits(ring[:, 1].max() + 1e-9, ring[:, 1].min() - 1e-9, ring[:, 0].min() - 1e-9, ring[:, 0].max() + 1e-9))
+    return Limits(max(box.north for box in boxes), min(box.south for box in boxes), min(box.west for box in boxes), max(box.east for box in boxes))
+
+
+def _region_key(longitudes:np.ndarray, latitudes:np.ndarray, regions:dict[str, Region], weighted:bool) -> str:
+    """Digest of the grid definition and the regions."""
+    definition = {
+        name: {key: region[key] for key in ("north", "south", "west", "east")} if _is_box(region) else region
+        for name, region in regions.items()
+    }
+    digest = hashlib.sha1(np.asarray(longitudes, dtype=np.float64).tobytes())
+    digest.update(np.asarray(latitudes, dtype=np.float64).tobytes())
+    digest.update(json.dumps([definition, weighted], default=float).encode())
+    return digest.hexdigest()
+
+
+def region_matrix(longitudes:np.ndarray, latitudes:np.ndarray, regions:dict[str, Region], weighted:bool=True,
+                  directory:Optional[Path]=None) -> RegionMatrix:
+    """Sparse (region, cell) matrix of the cell weights of every region on the grid, cos(lat) or 1.
+    cells are the indices of the raveled (lat, lon) grid that are in some region, the columns of
+    the matrix, so matrix @ values.ravel()[cells] sums every region at once.
+
+    Built once per grid and region set: kept in memory and saved under directory (WEIGHTS_DIR),
+    so later processes load it instead of testing every cell against every region again."""
+    key = _region_key(longitudes, latitudes, regions, weighted)
+    if key in _region_matrices:
+        return _region_matrices[key]
+    path = Path(directory or WEIGHTS_DIR) / f"{key}.npz"
+    try:
+        matrix = scipy.sparse.load_npz(path).tocsr()
+    except (OSError, ValueError): # Not built yet or a broken file, build again
+        latitudes = np.asarray(latitudes, dtype=np.float64)
+        cell_weights = np.broadcast_to(np.cos(np.radians(latitudes))[:, np.newaxis] if weighted else 1.0, (len(latitudes), len(longitudes))).ravel()
+        rows, columns = [], []
+        for row, region in enumerate(regions.values()):
+            cells = np.flatnonzero(region_mask(longitudes, latitudes, region))
+            rows.append(np.full(len(cells), row))
+            columns.append(cells)
+        rows, columns = np.concatenate(rows), np.concatenate(columns)
+        matrix = scipy.sparse.csr_matrix((cell_weights[columns], (rows, columns)), shape=(len(regions), cell_weights.size))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        with open(tmp, "wb") as file:
+            scipy.sparse.save_npz(file, matrix)
+        os.replace(tmp, path)
+    cells = np.unique(matrix.indices) # Most of the grid is in no region, leave it out of the products
+    _region_matrices[key] = RegionMatrix(list(regions), matrix[:, cells], cells)
+    return _region_matrices[key]
+
+
+def region_means(query:ForecastQuery|ForecastMultiQuery, regions:dict[str, Region], weighted:bool=True, backend:Optional[str]=None) -> pd.DataFrame:
+    """Mean of every region for every leadtime of the query, index leadtime and a column per region.
+
+    The bounding box of all the regions is read once, the cells inside some region are picked out
+    and reduced with two sparse products, the weighted sums and the weights of the cells that have
+    a value, so all the cities cost about as much as one. The query limits are ignored.
+    Missing values (NaN) are left out."""
+    backend = backend or BACKEND
+    if backend not in SLAB_READERS:
+        raise ValueError(f"region_means needs a gridded backend. Choose from {list(SLAB_READERS)}")
+    query = ForecastQuery(query.variable, query.time, _tuple_or_int(_leadtimes(query)), query.model, regions_limits(regions))
+    slab = SLAB_READERS[backend](query)
+    names, matrix, cells = region_matrix(slab.longitudes, slab.latitudes, regions, weighted)
+
+    values = slab.values.reshape(len(slab.leadtimes), -1)[:, cells].T.astype(np.float64) # (cell, leadtime)
+    present = ~np.isnan(values)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = (matrix @ np.where(present, values, 0.0)) / (matrix @ present.astype(np.float64))
+    return pd.DataFrame(means.T, index=pd.Index(slab.leadtimes, name="leadtime"), columns=names)
+
+
+def country_regions(geojson_path:str, name_property:str="name") -> dict[str, list]:
+    """Regions of the countries of country_codes from a GeoJSON of country (Multi)Polygons, keyed by country code.
+    Features of other countries are skipped."""
+    with open(geojson_path, encoding="utf-8") as file:
+        features = json.load(file)["features"]
+    regions = {}
+    for feature in features:
+        try:
+            code = country_codes.country_code(str(feature["properties"].get(name_property, "")))
+        except ValueError:
+            continue
+        geometry = feature["geometry"]
+        polygons = [geometry["coordinates"]] if geometry["type"] == "Polygon" else geometry["coordinates"]
+        regions[code] = [ring for polygon in polygons for ring in polygon]
+    return regions
+
+ANALYSIS_DATETIME_FORMAT = "%Y/%m/%d %H:%M"
+# Length of the datetime text prefix that identifies the bucket and how to parse it
+ANALYSIS_BUCKETS = {
+    "hourly": (13, "%Y/%m/%d %H"),
+    "daily": (10, "%Y/%m/%d"),
+    "monthly": (7, "%Y/%m"),
+}
+ANALYSIS_CHUNK_ROWS = 100_000
+
+
+def analysis_sql(query:AnalysisQuery, aggregate:bool=True) -> tuple[str, dict]:
+    """SQL and parameters of an analysis query. aggregate groups by bucket in SQL,
+    otherwise the raw values come in datetime order, which is the order of analysis_variable_datetime."""
+    if query.resolution not in ANALYSIS_BUCKETS:
+        raise ValueError(f"Unknown resolution {query.resolution!r}. Choose from {list(ANALYSIS_BUCKETS)}")
+    length, _ = ANALYSIS_BUCKETS[query.resolution]
+    parameters = {
+        "variable": query.variable,
+        "start": query.start_time.strftime(ANALYSIS_DATETIME_FORMAT),
+        "end": query.end_time.strftime(ANALYSIS_DATETIME_FORMAT),
+    }
+    where = "variable_name=:variable AND datetime>=:start AND datetime<:end"
     if query.limits:
-        # Find longitude index range
-        west_limit_idx = min([i for i, lon in enumerate(all_longitudes) if lon > query.limits["west"]])
-        east_limit_idx = max([i for i, lon in enumerate(all_longitudes) if lon < query.limits["east"]])
+        where += " AND lon>:west AND lon<:east AND lat<:north AND lat>:south"
+        parameters.update({key: query.limits[key] for key in ("north", "south", "west", "east")})
+    cells = ", lon, lat" if query.per_cell else ""
+    if aggregate:
+        sql = f"""SELECT substr(datetime, 1, {length}) AS bucket{cells}, avg(value), max(value), count(*) 
+    FROM analysis WHERE {where} GROUP BY bucket{cells} ORDER BY bucket{cells}"""
+    else:
+        sql = f"""SELECT substr(datetime, 1, {length}) AS bucket{cells}, value 
+    FROM analysis WHERE {where} ORDER BY datetime"""
+    return sql, parameters
+
+
+def _analysis_frame(df:pd.DataFrame, query:AnalysisQuery) -> pd.DataFrame:
+    _, time_format = ANALYSIS_BUCKETS[query.resolution]
+    df.insert(0, "time", pd.to_datetime(df.pop("bucket"), format=time_format))
+    return df
+
+
+def _aggregate_buckets(df:pd.DataFrame, query:AnalysisQuery) -> pd.DataFrame:
+    """mean, max, count and percentiles of complete buckets in one vectorized groupby."""
+    keys = ["bucket", "lon", "lat"] if query.per_cell else ["bucket"]
+    groups = df.groupby(keys, sort=True)["value"]
+    result = groups.agg(["mean", "max", "count"])
+    quantiles = groups.quantile([q / 100 for q in query.percentiles]).unstack()
+    quantiles.columns = [f"p{q:g}" for q in query.percentiles]
+    return result.join(quantiles).reset_index()
+
+
+def iter_analysis(query:AnalysisQuery, chunk_rows:int=ANALYSIS_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """Aggregates analysis values per hour, day or month and yields the result in chunks.
+
+    Without percentiles SQLite aggregates and only the aggregates are fetched,
+    chunk_rows at a time. Percentiles need the values, so they are streamed in
+    datetime order and every bucket is aggregated as soon as it is complete.
+
+    Memory holds one chunk of rows plus every value of the bucket that continues
+    past it, so a percentile bucket is bounded by its own size, not chunk_rows:
+    a monthly bucket of every cell holds all of that month's analysis values.
+    Query hourly or daily buckets, or fewer cells, when a month does not fit."""
+    if not query.percentiles:
+        columns = ["bucket", "lon", "lat", "mean", "max", "count"] if query.per_cell else ["bucket", "mean", "max", "count"]
+        sql, parameters = analysis_sql(query, aggregate=True)
+        for rows in DB_POOL.iterate(sql, parameters, chunk_rows):
+            yield _analysis_frame(pd.DataFrame(rows, columns=columns), query)
+        return
+
+    columns = ["bucket", "lon", "lat", "value"] if query.per_cell else ["bucket", "value"]
+    sql, parameters = analysis_sql(query, aggregate=False)
+    pending:list[pd.DataFrame] = [] # Chunks of the last bucket, joined once when the bucket is complete
+    for rows in DB_POOL.iterate(sql, parameters, chunk_rows):
+        chunk = pd.DataFrame(rows, columns=columns)
+        buckets = chunk["bucket"].to_numpy()
+        last_bucket = buckets[-1]
+        split = int(np.argmax(buckets == last_bucket)) # Rows are in datetime order, only the last bucket may continue
+        if split or (pending and pending[-1]["bucket"].iat[-1] != last_bucket):
+            complete = pd.concat([*pending, chunk.iloc[:split]], ignore_index=True)
+            yield _analysis_frame(_aggregate_buckets(complete, query), query)
+            pending = []
+        pending.append(chunk.iloc[split:])
+    if pending:
+        yield _analysis_frame(_aggregate_buckets(pd.concat(pending, ignore_index=True), query), query)
+
+
+def query_analysis(query:AnalysisQuery) -> pd.DataFrame:
+    """Whole result of iter_analysis as one frame: time, [lon, lat], mean, max, count and a column per percentile."""
+    frames = list(iter_analysis(query))
+    if not frames:
+        cells = ["lon", "lat"] if query.per_cell else []
+        return pd.DataFrame(columns=["time", *cells, "mean", "max", "count", *[f"p{q:g}" for q in query.percentiles]])
+    return pd.concat(frames, ignore_index=True)
+
 
-        # Find latitude index range (NOTE: descending order)
-        north_limit_idx = min([i for i, lat in enumerate(all_latitudes) if lat < query.limits["north"]])
-        south_limit_idx = max([i for i, lat in enumerate(all_latitudes) if lat > query.limits["south"]])
+# Where get_dataframe reads forecasts from. "columnar" needs `python src/dibit.py --all --columnar` first.
+# Every backend takes a ForecastQuery with one or many leadtimes
+BACKENDS = {
+    "nc": query_forecast_nc,
+    "db": query_forecast_db,
+    "columnar": query_forecast_columnar,
+}
+BACKEND = "nc"
 
-        # Crop the 1D coordinate arrays
-        longitude = all_longitudes[west_limit_idx:east_limit_idx + 1]
-        latitude = all_latitudes[north_limit_idx:south_limit_idx + 1]
 
-        # Crop the 2D values array using lat (rows) and lon (columns)
-        values = all_values[north_limit_idx:south_limit_idx + 1, west_limit_idx:east_limit_idx + 1]
+RESULT_CACHE_ENTRIES = 64
+RESULT_CACHE_BYTES = 512 * 2**20
+RESULT_TTL_SECONDS = 600
 
-    # Create coordinate matrix
-    LON, LAT = np.meshgrid(longitude, latitude)
-    matrix_np = np.stack((LON, LAT), axis=-1)
-    coordinates = [[[round(lat[0],2), round(lat[1],2)] for lat in lon] for lon in matrix_np.tolist()] 
 
-    values_expanded = values[:, :, np.newaxis] # Make it 3D so we can concatenate it
+def frame_bytes(df:pd.DataFrame|ForecastResult|ForecastVariables) -> int:
+    """Approximate memory of a frame. Object columns are estimated from a sample,
+    memory_usage(deep=True) would take longer than some of the queries."""
+    if isinstance(df, _ArrayResult):
+        return df.nbytes
+    total = int(df.memory_usage(index=True, deep=False).sum())
+    for column in df.columns[df.dtypes == object]:
+        sample = df[column].iloc[:100]
+        if len(sample):
+            total += int(sum(sys.getsizeof(value) for value in sample) / len(sample) * len(df))
+    return total
 
-    # Add values to coordinates
-    results = np.concatenate((values_expanded, coordinates), axis=2)
 
-    # Add leadtime to coordinates
-    time_array = np.full((len(latitude), len(longitude), 1), query.leadtimes)
-    results = np.concatenate((results, time_array), axis=2)
+CacheEntry = namedtuple("CacheEntry", ["value", "bytes", "expires"])
 
-    # Reshape results for pd.DataFrame
-    flat_result = results.reshape(-1, 4) #2D
 
-    df = pd.DataFrame(flat_result, columns=["value", "lon", "lat", "leadtime"])
+class ResultCache:
+    """Process wide LRU of query results, bounded by entry count and bytes. Thread safe.
 
-    # Create id for plotly
-    df['id'] = df.apply(lambda row: f"[{row['lon']}, {row['lat']}]", axis=1)
+    Every entry expires after its ttl. Entries computed before the latest ingest
+    (see generation.py) are dropped, whatever their ttl. A result is only as new as
+    the generation when its query started, put() is told which one that was."""
 
-    # Move id-column to first
-    df = df[['id'] + [col for col in df.columns if col != 'id']]
+    def __init__(self, max_entries:int=RESULT_CACHE_ENTRIES, max_bytes:int=RESULT_CACHE_BYTES, ttl:float=RESULT_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self._generation = generation.current()
+        self._lock = threading.Lock()
+        self._entries:OrderedDict[object, CacheEntry] = OrderedDict()
+
+    def _drop(self, key):
+        self.bytes -= self._entries.pop(key).bytes
+
+    def _check_generation(self):
+        current = generation.current()
+        if current != self._generation:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self.bytes = 0
+            self._generation = current
+
+    def get(self, key) -> Optional[pd.DataFrame]:
+        """Copy of the cached frame, so callers may modify it. None on a miss."""
+        with self._lock:
+            self._check_generation()
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires <= time.monotonic():
+                self._drop(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return entry.value.copy()
+
+    def put(self, key, value:pd.DataFrame, ttl:Optional[float]=None, data_generation:Optional[int]=None):
+        """Caches value. data_generation is generation.current() from before the query ran, a value read
+        while an ingest finished is not stored. None takes the current generation."""
+        size = frame_bytes(value)
+        if size > self.max_bytes: return # Would evict everything else and still not fit
+        with self._lock:
+            self._check_generation()
+            if data_generation is not None and data_generation != self._generation: return # Stale before it was stored
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = CacheEntry(value.copy(), size, time.monotonic() + (self.ttl if ttl is None else ttl))
+            self.bytes += size
+            while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+
+RESULTS = ResultCache()
+
+
+def get_dataframe(query:ForecastQuery|ForecastMultiQuery|ForecastVariablesQuery|AnalysisQuery, backend:Optional[str]=None, cell_ids:bool=False, cache:bool=True):
+    """Result of the query. Identical queries are answered from RESULTS until new data is ingested or the ttl passes."""
+    key = (query, backend or BACKEND, cell_ids)
+    if cache:
+        df = RESULTS.get(key)
+        if df is not None:
+            return df
+    data_generation = generation.current() # Before the read, an ingest finishing during it makes the result stale
+    df = _query_dataframe(query, backend, cell_ids)
+    if cache and df is not None:
+        RESULTS.put(key, df, data_generation=data_generation)
     return df
 
 
-def query_analysis(query:AnalysisQuery):
-    pass
+def get_result(query:ForecastQuery|ForecastMultiQuery|ForecastVariablesQuery, backend:Optional[str]=None, cache:bool=True) -> ForecastResult|ForecastVariables:
+    """Compact result of the query, cached in RESULTS like get_dataframe. Results are shared, not copied."""
+    key = (query, backend or BACKEND, ForecastResult)
+    if cache:
+        result = RESULTS.get(key)
+        if result is not None:
+            return result
+    data_generation = generation.current()
+    result = query_result(query, backend)
+    if cache:
+        RESULTS.put(key, result, data_generation=data_generation)
+    return result
 
 
-def get_dataframe(query:ForecastMultiQuery|AnalysisQuery):
-    if isinstance(query, ForecastMultiQuery):
-        _query:ForecastQuery = copy.deepcopy(query)
-        dfs = []
-        for hour in query.leadtimes:
-            _query.leadtimes = hour
-            dfs.append(query_forecast_nc(_query))
-        df = pd.concat(dfs, ignore_index=True)
-        df = df.sort_values(by="leadtime", ascending=True)
-        return df
+
+def _query_dataframe(query:ForecastQuery|ForecastMultiQuery|ForecastVariablesQuery|AnalysisQuery, backend:Optional[str]=None, cell_ids:bool=False):
+    if isinstance(query, (ForecastQuery, ForecastMultiQuery)):
+        backend = backend or BACKEND
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend {backend!r}. Choose from {list(BACKENDS)}")
+        if isinstance(query, ForecastMultiQuery):
+            query = ForecastQuery(query.variable, query.time, list(query.leadtimes), query.model, query.limits)
+        return BACKENDS[backend](query, cell_ids)
+    elif isinstance(query, ForecastVariablesQuery):
+        return query_variables(query, backend).to_dataframe(cell_ids)
     elif isinstance(query, AnalysisQuery):
         return query_analysis(query)
-    raise ValueError(f"Query must be instance of either {ForecastMultiQuery.__name__} or {AnalysisQuery.__name__}")
+    raise ValueError(
+        f"Query must be instance of {ForecastQuery.__name__}, {ForecastMultiQuery.__name__}, {ForecastVariablesQuery.__name__} or {AnalysisQuery.__name__}"
+    )
+
+
+QUERY_WORKERS = min(8, (os.cpu_count() or 1) + 4) # Threads mostly wait for reads, a few more than cores
+_query_pool:Optional[ThreadPoolExecutor] = None
+_query_pool_lock = threading.Lock()
+
+
+def query_pool() -> ThreadPoolExecutor:
+    """Process wide pool of QUERY_WORKERS threads, started on first use.
+    Each thread keeps its own database connection (DB_POOL) between batches."""
+    global _query_pool
+    with _query_pool_lock:
+        if _query_pool is None:
+            _query_pool = ThreadPoolExecutor(QUERY_WORKERS, thread_name_prefix="geodata-query")
+        return _query_pool
+
+
+def _batch_calls(queries:list, backend:Optional[str], cell_ids:bool, cache:bool) -> tuple[list, list]:
+    """(calls of the distinct queries, index of the call of every query). Equal queries are read once."""
+    distinct = list(dict.fromkeys(queries))
+    position = {query: idx for idx, query in enumerate(distinct)}
+    calls = [functools.partial(get_dataframe, query, backend, cell_ids, cache) for query in distinct]
+    return calls, [position[query] for query in queries]
+
+
+def _in_order(results:list[pd.DataFrame], order:list[int]) -> list[pd.DataFrame]:
+    """Results of every query, a copy for each repeat of a query so callers may modify theirs."""
+    seen = set()
+    ordered = []
+    for idx in order:
+        df = results[idx]
+        ordered.append(df.copy() if idx in seen and df is not None else df)
+        seen.add(idx)
+    return ordered
+
+
+def get_dataframes(queries:list[ForecastQuery|ForecastMultiQuery|AnalysisQuery], backend:Optional[str]=None, cell_ids:bool=False,
+                   cache:bool=True) -> list[pd.DataFrame]:
+    """Results of several queries in the order of the queries, read in parallel on query_pool().
+    Only reads that release the GIL overlap: SQLite (db) and the memory maps of the columnar store.
+    netCDF reads go through xarray and take turns on the HDF5 lock, so nc queries gain nothing.
+    The first error is raised."""
+    calls, order = _batch_calls(list(queries), backend, cell_ids, cache)
+    if len(calls) <= 1:
+        return _in_order([call() for call in calls], order)
+    futures = [query_pool().submit(call) for call in calls]
+    return _in_order([future.result() for future in futures], order)
+
+
+async def get_dataframes_async(queries:list[ForecastQuery|ForecastMultiQuery|AnalysisQuery], backend:Optional[str]=None, cell_ids:bool=False,
+                               cache:bool=True) -> list[pd.DataFrame]:
+    """get_dataframes for event loops, the reads run on query_pool() while the loop is free."""
+    calls, order = _batch_calls(list(queries), backend, cell_ids, cache)
+    loop = asyncio.get_running_loop()
+    results = await asyncio.gather(*(loop.run_in_executor(query_pool(), call) for call in calls))
+    return _in_order(list(results), order)
 
 
 def get_geojson(geojson_path:str):
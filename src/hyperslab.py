@@ -0,0 +1,127 @@
+"""Chunk aligned reads of netCDF hyperslabs, under a per-process budget of decoded bytes.
+
+Without dask, xarray decodes an indexed read in one go: the raw values and their
+masked copy are both in memory, twice the result. read() splits the hyperslab
+along its first axis into blocks that start and end on the chunks of the file
+and decodes at most max_block_bytes at a time into one preallocated result,
+so a read peaks at the result plus one block and every chunk is decoded once.
+
+    values = hyperslab.read(ds["pm10_conc"], (leadtime_indices, 0, lat_slice, lon_slice))
+
+Every read first reserves the bytes of its result from BUDGET. While
+MAX_DECODED_BYTES are being decoded, reads of other threads wait, and a read
+larger than the budget waits until it runs alone. Memory of a process then
+follows the queries it answers instead of the files they come from.
+"""
+import threading
+from contextlib import contextmanager
+from typing import Optional
+
+import numpy as np
+import xarray as xr
+
+
+MAX_DECODED_BYTES = 256 * 2**20 # Decoded at once by all threads of the process
+MAX_BLOCK_BYTES = 8 * 2**20 # Decoded at once by one read
+
+Key = tuple[int|slice|np.ndarray, ...]
+
+
+class DecodedBudget:
+    """Bytes being decoded by the reads of this process. Thread safe."""
+
+    def __init__(self, max_bytes:int=MAX_DECODED_BYTES):
+        self.max_bytes = max_bytes
+        self.in_use = 0
+        self.peak = 0
+        self.reads = 0
+        self.waits = 0
+        self._condition = threading.Condition()
+
+    @contextmanager
+    def reserve(self, nbytes:int):
+        """Blocks until nbytes fit in the budget and holds them until the block ends."""
+        nbytes = min(int(nbytes), self.max_bytes) # A larger read runs alone instead of never
+        with self._condition:
+            if self.in_use + nbytes > self.max_bytes:
+                self.waits += 1
+            self._condition.wait_for(lambda: self.in_use + nbytes <= self.max_bytes)
+            self.in_use += nbytes
+            self.peak = max(self.peak, self.in_use)
+            self.reads += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self.in_use -= nbytes
+                self._condition.notify_all()
+
+    def stats(self) -> dict:
+        with self._condition:
+            return {"max_bytes": self.max_bytes, "in_use": self.in_use, "peak": self.peak, "reads": self.reads, "waits": self.waits}
+
+
+BUDGET = DecodedBudget()
+
+
+def disk_chunks(variable:xr.DataArray|xr.Variable) -> tuple[int, ...]:
+    """Chunk shape of the variable in its file. Contiguous variables (and netCDF3 files) are one chunk."""
+    chunks = variable.encoding.get("chunksizes")
+    return tuple(int(size) for size in chunks) if chunks else tuple(variable.shape)
+
+
+def _length(index:int|slice|np.ndarray, size:int) -> Optional[int]:
+    """Length of the axis after indexing, None when an integer drops it."""
+    if isinstance(index, slice):
+        return len(range(*index.indices(size)))
+    if np.ndim(index) == 0:
+        return None
+    return len(index)
+
+
+def blocks(indices:np.ndarray, chunk:int, rows:int) -> list[tuple[slice, slice|np.ndarray]]:
+    """(result rows, file index) of blocks of at most rows indices along an axis chunked by chunk.
+    Blocks hold whole chunks when a chunk fits in rows, otherwise they stay inside one chunk.
+    Consecutive indices are read as a slice."""
+    rows = max(1, rows)
+    result = []
+    start = 0
+    while start < len(indices):
+        first = int(indices[start])
+        low = first // chunk * chunk
+        high = low + rows // chunk * chunk if rows >= chunk else min(first + rows, low + chunk)
+        stop = start + 1
+        while stop < len(indices) and stop - start < rows and low <= indices[stop] < high:
+            stop += 1
+        block = indices[start:stop]
+        contiguous = np.array_equal(block, np.arange(first, first + len(block)))
+        result.append((slice(start, stop), slice(first, first + len(block)) if contiguous else block))
+        start = stop
+    return result
+
+
+def read(variable:xr.DataArray|xr.Variable, key:Key, out:Optional[np.ndarray]=None, budget:Optional[DecodedBudget]=None,
+         max_block_bytes:int=MAX_BLOCK_BYTES) -> np.ndarray:
+    """Decoded values of variable[key], one orthogonal index per dimension like xarray's .values.
+    Fills out when given, it must have the shape and dtype of the result."""
+    variable = variable.variable if isinstance(variable, xr.DataArray) else variable
+    budget = BUDGET if budget is None else budget
+    key = tuple(key) + (slice(None),) * (variable.ndim - len(key))
+    lengths = [_length(index, size) for index, size in zip(key, variable.shape)]
+    shape = tuple(length for length in lengths if length is not None)
+    if out is None:
+        out = np.empty(shape, dtype=variable.dtype)
+    elif out.shape != shape:
+        raise ValueError(f"out has shape {out.shape}, the hyperslab {shape}")
+
+    first, rest = key[0], key[1:]
+    indices = np.arange(variable.shape[0])[first]
+    if np.ndim(indices) == 0 or out.size == 0: # One row or nothing, there is no first axis to split
+        with budget.reserve(out.nbytes):
+            out[...] = variable[key].values
+        return out
+    row_bytes = out.nbytes // max(1, len(indices))
+    with budget.reserve(out.nbytes):
+        for rows, index in blocks(indices, disk_chunks(variable)[0], max(1, max_block_bytes // max(1, row_bytes))):
+            out[rows] = variable[(index,) + rest].values
+    return out
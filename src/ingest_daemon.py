@@ -0,0 +1,141 @@
+import time
+import hashlib
+import sqlite3
+import traceback
+from pathlib import Path
+from collections import namedtuple
+from argparse import ArgumentParser
+
+import metrics
+import nc_to_db
+import find_nc_files
+
+
+ManifestEntry = namedtuple("ManifestEntry", ["path", "size", "mtime_ns", "checksum"])
+
+SETTLE_SECONDS = 30 # Files modified more recently may still be downloading or unzipping
+
+
+def checksum(path:Path) -> str:
+    """sha256 of the file, read in 1 MiB blocks."""
+    hash = hashlib.sha256()
+    with open(path, "rb") as file:
+        while block := file.read(2**20):
+            hash.update(block)
+    return hash.hexdigest()
+
+
+def _manifest(conn:sqlite3.Connection) -> dict[str, ManifestEntry]:
+    return {
+        row[0]: ManifestEntry(*row)
+        for row in conn.execute("SELECT path, size, mtime_ns, checksum FROM ingest_manifest")
+    }
+
+
+def _record(conn:sqlite3.Connection, entries:list[ManifestEntry]):
+    with conn:
+        conn.executemany(
+            """INSERT INTO ingest_manifest (path, size, mtime_ns, checksum, ingested_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(path) DO UPDATE SET size=excluded.size, mtime_ns=excluded.mtime_ns, checksum=excluded.checksum, ingested_at=excluded.ingested_at""",
+            [(*entry, int(time.time())) for entry in entries]
+        )
+
+
+def scan(conn:sqlite3.Connection, settle_seconds:float=SETTLE_SECONDS) -> tuple[list[ManifestEntry], list[ManifestEntry]]:
+    """Finds files under data/netcdf that are new or whose content changed since they were ingested.
+    Unchanged size and mtime skip the checksum. Returns (new, changed)."""
+    manifest = _manifest(conn)
+    new, changed, touched = [], [], []
+    now_ns = time.time_ns()
+    for path in find_nc_files.nc_files():
+        stat = path.stat()
+        if now_ns - stat.st_mtime_ns < settle_seconds * 1e9: continue
+        known = manifest.get(str(path))
+        if known and known.size == stat.st_size and known.mtime_ns == stat.st_mtime_ns: continue
+
+        entry = ManifestEntry(str(path), stat.st_size, stat.st_mtime_ns, checksum(path))
+        if not known:
+            new.append(entry)
+        elif known.checksum != entry.checksum:
+            changed.append(entry)
+        else:
+            touched.append(entry) # Same content, only remember the new mtime
+    _record(conn, touched)
+    return new, changed
+
+
+def _delete_runs(conn:sqlite3.Connection, entries:list[ManifestEntry]):
+    """Deletes the rows of the runs of changed files, so they are written again from an empty run.
+    A file whose header cannot be read is left to fail in store_files."""
+    for entry in entries:
+        try:
+            with nc_to_db._get_data_set(entry.path) as ds:
+                meta = nc_to_db._file_meta(ds, entry.path)
+        except Exception:
+            continue
+        deleted = nc_to_db.delete_run(conn, meta)
+        print(f"Deleted {deleted} rows of {meta.variable_name} {meta.model} from {entry.path}")
+
+
+def ingest_once(db_connection_string:str, workers:int|None=None, max_chunk_bytes:int=nc_to_db.MAX_CHUNK_BYTES, settle_seconds:float=SETTLE_SECONDS) -> int:
+    """Ingests new and changed files once. Returns the number of files ingested."""
+    with sqlite3.connect(db_connection_string) as conn:
+        new, changed = scan(conn, settle_seconds)
+        ingested = 0
+        # New files resume from checkpoints a crashed run left. Changed files replace their run from the start
+        for entries, restart in ((new, False), (changed, True)):
+            if not entries: continue
+            print(f"{len(entries)} {'changed' if restart else 'new'} files")
+            if restart: _delete_runs(conn, entries)
+            result = nc_to_db.store_files([entry.path for entry in entries], db_connection_string, workers, max_chunk_bytes, restart)
+            succeeded = [entry for entry in entries if entry.path not in result.failed]
+            _record(conn, succeeded)
+            ingested += len(succeeded)
+    conn.close()
+    return ingested
+
+
+def run(db_connection_string:str, interval:float=60, workers:int|None=None, max_chunk_bytes:int=nc_to_db.MAX_CHUNK_BYTES, settle_seconds:float=SETTLE_SECONDS):
+    """Scans data/netcdf every interval seconds until interrupted."""
+    print(f"Watching data/netcdf every {interval}sec. Ctrl+C stops.")
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                ingested = ingest_once(db_connection_string, workers, max_chunk_bytes, settle_seconds)
+                if ingested:
+                    print(f"{ingested} files ingested in {time.perf_counter()-start:.2f}sec")
+            except Exception:
+                traceback.print_exc() # Keep watching, the next scan retries
+
+            time.sleep(max(0, interval - (time.perf_counter() - start)))
+    except KeyboardInterrupt:
+        print("Stopped.")
+
+
+def main():
+    parser = ArgumentParser(
+                    prog='Ingest daemon',
+                    description='Stores new and changed netCDF files from data/netcdf to the database'
+    )
+    parser.add_argument("--interval", type=float, default=60, help="Seconds between scans.")
+    parser.add_argument("--once", action="store_true", help="Scan and ingest once, then exit.")
+    parser.add_argument("--workers", type=int, default=None, help="Processes reading files. Defaults to CPU count.")
+    parser.add_argument("--chunk-mb", type=int, default=nc_to_db.MAX_CHUNK_BYTES // 2**20, help="Memory ceiling of one chunk in MiB.")
+    parser.add_argument("--settle", type=float, default=SETTLE_SECONDS, help="Skip files modified less than this many seconds ago.")
+    metrics.add_arguments(parser)
+    args = parser.parse_args()
+    metrics.configure_from(args)
+
+    target = "AirQuality.db"
+    max_chunk_bytes = args.chunk_mb * 2**20
+    if args.once:
+        ingest_once(target, args.workers, max_chunk_bytes, args.settle)
+    else:
+        run(target, args.interval, args.workers, max_chunk_bytes, args.settle)
+
+
+
+if __name__ == "__main__":
+    main()
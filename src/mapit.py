@@ -13,6 +13,7 @@ import pandas as pd
 import xarray as xr
 import plotly.express as px
 
+import metrics
 import create_geojson
 import find_nc_files
 
@@ -25,7 +26,10 @@ def main():
     )
     parser.add_argument("target", help="Filename.")
     parser.add_argument("filepath", help="Filename or path. Can be partial path. File is expected to be in data-folder.")
+    parser.add_argument("--cell-ids", action="store_true", help="Integer feature ids. Query with geodata.get_dataframe(cell_ids=True).")
+    metrics.add_arguments(parser)
     args = parser.parse_args()
+    metrics.configure_from(args)
     filename:str = args.filepath
     target:str = args.target
     target = Path("data") / "geojson" / target
@@ -43,7 +47,7 @@ def main():
         print("Aborted.")
         return
     
-    create_geojson.from_forecast(origin, target)
+    create_geojson.from_forecast(origin, target, args.cell_ids)
     print("Done.")
 
 
@@ -0,0 +1,206 @@
+"""Progress and metrics of long running jobs: ingest, download and geojson generation.
+
+A job counts its work with a Progress and every interval seconds the counters are
+handed to the configured sinks: a console line, a JSON log line per report and/or
+a Prometheus textfile that node_exporter's textfile collector can scrape.
+
+    progress = metrics.Progress("ingest", total=len(chunks))
+    for chunk in chunks:
+        progress.chunk(rows, bytes_read)
+    progress.close()
+
+Scripts expose the settings with add_arguments(parser) and configure_from(args).
+"""
+import os
+import sys
+import json
+import time
+from pathlib import Path
+from argparse import ArgumentParser, Namespace
+
+try:
+    import resource # Not on Windows
+except ImportError:
+    resource = None
+
+
+INTERVAL = 5.0 # Seconds between reports
+PREFIX = "cassini"
+
+_settings = {"interval": INTERVAL, "console": True, "json_log": None, "metrics_file": None}
+_latest:dict[str, dict] = {} # job -> last snapshot, the metrics file holds every job of the process
+
+
+def peak_rss(children:bool=False) -> int|None:
+    """Peak resident set size of this process in bytes, None if the platform does not tell.
+
+    children gives the largest peak of the child processes that have exited and been
+    waited for instead, e.g. the workers of a process pool once it has shut down.
+    Workers that are still running are not counted, so only the final report of a
+    pooled job covers them. Not available on Windows."""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024 # kilobytes on Linux
+    if sys.platform == "win32" and not children:
+        return _peak_working_set()
+    return None
+
+
+def _peak_working_set() -> int|None:
+    import ctypes
+    from ctypes import wintypes
+
+    class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+        _fields_ = [
+            ("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+            ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+            ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+            ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t),
+        ]
+    counters = PROCESS_MEMORY_COUNTERS()
+    counters.cb = ctypes.sizeof(counters)
+    process = ctypes.windll.kernel32.GetCurrentProcess()
+    if not ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+        return None
+    return counters.PeakWorkingSetSize
+
+
+def configure(interval:float|None=None, console:bool|None=None, json_log:str|None=None, metrics_file:str|None=None):
+    """Sets where and how often every later Progress reports. json_log '-' writes to stderr."""
+    for key, value in (("interval", interval), ("console", console), ("json_log", json_log), ("metrics_file", metrics_file)):
+        if value is not None:
+            _settings[key] = value
+
+
+def add_arguments(parser:ArgumentParser):
+    parser.add_argument("--metrics-interval", type=float, default=INTERVAL, help="Seconds between progress reports.")
+    parser.add_argument("--metrics-json", default=None, help="Append a JSON line per report to this file. '-' writes to stderr.")
+    parser.add_argument("--metrics-file", default=None, help="Prometheus textfile rewritten on every report.")
+    parser.add_argument("--quiet", action="store_true", help="No progress lines on the console.")
+
+
+def configure_from(args:Namespace):
+    configure(args.metrics_interval, not args.quiet, args.metrics_json, args.metrics_file)
+
+
+def _console(snapshot:dict):
+    total = f"/{snapshot['total']}" if snapshot["total"] is not None else ""
+    rss = f" peak {snapshot['peak_rss_bytes']/2**20:.0f} MiB" if snapshot["peak_rss_bytes"] else ""
+    if snapshot["peak_rss_children_bytes"]:
+        rss += f" workers {snapshot['peak_rss_children_bytes']/2**20:.0f} MiB"
+    commit = f" commit {snapshot['commit_seconds_last']*1000:.1f}ms" if snapshot["commits"] else ""
+    print(
+        f"{snapshot['job']} {snapshot['chunks']}{total} chunks {snapshot['rows']} rows "
+        f"{snapshot['bytes_read']/2**20:.1f} MiB in {snapshot['elapsed_seconds']:.2f}sec "
+        f"({snapshot['rows_per_second']:.0f} rows/sec){commit}{rss}"
+    )
+
+
+def _json_log(snapshot:dict, path:str):
+    line = json.dumps(snapshot)
+    if path == "-":
+        print(line, file=sys.stderr, flush=True)
+        return
+    with open(path, "a") as file:
+        file.write(line + "\n")
+
+
+def _metrics_file(path:str):
+    """Prometheus text format. Written next to the target and renamed so a scrape never sees half a file."""
+    lines = []
+    for job, snapshot in _latest.items():
+        for key, value in snapshot.items():
+            if key in ("job", "final", "time") or value is None: continue
+            lines.append(f'{PREFIX}_{key}{{job="{job}"}} {float(value)}')
+    path = Path(path)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_text("\n".join(lines) + "\n")
+    os.replace(tmp, path)
+
+
+class Progress:
+    """Counters of one job. Reports to the configured sinks at most every interval seconds and on close."""
+
+    def __init__(self, job:str, total:int|None=None, interval:float|None=None):
+        self.job = job
+        self.total = total
+        self.interval = _settings["interval"] if interval is None else interval
+        self.rows = 0
+        self.bytes_read = 0
+        self.chunks = 0
+        self.chunk_seconds = 0.0
+        self.chunk_seconds_last = 0.0
+        self.commits = 0
+        self.commit_seconds = 0.0
+        self.commit_seconds_last = 0.0
+        self.commit_seconds_max = 0.0
+        self.start = time.perf_counter()
+        self._last_chunk = self.start
+        self._last_report = self.start
+
+    def add(self, rows:int=0, bytes_read:int=0):
+        """Counts work that is not a chunk of its own, e.g. one feature of a geojson."""
+        self.rows += rows
+        self.bytes_read += bytes_read
+        self._maybe_report()
+
+    def chunk(self, rows:int=0, bytes_read:int=0, seconds:float|None=None):
+        """Counts a finished chunk. seconds defaults to the time since the previous chunk."""
+        now = time.perf_counter()
+        seconds = now - self._last_chunk if seconds is None else seconds
+        self._last_chunk = now
+        self.chunks += 1
+        self.chunk_seconds += seconds
+        self.chunk_seconds_last = seconds
+        self.add(rows, bytes_read)
+
+    def commit(self, seconds:float):
+        self.commits += 1
+        self.commit_seconds += seconds
+        self.commit_seconds_last = seconds
+        self.commit_seconds_max = max(self.commit_seconds_max, seconds)
+
+    def snapshot(self, final:bool=False) -> dict:
+        elapsed = time.perf_counter() - self.start
+        return {
+            "job": self.job,
+            "time": time.time(),
+            "final": final,
+            "elapsed_seconds": elapsed,
+            "total": self.total,
+            "chunks": self.chunks,
+            "rows": self.rows,
+            "rows_per_second": self.rows / max(elapsed, 1e-9),
+            "bytes_read": self.bytes_read,
+            "chunk_seconds_last": self.chunk_seconds_last,
+            "chunk_seconds_mean": self.chunk_seconds / self.chunks if self.chunks else 0.0,
+            "commits": self.commits,
+            "commit_seconds_last": self.commit_seconds_last,
+            "commit_seconds_mean": self.commit_seconds / self.commits if self.commits else 0.0,
+            "commit_seconds_max": self.commit_seconds_max,
+            "peak_rss_bytes": peak_rss(),
+            "peak_rss_children_bytes": peak_rss(children=True), # Exited workers only, see peak_rss
+        }
+
+    def report(self, final:bool=False) -> dict:
+        snapshot = self.snapshot(final)
+        self._last_report = time.perf_counter()
+        _latest[self.job] = snapshot
+        if _settings["console"]: _console(snapshot)
+        if _settings["json_log"]: _json_log(snapshot, _settings["json_log"])
+        if _settings["metrics_file"]: _metrics_file(_settings["metrics_file"])
+        return snapshot
+
+    def _maybe_report(self):
+        if time.perf_counter() - self._last_report >= self.interval:
+            self.report()
+
+    def close(self) -> dict:
+        return self.report(final=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
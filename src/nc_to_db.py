@@ -1,27 +1,32 @@
-import json
+import os
+import re
 import time
-import hashlib
 import sqlite3
+import traceback
 from pprint import pprint
+from queue import Empty, Full
+from pathlib import Path
 from typing import TypeAlias
+from itertools import repeat
+from collections import namedtuple
+from multiprocessing import Manager
+from concurrent.futures import ProcessPoolExecutor
 from argparse import ArgumentParser
-from datetime import datetime, timedelta
+from datetime import datetime, timezone
 
 import numpy as np
 import xarray as xr
 
+import cams
+import columnar
+import metrics
+import generation
+import hyperslab
 import find_nc_files
 
 
-def hash_data_entry(entry:dict) -> str:
-    """Return a data filename containing a hash which depends on the request"""
-    hash = hashlib.md5()
-    hash.update(json.dumps(entry, sort_keys=True).encode())
-    return hash.hexdigest()
-
-
 def _get_data_set(path:str) -> xr.Dataset:
-    ds = xr.open_dataset(path, engine="netcdf4")
+    ds = xr.open_dataset(path, engine="netcdf4", cache=False) # Lazy, only indexed hyperslabs are read
     return ds
 
 
@@ -43,81 +48,357 @@ def get_points(ds:xr.Dataset) -> list[tuple[float, float]]:
 
 GeoJSON: TypeAlias = dict
 Measurements: TypeAlias = list[list]
-def _get_geodata(ds:xr.Dataset, variable_name:str, db_connection_string:str) -> GeoJSON:
-    date:str = ds.FORECAST.split()[1].split("+")[0] # '20250510'
-    forecast_datetime = datetime.strptime(date, "%Y%m%d")
+FileMeta = namedtuple(
+    "FileMeta", ["path", "nc_variable", "variable_name", "unit_name", "model", "base_time", "leadtime_hours", "cells", "cell_grid", "lat_chunk"],
+    defaults=[None] # Latitude rows of a chunk in the file
+)
+IngestResult = namedtuple("IngestResult", ["rows", "failed"])
+Chunk = namedtuple("Chunk", ["leadtime_idx", "lat_start", "lat_stop"]) # Latitude rows [lat_start, lat_stop) of one leadtime
+
+INDEXES = Path(__file__).parent.parent / "air_quality.indexes.sql"
+
+MAX_CHUNK_BYTES = 64 * 2**20
+QUEUE_TIMEOUT = 5.0 # Seconds the writer waits for a chunk before it checks whether the readers are still alive
+# float32 value, its cell id and sort order plus the Python float, int and list slots executemany goes through
+BYTES_PER_CELL = 4 + 8 + 8 + 24 + 28 + 16
+
+INSERT_FORECAST = """INSERT INTO forecast_values 
+    (run_id, leadtime_hours, cell_id, value) 
+    VALUES 
+    (?, ?, ?, ?)
+    ON CONFLICT(run_id, leadtime_hours, cell_id) DO UPDATE SET value=excluded.value"""
+
+INSERT_CHECKPOINT = """INSERT OR REPLACE INTO ingest_checkpoints 
+    (run_id, leadtime_hours, lat_start, lat_stop) 
+    VALUES 
+    (?, ?, ?, ?)"""
+
+SELECT_CHECKPOINTS = """SELECT ingest_checkpoints.leadtime_hours, ingest_checkpoints.lat_start, ingest_checkpoints.lat_stop 
+    FROM ingest_checkpoints 
+    JOIN runs ON runs.id=ingest_checkpoints.run_id 
+    WHERE runs.variable_name=? AND runs.model=? AND runs.base_time=?"""
+
+
+def _file_meta(ds:xr.Dataset, path:str="") -> FileMeta:
+    """Reads variable, unit, run and grid cells of a file once."""
+    nc_variable = cams.data_variable(ds)
+
+    longitudes = ds.longitude.data.astype(np.float64)
+    latitudes = ds.latitude.data.astype(np.float64)
+    lon, lat = np.meshgrid(longitudes, latitudes) # Slabs are (lat, lon) so lon changes fastest
+    cell_grid = cams.cell_id(lon, lat)
+    cells = np.round(np.stack((
+        cell_grid.ravel(), 
+        (lon.ravel() + 180) % 360 - 180, 
+        lat.ravel()
+    ), axis=1), 2)
+
+    return FileMeta(
+        path=str(path),
+        nc_variable=nc_variable,
+        variable_name=cams.variable_name(ds, nc_variable),
+        unit_name=cams.unit_name(ds, nc_variable),
+        model=cams.model_name(ds),
+        base_time=cams.unix_time(cams.forecast_date(ds)),
+        leadtime_hours=np.rint(cams.leadtime_hours(ds)).astype(int).tolist(),
+        cells=[(int(id), lon, lat) for id, lon, lat in cells.tolist()],
+        cell_grid=cell_grid,
+        lat_chunk=hyperslab.disk_chunks(ds[nc_variable])[2],
+    )
+
+
+def _ensure_run(conn:sqlite3.Connection, meta:FileMeta) -> int:
+    """Creates the run, its grid cells and the variable and unit foreign keys point to. Returns run id."""
+    with conn:
+        conn.execute("INSERT OR IGNORE INTO variables (short_name) VALUES (?)", (meta.variable_name,))
+        conn.execute("INSERT OR IGNORE INTO units (name) VALUES (?)", (meta.unit_name,))
+        conn.execute(
+            "INSERT OR IGNORE INTO runs (variable_name, unit_name, model, base_time) VALUES (?, ?, ?, ?)",
+            (meta.variable_name, meta.unit_name, meta.model, meta.base_time)
+        )
+        conn.executemany("INSERT OR IGNORE INTO grid_cells (id, lon, lat) VALUES (?, ?, ?)", meta.cells)
+    run_id, = conn.execute(
+        "SELECT id FROM runs WHERE variable_name=? AND model=? AND base_time=?",
+        (meta.variable_name, meta.model, meta.base_time)
+    ).fetchone()
+    return run_id
+
+
+def _clear_checkpoints(conn:sqlite3.Connection, run_id:int):
+    with conn:
+        conn.execute("DELETE FROM ingest_checkpoints WHERE run_id=?", (run_id,))
+
+
+def delete_run(conn:sqlite3.Connection, meta:FileMeta) -> int:
+    """Deletes the values and checkpoints of the run of the file, before a changed file is written again.
+    Cells the new file no longer covers would otherwise keep the old values. Returns the number of rows deleted."""
+    run = conn.execute(
+        "SELECT id FROM runs WHERE variable_name=? AND model=? AND base_time=?",
+        (meta.variable_name, meta.model, meta.base_time)
+    ).fetchone()
+    if run is None: return 0
+    with conn:
+        deleted = conn.execute("DELETE FROM forecast_values WHERE run_id=?", run).rowcount
+        conn.execute("DELETE FROM ingest_checkpoints WHERE run_id=?", run)
+    return deleted
+
+
+def _completed(conn:sqlite3.Connection, meta:FileMeta) -> dict[int, list[tuple[int, int]]]:
+    """Latitude row ranges already written, by leadtime hour."""
+    completed = {}
+    for leadtime_hours, lat_start, lat_stop in conn.execute(SELECT_CHECKPOINTS, (meta.variable_name, meta.model, meta.base_time)):
+        completed.setdefault(leadtime_hours, []).append((lat_start, lat_stop))
+    return completed
+
+
+def _plan_chunks(meta:FileMeta, completed:dict[int, list[tuple[int, int]]], max_chunk_bytes:int=MAX_CHUNK_BYTES) -> list[Chunk]:
+    """Latitude bands of every leadtime that are not written yet, each within max_chunk_bytes."""
+    n_lat, n_lon = meta.cell_grid.shape
+    band = max(1, max_chunk_bytes // (n_lon * BYTES_PER_CELL))
+    if meta.lat_chunk and band >= meta.lat_chunk:
+        band -= band % meta.lat_chunk # Bands of whole chunks, every chunk of the file is decoded once
+    chunks = []
+    for leadtime_idx, leadtime_hours in enumerate(meta.leadtime_hours):
+        done = np.zeros(n_lat, dtype=bool)
+        for lat_start, lat_stop in completed.get(leadtime_hours, []):
+            done[lat_start:lat_stop] = True
+        todo = np.flatnonzero(~done)
+        if not len(todo): continue
+        # Contiguous row ranges still missing, so a resume does not redo finished rows
+        for rows in np.split(todo, np.flatnonzero(np.diff(todo) != 1) + 1):
+            for lat_start in range(rows[0], rows[-1] + 1, band):
+                chunks.append(Chunk(leadtime_idx, int(lat_start), int(min(lat_start + band, rows[-1] + 1))))
+    return chunks
+
+
+def _write_chunk(conn:sqlite3.Connection, run_id:int, meta:FileMeta, chunk:Chunk, values:np.ndarray, progress:metrics.Progress|None=None) -> int:
+    """Writes one chunk and its checkpoint in a single transaction. Returns the number of rows.
+    progress gets the commit latency."""
+    leadtime_hours = meta.leadtime_hours[chunk.leadtime_idx]
+    cell_ids = meta.cell_grid[chunk.lat_start:chunk.lat_stop].ravel()
+    order = np.argsort(cell_ids) # Inserting in primary key order keeps the b-tree appends cheap
+    rows = zip(
+        repeat(run_id), repeat(leadtime_hours),
+        cell_ids[order].tolist(), values.ravel()[order].tolist()
+    )
+    with conn: # One transaction per chunk
+        conn.executemany(INSERT_FORECAST, rows)
+        conn.execute(INSERT_CHECKPOINT, (run_id, leadtime_hours, chunk.lat_start, chunk.lat_stop))
+        commit_start = time.perf_counter()
+    if progress: progress.commit(time.perf_counter() - commit_start)
+    return values.size
+
+
+def drop_indexes(conn:sqlite3.Connection):
+    """Secondary indexes slow a bulk load down. Drops the ones create_indexes makes."""
+    names = re.findall(r"CREATE INDEX IF NOT EXISTS (\w+)", INDEXES.read_text())
+    with conn:
+        for name in names:
+            conn.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+def create_indexes(conn:sqlite3.Connection):
+    start = time.perf_counter()
+    conn.executescript(INDEXES.read_text())
+    conn.execute("PRAGMA optimize;")
+    print(f"Indexes created in {time.perf_counter()-start:.2f}sec")
+
+
+def _iter_chunks(ds:xr.Dataset, meta:FileMeta, chunks:list[Chunk]):
+    """Reads only the hyperslab of each chunk from the file."""
+    data = ds.variables[meta.nc_variable]
+    for chunk in chunks:
+        # CAMS Europe files have a single (surface) level
+        yield chunk, hyperslab.read(data, (chunk.leadtime_idx, 0, slice(chunk.lat_start, chunk.lat_stop)))
+
+
+def _store_chunks(ds:xr.Dataset, db_connection_string:str, max_chunk_bytes:int=MAX_CHUNK_BYTES, restart:bool=False) -> int:
+    """Writes the dataset in chunks of leadtime and latitude band.
+
+    Every chunk is written with a single executemany inside its own transaction
+    together with its checkpoint, so an interrupted ingest continues from the
+    first unwritten chunk. restart ignores earlier checkpoints. Secondary indexes
+    are dropped for the load and rebuilt even when it fails. Returns the number of rows."""
+    meta = _file_meta(ds)
     with sqlite3.connect(db_connection_string) as conn:
-        cursor = conn.cursor()
         conn.execute("PRAGMA foreign_keys = ON;")
-        conn.commit()
-        start_time = time.perf_counter()
-        idx = 0
-        data_points = len(ds.time) * len(ds.level) * len(ds.latitude) * len(ds.longitude)
-        for leadtime_idx, ltime in enumerate(ds.time):
-            print("leadtime: " + str(leadtime_idx))
-            for level_idx, _ in enumerate(ds.level):
-                for lat_idx, lat in enumerate(ds.latitude):
-                    for lon_idx, lon in enumerate(ds.longitude):
-                        idx += 1
-                        print(f"{idx}/{data_points} {time.perf_counter()-start_time:.3f}sec", end="\r")
-
-                        variable_name = "PM10"
-                        unit_name = "μg/m3"
-                        value = float(ds.variables["pm10_conc"][leadtime_idx][level_idx][lat_idx][lon_idx].data)
-                        lon = round(float(lon), 2)
-                        lat = round(float(lat), 2)
-                        forecast_time = forecast_datetime.strftime("%Y/%m/%d %H:%M")
-                        leadtime = forecast_datetime + timedelta(microseconds=int(ltime)/1000)
-                        leadtime = leadtime.strftime("%Y/%m/%d %H:%M")
-                        model = "ENSEMBLE"
-                        hash = hash_data_entry({
-                            "variable_name":variable_name, 
-                            "unit_name":unit_name, 
-                            "value":value, 
-                            "lon":lon, 
-                            "lat":lat, 
-                            "time":forecast_time, 
-                            "leadtime":leadtime, 
-                            "model":model
-                        }) # NOTE Makes sure every entry is unique
-                        
-                        sql = """INSERT INTO forecasts 
-                        (variable_name, unit_name, value, lon, lat, datetime, leadtime, model, hash) 
-                        VALUES 
-                        (:variable_name, :unit_name, :value, :lon, :lat, :time, :leadtime, :model, :hash)"""
-                        try:
-                            cursor.execute(
-                                sql, 
-                                {
-                                    "variable_name":variable_name, 
-                                    "unit_name":unit_name, 
-                                    "value":value, 
-                                    "lon":lon, 
-                                    "lat":lat, 
-                                    "time":forecast_time, 
-                                    "leadtime":leadtime, 
-                                    "model":model, 
-                                    "hash": hash
-                                }
-                            )
-                            conn.commit()
-                        except sqlite3.IntegrityError as err:
-                            if str(err) != 'UNIQUE constraint failed: forecasts.hash':
-                                raise # hash estää meitä lisäämästä kahta samanlaista riviä
-
-        print(f"{idx}/{data_points} {time.perf_counter()-start_time:.3f}sec")
-
-
-def store_to_database(origin:str, db_connection_string:str):
+        run_id = _ensure_run(conn, meta)
+        if restart: _clear_checkpoints(conn, run_id)
+        chunks = _plan_chunks(meta, _completed(conn, meta), max_chunk_bytes)
+        progress = metrics.Progress("ingest", total=len(chunks))
+        drop_indexes(conn)
+        try:
+            for chunk, values in _iter_chunks(ds, meta, chunks):
+                progress.chunk(_write_chunk(conn, run_id, meta, chunk, values, progress), values.nbytes) # Time includes reading the chunk
+        finally:
+            create_indexes(conn) # An interrupted load must not leave the database without its indexes
+    generation.touch()
+
+    return progress.close()["rows"]
+
+
+def store_to_database(origin:str, db_connection_string:str, max_chunk_bytes:int=MAX_CHUNK_BYTES, restart:bool=False):
     print("Reading dataset...")
     filepath = find_nc_files.find_nc_file(origin)
     dataset:xr.Dataset = _get_data_set(filepath)
 
     print("Saving to db...")
-    _get_geodata(dataset, "pm10_conc", db_connection_string)
+    _store_chunks(dataset, db_connection_string, max_chunk_bytes, restart)
 
     print("Done.")
-    
+
+
+def _put(queue, stop, message) -> bool:
+    """Puts message on the queue unless the writer stopped. False when it did, the reader should return."""
+    while not stop.is_set():
+        try:
+            queue.put(message, timeout=QUEUE_TIMEOUT)
+            return True
+        except Full:
+            continue
+    return False
+
+
+def _read_file(path:str, queue, stop, db_connection_string:str, max_chunk_bytes:int, restart:bool):
+    """Process pool worker. Reads the unwritten chunks of a file and hands them to the writer through the queue.
+    Returns early when stop is set, the writer failed and nobody reads the queue anymore."""
+    try:
+        ds = _get_data_set(path)
+        meta = _file_meta(ds, path)
+        completed = {}
+        if not restart:
+            with sqlite3.connect(f"file:{db_connection_string}?mode=ro", uri=True) as conn:
+                completed = _completed(conn, meta)
+            conn.close()
+        chunks = _plan_chunks(meta, completed, max_chunk_bytes)
+        if not _put(queue, stop, ("file", path, (meta, len(chunks)))): return
+        for chunk, values in _iter_chunks(ds, meta, chunks):
+            if not _put(queue, stop, ("chunk", path, (chunk, values))): return
+        _put(queue, stop, ("done", path, None))
+    except Exception:
+        _put(queue, stop, ("error", path, traceback.format_exc()))
+
+
+def store_files(paths:list[str], db_connection_string:str, workers:int|None=None, max_chunk_bytes:int=MAX_CHUNK_BYTES, restart:bool=False) -> IngestResult:
+    """Ingests many files in parallel. Files are read in a process pool while this
+    process is the only one writing to SQLite. Returns rows written and paths that failed.
+
+    At most about (3 * workers + 1) * max_chunk_bytes is in memory: a chunk in every
+    worker, two per worker waiting in the queue and one being written.
+
+    A reader that dies without reporting, e.g. killed for memory or a broken pool, fails
+    its file instead of leaving the writer waiting. When writing fails, e.g. the database is
+    locked, the readers are stopped before the error is raised and indexes are created again."""
+    paths = [str(path) for path in paths]
+    if not paths: return IngestResult(0, [])
+    workers = workers or min(len(paths), os.cpu_count() or 1)
+    progress = metrics.Progress("ingest", total=0)
+    with (Manager() as manager,
+          ProcessPoolExecutor(max_workers=workers) as executor,
+          sqlite3.connect(db_connection_string) as conn):
+        conn.execute("PRAGMA foreign_keys = ON;")
+        queue = manager.Queue(maxsize=workers * 2) # Bounds chunks waiting in memory
+        stop = manager.Event()
+        drop_indexes(conn)
+        futures = {executor.submit(_read_file, path, queue, stop, db_connection_string, max_chunk_bytes, restart): path for path in paths}
+
+        files:dict[str, tuple[int, FileMeta]] = {}
+        finished:set[str] = set()
+        failed = []
+        try:
+            while len(finished) < len(paths):
+                try:
+                    kind, path, payload = queue.get(timeout=QUEUE_TIMEOUT)
+                except Empty:
+                    # A reader that returned has put all of its messages. If it never said done and none are waiting, it died
+                    dead = [(future, path) for future, path in futures.items() if future.done() and path not in finished]
+                    if not dead or not queue.empty(): continue
+                    future, path = dead[0]
+                    kind, payload = "error", f"Reader stopped without finishing: {future.exception()!r}"
+                if path in finished: continue
+                if kind == "file":
+                    meta, n_chunks = payload
+                    run_id = _ensure_run(conn, meta)
+                    if restart: _clear_checkpoints(conn, run_id)
+                    files[path] = (run_id, meta)
+                    progress.total += n_chunks
+                    print(f"Reading {meta.variable_name} {meta.model} {datetime.fromtimestamp(meta.base_time, timezone.utc):%Y/%m/%d %H:%M} {n_chunks} chunks {path}")
+                elif kind == "chunk":
+                    chunk, values = payload
+                    progress.chunk(_write_chunk(conn, *files[path], chunk, values, progress), values.nbytes)
+                elif kind == "done":
+                    finished.add(path)
+                    files.pop(path)
+                    print(f"{len(finished)}/{len(paths)} {path}")
+                elif kind == "error":
+                    finished.add(path)
+                    files.pop(path, None)
+                    failed.append(path)
+                    print(f"Failed {path}\n{payload}")
+        except BaseException:
+            # Readers blocked on the full queue would keep the pool from shutting down
+            stop.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+            while not all(future.done() for future in futures):
+                try:
+                    queue.get(timeout=0.1)
+                except Empty:
+                    pass
+            raise
+        finally:
+            create_indexes(conn) # drop_indexes above must not outlive a failed write
+
+    total_rows = progress.close()["rows"]
+    generation.touch()
+    print(f"{len(paths)-len(failed)}/{len(paths)} files")
+    for path in failed:
+        print(f"Failed: {path}")
+    return IngestResult(total_rows, failed)
+
+
+def store_directory(db_connection_string:str, workers:int|None=None, max_chunk_bytes:int=MAX_CHUNK_BYTES, restart:bool=False) -> IngestResult:
+    """Ingests every file under data/netcdf (every variable and every run)."""
+    paths = find_nc_files.nc_files()
+    print(f"Found {len(paths)} files")
+    return store_files(paths, db_connection_string, workers, max_chunk_bytes, restart)
+
+
+def store_columnar(path:str, root:Path=columnar.ROOT) -> tuple[int, int]:
+    """Writes every leadtime of a file to the columnar store (see columnar.py). Returns values and bytes written."""
+    ds = _get_data_set(path)
+    nc_variable = cams.data_variable(ds)
+    directory = columnar.run_dir(cams.variable_name(ds, nc_variable), cams.model_name(ds), cams.forecast_date(ds), root)
+    longitudes = np.round((ds.longitude.values + 180) % 360 - 180, 2)
+    latitudes = np.round(ds.latitude.values, 2)
+    columnar.write_coords(directory, longitudes, latitudes)
+    field = ds[nc_variable]
+    for leadtime_idx, hours in enumerate(cams.leadtime_hours(ds)):
+        columnar.write_leadtime(directory, int(hours), hyperslab.read(field, (leadtime_idx, 0))) # One leadtime in memory at a time
+    ds.close()
+    values = len(field.time) * len(latitudes) * len(longitudes)
+    return values, values * np.dtype(np.float32).itemsize
+
+
+def store_columnar_files(paths:list[str], workers:int|None=None, root:Path=columnar.ROOT) -> IngestResult:
+    """Writes many files to the columnar store in parallel. Every run has its own files, so workers write directly."""
+    paths = [str(path) for path in paths]
+    if not paths: return IngestResult(0, [])
+    workers = workers or min(len(paths), os.cpu_count() or 1)
+    failed = []
+    progress = metrics.Progress("columnar", total=len(paths))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {path: executor.submit(store_columnar, path, root) for path in paths}
+        for path, future in futures.items():
+            try:
+                progress.chunk(*future.result()) # A chunk is a file
+            except Exception:
+                failed.append(path)
+                print(f"Failed {path}\n{traceback.format_exc()}")
+
+    total_values = progress.close()["rows"]
+    generation.touch()
+    print(f"{len(paths)-len(failed)}/{len(paths)} files")
+    return IngestResult(total_values, failed)
 
 
 def main():
@@ -126,7 +407,9 @@ def main():
                     description='Creates geojsons from netCDF'
     )
     parser.add_argument("filepath", help="Filename or path. Can be partial path. File is expected to be in data-folder.")
+    metrics.add_arguments(parser)
     args = parser.parse_args()
+    metrics.configure_from(args)
     filename:str = args.filepath
 
     target = "AirQuality.db"
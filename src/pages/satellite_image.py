@@ -38,7 +38,7 @@ def map_figure(variable, geojson:GeoJSON):
     df:pd.DataFrame = geodata.get_dataframe(ForecastQuery(
         variable=variable,
         time=datetime(2025, 5, 10, 0, 0),
-        leadtimes=0,
+        leadtime=0,
         model=None,
         limits=None
     ))
@@ -1,9 +1,10 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 from collections import namedtuple
-from typing import TypeAlias, Literal, overload
+from typing import TypeAlias, Literal, Optional, overload
 
 import numpy as np
 import pandas as pd
+from scipy.spatial import cKDTree
 
 from src import geodata
 
@@ -11,13 +12,236 @@ from src import geodata
 Coordinate = namedtuple('Coordinate', ['lon', 'lat'])
 Intake = namedtuple('Intake', ['cubics', 'litres'])
 
+Interpolation: TypeAlias = Literal["nearest", "bilinear"]
+Resampling: TypeAlias = Literal["step", "linear"]
+
+MAX_EMPTY_CELLS = 3 # A regular grid may have up to 3 empty cells per cell with data, sparser data goes to the KD-tree
+
+
 def find_nearest(array, value):
     array = np.asarray(array)
     idx = (np.abs(array - value)).argmin()
     return array[idx]
 
 
-def accumulation(dataset:pd.DataFrame, location:Coordinate, exposure_start:datetime, exposure_end:datetime, air_intake_cubics_per_minute:float=None, air_intake_litres_per_minute:float=None):
+def _axis(values:np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Sorted distinct values and the position of every value in them. Hashing and a binary search
+    over the few distinct values instead of sorting every row like np.unique."""
+    axis = np.sort(pd.unique(values))
+    return axis, np.searchsorted(axis, values)
+
+
+def _regular_step(axis:np.ndarray) -> float|None:
+    """Spacing of an ascending axis, None if the spacing is not even."""
+    if len(axis) < 2: return 1.0
+    steps = np.diff(axis)
+    step = (axis[-1] - axis[0]) / (len(axis) - 1)
+    return step if np.abs(steps - step).max() <= 1e-3 * step else None
+
+
+class GridIndex:
+    """Point lookups of a tidy forecast frame (value, lon, lat, leadtime) in constant time.
+
+    The frame is unpacked once into a (leadtime, cell) array. On a regular grid like the
+    CAMS 0.1 degree grid the cell of a coordinate is computed from the grid origin and
+    spacing, other frames find the nearest cell with a KD-tree. series() of the nearest
+    cell is a view of one column, no rows of the frame are filtered.
+
+        index = GridIndex(geodata.get_dataframe(query))
+        values = index.series(Coordinate(2.35, 48.85))
+    """
+
+    def __init__(self, dataset:pd.DataFrame):
+        self.leadtimes, leadtime = _axis(dataset["leadtime"].to_numpy())
+        self.longitudes, lon = _axis(dataset["lon"].to_numpy(dtype=np.float64))
+        self.latitudes, lat = _axis(dataset["lat"].to_numpy(dtype=np.float64))
+        self.lon_step = _regular_step(self.longitudes)
+        self.lat_step = _regular_step(self.latitudes)
+        n_cells = len(self.longitudes) * len(self.latitudes)
+        self.regular = self.lon_step is not None and self.lat_step is not None and n_cells <= (MAX_EMPTY_CELLS + 1) * len(dataset)
+        if self.regular:
+            cell = lat * len(self.longitudes) + lon # Row major (lat, lon)
+            self.regular = n_cells <= (MAX_EMPTY_CELLS + 1) * np.count_nonzero(np.bincount(cell, minlength=n_cells))
+        if self.regular:
+            self.tree = None
+        else:
+            points, cell = np.unique(np.column_stack([self.longitudes[lon], self.latitudes[lat]]), axis=0, return_inverse=True)
+            self.tree = cKDTree(points)
+            n_cells = len(points)
+
+        self.values = np.full((len(self.leadtimes), n_cells), np.nan)
+        self.present = np.zeros((len(self.leadtimes), n_cells), dtype=bool) # Whether the frame has a row of the leadtime and cell
+        self.values[leadtime, cell] = dataset["value"].to_numpy(dtype=np.float64)
+        self.present[leadtime, cell] = True
+
+    def _position(self, axis:np.ndarray, step:float, value:float) -> float:
+        """Fractional index of value on a regular axis, clamped to the axis."""
+        return min(max((value - axis[0]) / step, 0.0), len(axis) - 1.0)
+
+    def cell(self, location:Coordinate) -> int:
+        """Column of the cell nearest to the location."""
+        if not self.regular:
+            return int(self.tree.query((location.lon, location.lat))[1])
+        col = int(np.floor(self._position(self.longitudes, self.lon_step, location.lon) + 0.5))
+        row = int(np.floor(self._position(self.latitudes, self.lat_step, location.lat) + 0.5))
+        return row * len(self.longitudes) + col
+
+    def _lookup(self, location:Coordinate, method:Interpolation="nearest") -> tuple[np.ndarray, np.ndarray]:
+        """(values, present) of every leadtime at the location."""
+        if method == "nearest":
+            cell = self.cell(location)
+            return self.values[:, cell], self.present[:, cell]
+        if method != "bilinear":
+            raise ValueError(f"Unknown interpolation {method}. Choose from nearest and bilinear")
+        if not self.regular:
+            raise ValueError("Bilinear interpolation needs a regular grid")
+        x = self._position(self.longitudes, self.lon_step, location.lon)
+        y = self._position(self.latitudes, self.lat_step, location.lat)
+        col, row = min(int(x), len(self.longitudes) - 2), min(int(y), len(self.latitudes) - 2)
+        col, row = max(col, 0), max(row, 0) # Axes of a single cell
+        fx, fy = x - col, y - row
+        values = np.zeros(len(self.leadtimes))
+        present = np.ones(len(self.leadtimes), dtype=bool)
+        for r, c, weight in ((row, col, (1-fx)*(1-fy)), (row, col+1, fx*(1-fy)), (row+1, col, (1-fx)*fy), (row+1, col+1, fx*fy)):
+            if weight == 0: continue # Also keeps the lookup inside axes of one cell
+            cell = r * len(self.longitudes) + c
+            values += weight * self.values[:, cell]
+            present &= self.present[:, cell]
+        return values, present
+
+    def series(self, location:Coordinate, method:Interpolation="nearest") -> np.ndarray:
+        """Value of every leadtime (self.leadtimes) at the location, NaN where the frame has none.
+        nearest returns a view of the cell's column, bilinear weighs the four surrounding cells."""
+        return self._lookup(location, method)[0]
+
+
+class TimeSeries:
+    """Values of many cells over time, resampled and integrated over many windows in one call.
+
+    values are (time, cell) samples at the ascending times, e.g. leadtime hours. With step
+    resampling a sample holds until the next one and the last one for last more; linear
+    draws straight lines between samples and ends at the last one. Missing values are NaN,
+    a window that overlaps one is NaN too.
+
+    The integral from the first sample up to every sample is summed once, so the integral
+    of any window is F(end) - F(start): two binary searches however long the window is.
+
+        series = TimeSeries.of(index, datetime(2025, 5, 10), [Coordinate(2.35, 48.85)])
+        doses = series.integrate(starts, ends) # (window, cell) in value * hours
+
+    Times are numbers in units of unit (an hour by default) after base_time, or datetimes
+    when base_time is given, so windows may run past midnight and over several days.
+    """
+
+    def __init__(self, times:np.ndarray, values:np.ndarray, resampling:Resampling="step", last:Optional[float]=None,
+                 base_time:Optional[datetime]=None, unit:timedelta=timedelta(hours=1)):
+        if resampling not in ("step", "linear"):
+            raise ValueError(f"Unknown resampling {resampling}. Choose from step and linear")
+        self.times = np.asarray(times, dtype=np.float64)
+        self.values = np.asarray(values, dtype=np.float64).reshape(len(self.times), -1)
+        if not len(self.times):
+            raise ValueError("A time series needs at least one sample")
+        if np.any(np.diff(self.times) <= 0):
+            raise ValueError("Times of a time series must be ascending and distinct")
+        self.resampling = resampling
+        self.base_time = base_time
+        self.unit = unit
+
+        steps = np.diff(self.times)
+        if resampling == "step":
+            last = (steps[-1] if len(steps) else 1.0) if last is None else float(last)
+            self.widths = np.append(steps, last)
+            self.end = self.times[-1] + last
+            missing = np.isnan(self.values)
+        else:
+            self.widths = steps
+            self.end = self.times[-1]
+            missing = np.isnan(self.values[:-1]) | np.isnan(self.values[1:])
+        self._values = np.nan_to_num(self.values) # Missing values count as 0 in the sums, _missing remembers them
+        self._slopes = np.diff(self._values, axis=0) / steps[:, None] if resampling == "linear" else None
+        if resampling == "step":
+            areas = self._values * self.widths[:, None]
+        else:
+            areas = (self._values[:-1] + self._values[1:]) / 2 * self.widths[:, None]
+        self._cumulative = np.vstack([np.zeros((1, self.values.shape[1])), np.cumsum(areas, axis=0)]) # Integral up to each interval
+        self._missing = np.vstack([np.zeros((1, self.values.shape[1]), dtype=np.int64), np.cumsum(missing, axis=0)])
+
+    @classmethod
+    def of(cls, index:"GridIndex", base_time:Optional[datetime]=None, locations:Optional[list[Coordinate]]=None,
+           method:Interpolation="nearest", resampling:Resampling="step") -> "TimeSeries":
+        """Leadtime series of every cell of the index, or of the locations in their order."""
+        if locations is None:
+            values = np.where(index.present, index.values, np.nan)
+        else:
+            lookups = [index._lookup(location, method) for location in locations]
+            values = np.column_stack([np.where(present, values, np.nan) for values, present in lookups])
+        return cls(index.leadtimes, values, resampling, base_time=base_time)
+
+    def offsets(self, times) -> np.ndarray:
+        """Times as numbers of units after base_time. Numbers are offsets already."""
+        times = np.atleast_1d(np.asarray(times))
+        if self.base_time is None or np.issubdtype(times.dtype, np.number):
+            return times.astype(np.float64)
+        return (times.astype("datetime64[us]") - np.datetime64(self.base_time, "us")) / np.timedelta64(self.unit)
+
+    def _check(self, times:np.ndarray):
+        if len(times) and (times.min() < self.times[0] or times.max() > self.end):
+            raise ValueError(f"Times must be within the series, {self.times[0]} to {self.end} units after its base time")
+
+    def _interval(self, times:np.ndarray, side:Literal["left", "right"]) -> np.ndarray:
+        """Interval of every time. An end on a sample is in the interval before it (side left)."""
+        return np.clip(np.searchsorted(self.times, times, side=side) - 1, 0, len(self.widths) - 1)
+
+    def _cumulative_at(self, times:np.ndarray, interval:np.ndarray) -> np.ndarray:
+        """Integral from the first sample to times, (time, cell)."""
+        dt = (times - self.times[interval])[:, None]
+        area = self._cumulative[interval] + self._values[interval] * dt
+        if self.resampling == "linear":
+            area += self._slopes[interval] * dt**2 / 2
+        return area
+
+    def at(self, times) -> np.ndarray:
+        """Resampled values at the times, (time, cell)."""
+        times = self.offsets(times)
+        self._check(times)
+        if len(self.times) == 1:
+            return np.repeat(self.values, len(times), axis=0)
+        interval = self._interval(times, "right")
+        if self.resampling == "step":
+            return self.values[interval]
+        dt = (times - self.times[interval])[:, None]
+        return self.values[interval] + (self.values[interval + 1] - self.values[interval]) * dt / self.widths[interval, None]
+
+    def integrate(self, starts, ends) -> np.ndarray:
+        """Integral over every window [start, end], (window, cell) in value * unit. NaN where a window overlaps missing values."""
+        starts, ends = np.broadcast_arrays(self.offsets(starts), self.offsets(ends))
+        if np.any(ends < starts):
+            raise ValueError("Windows can not end before they start")
+        self._check(starts)
+        self._check(ends)
+        if self.resampling == "linear" and len(self.times) == 1:
+            return np.zeros((len(starts), self.values.shape[1])) # A single sample spans no time
+        first, last = self._interval(starts, "right"), self._interval(ends, "left")
+        integral = self._cumulative_at(ends, last) - self._cumulative_at(starts, first)
+        missing = (self._missing[last + 1] - self._missing[first]) > 0
+        integral[missing & (ends > starts)[:, None]] = np.nan
+        integral[ends == starts] = 0
+        return integral
+
+    def mean(self, starts, ends) -> np.ndarray:
+        """Time weighted mean over every window, e.g. the daily mean of each cell. (window, cell)"""
+        starts, ends = np.broadcast_arrays(self.offsets(starts), self.offsets(ends))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return self.integrate(starts, ends) / (ends - starts)[:, None]
+
+
+def accumulation(dataset:pd.DataFrame|GridIndex, location:Coordinate, exposure_start:datetime, exposure_end:datetime, air_intake_cubics_per_minute:float=None, air_intake_litres_per_minute:float=None,
+                 method:Interpolation="nearest", resampling:Resampling="step", base_time:Optional[datetime]=None):
+    """Pollutants inhaled at the location between exposure_start and exposure_end. Leadtimes count from
+    base_time, midnight of the day the exposure starts by default, so exposures may continue over midnight
+    and over several days. step takes the forecast of an hour for the whole hour, linear interpolates between hours.
+    Pass a GridIndex of the frame instead of the frame when calling many times, a frame is searched on every call.
+    Many locations and exposures at once are quicker with TimeSeries."""
     if air_intake_cubics_per_minute and air_intake_litres_per_minute:
         raise ValueError("Give only either air_intake_cubics_per_minute or air_intake_litres_per_minute")
     if exposure_end < exposure_start:
@@ -25,24 +249,29 @@ def accumulation(dataset:pd.DataFrame, location:Coordinate, exposure_start:datet
     if exposure_start == exposure_end: return 0
 
     # Find data at exposure location
-    nearest_lon = find_nearest(dataset["lon"], location.lon)
-    nearest_lat = find_nearest(dataset["lat"], location.lat)
-    df = dataset[dataset["lon"] == nearest_lon]
-    df = df[df["lat"] == nearest_lat]
-    if len(df) == 0: raise ValueError("No data within exposure area")
-
-    # Find data within exposure time
-    start_time = exposure_start.hour
-    end_time = exposure_end.hour
-    if exposure_end.minute: end_time += 1
-    df = df[df["leadtime"] >= start_time][df["leadtime"] < end_time]
-    if exposure_end.hour > dataset["leadtime"].max(): raise ValueError("Exposure end time is too far into future")
-    if len(df) == 0: raise ValueError("No data within exposure time")
-
-    first_hour = df.iloc[:1]
-    mid_hours = df.iloc[1:-1]
-    last_hour = df.iloc[-1:]
-    #last_hour:pd.Series = df.iloc[-1] if len(df) > 1 else df.iloc[0]
+    if isinstance(dataset, GridIndex):
+        index = dataset
+        last_leadtime = index.leadtimes.max()
+    elif method == "nearest":
+        # One call does not pay back indexing the whole frame, index only the rows of the nearest cell
+        nearest = (dataset["lon"] == find_nearest(dataset["lon"], location.lon)) & (dataset["lat"] == find_nearest(dataset["lat"], location.lat))
+        if not nearest.any(): raise ValueError("No data within exposure area")
+        index = GridIndex(dataset[nearest])
+        last_leadtime = dataset["leadtime"].max()
+    else:
+        index = GridIndex(dataset)
+        last_leadtime = index.leadtimes.max()
+    values, present = index._lookup(location, method)
+    if not present.any(): raise ValueError("No data within exposure area")
+
+    # Minutes after the base time, exposures of whole minutes sum exactly. Leadtimes count from midnight of the start day by default
+    base_time = base_time or datetime(exposure_start.year, exposure_start.month, exposure_start.day)
+    series = TimeSeries(index.leadtimes * 60, np.where(present, values, np.nan), resampling, last=60, base_time=base_time, unit=timedelta(minutes=1))
+    start, end = series.offsets([exposure_start, exposure_end])
+    if end // 60 > last_leadtime: raise ValueError("Exposure end time is too far into future")
+    if start < series.times[0] or end > series.end: raise ValueError("No data within exposure time")
+    inhaled_minutes = series.integrate(start, end)[0, 0] # value * minutes
+    if np.isnan(inhaled_minutes): raise ValueError("Missing data within exposure time")
 
     # Set intake and multiplier
     if isinstance(air_intake_cubics_per_minute, int):
@@ -52,37 +281,7 @@ def accumulation(dataset:pd.DataFrame, location:Coordinate, exposure_start:datet
         in_take = air_intake_litres_per_minute
         multiplier = 0.001
 
-    exposed_time = exposure_end - exposure_start
-    hours_exposed = exposed_time.total_seconds() / 3600
-
-    inhaled_pollutants_accumulation:float = 0
-    if hours_exposed == 0: return 0
-    if hours_exposed <= 1:
-        if exposure_start.hour == exposure_end.hour:
-            minutes_exposed = exposure_end.minute - exposure_start.minute
-        else:
-            minutes_exposed = 60 - exposure_start.minute + exposure_end.minute
-        pollutants_in_unit_of_air:float = df.iloc[0]["value"] * multiplier # 1 or 0.001
-        return pollutants_in_unit_of_air * minutes_exposed * in_take
-    if hours_exposed < 2: mid_hours = df.iloc[0:0] # Empty
-    
-    # Calculate exposure amount
-    for row in first_hour.iterrows():
-        pollutants_in_unit_of_air:float = row[1]["value"] * multiplier # 1 or 0.001
-        minutes_exposed = 60 - exposure_start.minute
-        inhaled_pollutants_accumulation += pollutants_in_unit_of_air * minutes_exposed * in_take
-    
-    for row in mid_hours.iterrows():
-        pollutants_in_unit_of_air:float = row[1]["value"] * multiplier # 1 or 0.001
-        minutes_exposed = 60
-        inhaled_pollutants_accumulation += pollutants_in_unit_of_air * minutes_exposed * in_take
-    
-    for row in last_hour.iterrows():
-        pollutants_in_unit_of_air:float = row[1]["value"] * multiplier # 1 or 0.001
-        minutes_exposed = 60 - exposure_end.minute
-        inhaled_pollutants_accumulation += pollutants_in_unit_of_air * minutes_exposed * in_take
-
-    return inhaled_pollutants_accumulation
+    return inhaled_minutes * multiplier * in_take
 
 
 
@@ -91,7 +290,7 @@ if __name__ == "__main__":
     query = geodata.ForecastQuery(
         variable="PM10",
         time=datetime(2025, 5, 10, 0, 0),
-        leadtimes=0,
+        leadtime=0,
         model=None,
         limits={"north": 60.5, "south": 60, "west": 20, "east": 20.5}
     )
@@ -0,0 +1,127 @@
+"""Read-only SQLite connections for the query layer, one per thread.
+
+Every thread gets its own connection (sqlite3 connections must not be shared
+between threads) and keeps it for later queries. Connections are read-only,
+the database is switched to WAL once so readers never block the ingest and
+the ingest never blocks readers. Statements are compiled once per connection
+and reused from the sqlite3 statement cache, which is keyed by the SQL text,
+so queries should use parameters instead of formatting values into SQL.
+
+A thread that ends takes its connection with it.
+"""
+import time
+import sqlite3
+import threading
+import weakref
+from pathlib import Path
+
+
+CACHE_SIZE_KIB = 64 * 1024 # Page cache per connection
+MMAP_SIZE = 256 * 2**20 # Bytes of the file read through a memory map instead of read() calls
+CACHED_STATEMENTS = 64
+
+
+class _Connection(sqlite3.Connection):
+    """sqlite3.Connection itself cannot be weakly referenced, a subclass can."""
+
+
+class ConnectionPool:
+    """Thread local read-only connections to one database file."""
+
+    def __init__(self, path:str|Path, cache_size_kib:int=CACHE_SIZE_KIB, mmap_size:int=MMAP_SIZE, cached_statements:int=CACHED_STATEMENTS):
+        self.path = Path(path)
+        self.cache_size_kib = cache_size_kib
+        self.mmap_size = mmap_size
+        self.cached_statements = cached_statements
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections:weakref.WeakSet[_Connection] = weakref.WeakSet() # Only connections of live threads
+        self._wal_checked = False
+        self.opened = 0
+        self.reused = 0
+        self.queries = 0
+        self.query_seconds = 0.0
+
+    def _enable_wal(self):
+        """journal_mode is stored in the file, a read-only connection cannot change it."""
+        with self._lock:
+            if self._wal_checked: return
+            self._wal_checked = True
+        try:
+            conn = sqlite3.connect(self.path)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.close()
+        except sqlite3.OperationalError:
+            pass # Read-only file system or the ingest holds a lock. Rollback journal still works
+
+    def connection(self) -> sqlite3.Connection:
+        """Connection of the calling thread. Raises sqlite3.OperationalError if the database does not exist."""
+        conn = getattr(self._local, "connection", None)
+        if conn is not None:
+            with self._lock:
+                self.reused += 1
+            return conn
+        if not self.path.exists():
+            raise sqlite3.OperationalError(f"Database {self.path} does not exist. See reset_db.ps1")
+        self._enable_wal()
+        conn = sqlite3.connect(
+            f"{self.path.absolute().as_uri()}?mode=ro", uri=True, cached_statements=self.cached_statements, factory=_Connection
+        )
+        conn.execute(f"PRAGMA cache_size=-{int(self.cache_size_kib)}")
+        conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        self._local.connection = conn
+        with self._lock:
+            self._connections.add(conn)
+            self.opened += 1
+        return conn
+
+    def execute(self, sql:str, parameters:dict|tuple=()) -> list[tuple]:
+        """Runs a query on the calling thread's connection and returns every row."""
+        start = time.perf_counter()
+        rows = self.connection().execute(sql, parameters).fetchall()
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.queries += 1
+            self.query_seconds += elapsed
+        return rows
+
+    def iterate(self, sql:str, parameters:dict|tuple=(), size:int=10_000):
+        """Runs a query on the calling thread's connection and yields its rows size at a time.
+        query_seconds counts the time SQLite spends, not the time the caller holds the rows.
+        The cursor is closed when the caller stops early too, an open cursor keeps a read
+        transaction that stops WAL checkpoints."""
+        start = time.perf_counter()
+        cursor = self.connection().execute(sql, parameters)
+        elapsed = time.perf_counter() - start
+        try:
+            while True:
+                start = time.perf_counter()
+                rows = cursor.fetchmany(size)
+                elapsed += time.perf_counter() - start
+                if not rows: break
+                yield rows
+        finally:
+            cursor.close()
+            with self._lock:
+                self.queries += 1
+                self.query_seconds += elapsed
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "path": str(self.path),
+                "open_connections": len(self._connections),
+                "opened": self.opened,
+                "reused": self.reused,
+                "queries": self.queries,
+                "query_seconds": self.query_seconds,
+                "mean_query_seconds": self.query_seconds / self.queries if self.queries else 0.0,
+            }
+
+    def close(self):
+        """Closes the calling thread's connection. Other threads close theirs when they end."""
+        conn = getattr(self._local, "connection", None)
+        if conn is not None:
+            self._local.connection = None
+            conn.close()
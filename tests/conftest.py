@@ -0,0 +1,72 @@
+import sys
+import sqlite3
+from pathlib import Path
+
+import numpy as np
+import pytest
+import xarray as xr
+
+# The ingest scripts run from src/ and import their siblings directly (import cams, import nc_to_db)
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from src import geodata
+
+
+SCHEMA = Path(__file__).parent.parent / "air_quality.schema"
+
+
+def _write_forecast(path, value:float, variable:str="pm10_conc", date:str="20250510"):
+    values = np.full((2, 1, 3, 4), value, dtype=np.float32)
+    ds = xr.Dataset(
+        {variable: (("time", "level", "latitude", "longitude"), values)},
+        coords={
+            "longitude": [359.85, 359.95, 0.05, 0.15],
+            "latitude": [60.25, 60.15, 60.05],
+            "level": [0.0],
+            "time": [0.0, 1.0],
+        },
+        attrs={"FORECAST": f"Europe, {date}+[0H_1H]", "source": "Data from ENSEMBLE model"},
+    )
+    path.parent.mkdir(parents=True, exist_ok=True)
+    ds.to_netcdf(path)
+
+
+def _rows(db) -> list[tuple]:
+    with sqlite3.connect(db) as conn:
+        result = conn.execute("SELECT run_id, leadtime_hours, cell_id, value FROM forecast_values ORDER BY 1, 2, 3").fetchall()
+    conn.close()
+    return result
+
+
+@pytest.fixture
+def write_forecast():
+    """Writes a 2 leadtime, 3x4 cell ENSEMBLE forecast file: write_forecast(path, value, variable=..., date=...)"""
+    return _write_forecast
+
+
+@pytest.fixture
+def forecasts(tmp_path, monkeypatch):
+    monkeypatch.setattr(geodata, "FORECASTS_DIR", tmp_path)
+    monkeypatch.setattr(geodata, "DATASETS", geodata.DatasetCache(max_open=2))
+    monkeypatch.setattr(geodata, "RESULTS", geodata.ResultCache())
+    _write_forecast(tmp_path / "EU-forecast-PM10-2025-05-10-1" / "ENS_FORECAST.nc", 1)
+    _write_forecast(tmp_path / "EU-forecast-nitrogen_dioxide-2025-05-10-1" / "ENS_FORECAST.nc", 2, variable="no2_conc")
+    _write_forecast(tmp_path / "EU-forecast-PM10-2025-05-11-1" / "ENS_FORECAST.nc", 3, date="20250511")
+    yield tmp_path
+    geodata.DATASETS.clear()
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path) # data/netcdf and data/.generation are relative to the working directory
+    path = tmp_path / "AirQuality.db"
+    with sqlite3.connect(path) as conn:
+        conn.executescript(SCHEMA.read_text())
+    conn.close()
+    return path
+
+
+@pytest.fixture
+def rows():
+    """Reads the forecast values of a database as (run_id, leadtime_hours, cell_id, value) rows: rows(db)"""
+    return _rows
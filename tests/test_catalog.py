@@ -0,0 +1,75 @@
+import os
+import time
+from datetime import datetime
+
+import xarray as xr
+
+from src import cams
+from src import catalog
+
+
+def describe(path:str) -> dict:
+    with xr.open_dataset(path, decode_timedelta=False) as ds:
+        return cams.describe(ds)
+
+
+def test_catalog_finds_runs_from_headers_and_persists_them(tmp_path, write_forecast):
+    write_forecast(tmp_path / "forecasts" / "EU-forecast-PM10-2025-05-10-1" / "ENS_FORECAST.nc", 1)
+    write_forecast(tmp_path / "forecasts" / "EU-forecast-nitrogen_dioxide-2025-05-10-1" / "ENS_FORECAST.nc", 2, variable="no2_conc")
+    (tmp_path / "forecasts" / "broken.nc").write_text("not netCDF")
+    files = catalog.Catalog(tmp_path, describe)
+
+    entry = files.find("NO2", datetime(2025, 5, 10))
+    assert entry.path.endswith(os.path.join("EU-forecast-nitrogen_dioxide-2025-05-10-1", "ENS_FORECAST.nc"))
+    assert (entry.model, entry.date, entry.first_leadtime, entry.last_leadtime) == ("ENSEMBLE", "2025-05-10", 0, 1)
+    assert (entry.n_lat, entry.n_lon, entry.north, entry.west) == (3, 4, 60.25, 0.05)
+    assert files.find("NO2", datetime(2025, 5, 10), "CHIMERE") is None
+    assert files.find("PM10", datetime(2025, 5, 11)) is None
+    assert len(files.by_name("ENS_FORECAST.nc")) == 2
+    assert [entry.variable for entry in files.entries()] == ["PM10", "NO2", None]
+
+    reopened = catalog.Catalog(tmp_path, describe)
+    assert reopened.find("PM10", "2025-05-10").variable == "PM10"
+    assert reopened.described == 0
+
+
+def test_catalog_refreshes_added_changed_and_removed_files(tmp_path, write_forecast):
+    first = tmp_path / "EU-forecast-PM10-2025-05-10-1" / "ENS_FORECAST.nc"
+    write_forecast(first, 1)
+    files = catalog.Catalog(tmp_path, describe, miss_interval=0)
+    assert files.find("PM10", datetime(2025, 5, 10)) is not None
+    assert files.refresh() == 0 and files.described == 1
+
+    write_forecast(tmp_path / "EU-forecast-PM10-2025-05-11-1" / "ENS_FORECAST.nc", 3, date="20250511")
+    assert files.find("PM10", datetime(2025, 5, 11)) is not None
+    assert files.described == 2
+
+    write_forecast(first, 1, variable="o3_conc")
+    stat = first.stat()
+    os.utime(first, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert files.find("PM10", datetime(2025, 5, 10)) is None
+    assert files.find("O3", datetime(2025, 5, 10)).path == str(first)
+
+    first.unlink()
+    assert files.find("O3", datetime(2025, 5, 10)) is None
+    assert str(first) not in files
+
+
+def test_repeated_misses_do_not_walk_the_directory_again(tmp_path, write_forecast):
+    write_forecast(tmp_path / "EU-forecast-PM10-2025-05-10-1" / "ENS_FORECAST.nc", 1)
+    files = catalog.Catalog(tmp_path, describe, miss_interval=0.2)
+    assert files.find("PM10", datetime(2025, 5, 10)) is not None
+    refreshes = files.refreshes
+
+    time.sleep(0.2)
+    for _ in range(5):
+        assert files.find("NO2", datetime(2025, 5, 10)) is None
+        assert files.by_name("CHIMERE_FORECAST.nc") == []
+        assert str(tmp_path / "missing.nc") not in files
+    assert files.refreshes == refreshes + 1 # Only the first miss walked
+
+    write_forecast(tmp_path / "EU-forecast-PM10-2025-05-11-1" / "ENS_FORECAST.nc", 3, date="20250511")
+    assert files.find("PM10", datetime(2025, 5, 11)) is None # Landed, not walked yet
+    time.sleep(0.2)
+    assert files.find("PM10", datetime(2025, 5, 11)) is not None
+    assert files.refreshes == refreshes + 2
@@ -0,0 +1,456 @@
+import os
+import asyncio
+import sqlite3
+from pathlib import Path
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from src import cams
+from src import geodata
+
+
+@pytest.fixture
+def write_varied(write_forecast):
+    def write(path, missing:bool=True) -> Path:
+        """O3 forecast like write_forecast whose values are their position in the file, one of them missing."""
+        write_forecast(path, 0, variable="o3_conc")
+        with xr.open_dataset(path) as ds:
+            varied = ds.load()
+        varied["o3_conc"].values = np.arange(24, dtype=np.float32).reshape(2, 1, 3, 4)
+        if missing: varied["o3_conc"].values[1, 0, 2, 1] = np.nan
+        varied.to_netcdf(path)
+        return path
+    return write
+
+
+def test_forecast_path_is_resolved_from_variable_and_run(forecasts):
+    assert geodata.forecast_path("PM10", datetime(2025, 5, 10)).parent.name == "EU-forecast-PM10-2025-05-10-1"
+    assert geodata.forecast_path("PM10", datetime(2025, 5, 11)).parent.name == "EU-forecast-PM10-2025-05-11-1"
+    assert geodata.forecast_path("NO2", datetime(2025, 5, 10)).parent.name == "EU-forecast-nitrogen_dioxide-2025-05-10-1"
+    with pytest.raises(FileNotFoundError):
+        geodata.forecast_path("O3", datetime(2025, 5, 10))
+
+
+def test_dataset_cache_reuses_handles(forecasts):
+    query = geodata.ForecastQuery("PM10", datetime(2025, 5, 10), 1, None, None)
+    first = geodata.query_forecast_nc(query)
+    misses = geodata.DATASETS.misses
+    second = geodata.query_forecast_nc(query)
+    assert geodata.DATASETS.misses == misses
+    assert first.equals(second)
+    assert (second["value"] == 1).all()
+
+
+def test_dataset_cache_is_bounded(forecasts):
+    for day, variable in ((10, "PM10"), (10, "NO2"), (11, "PM10")):
+        geodata.query_forecast_nc(geodata.ForecastQuery(variable, datetime(2025, 5, day), 0, None, None))
+    assert len(geodata.DATASETS) == 2
+
+
+def test_dataset_cache_reopens_changed_file(forecasts):
+    path = geodata.forecast_path("PM10", datetime(2025, 5, 10))
+    first = geodata.DATASETS.get(path)
+    assert geodata.DATASETS.get(path) is first
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert geodata.DATASETS.get(path) is not first
+
+
+def test_multi_leadtime_frame_is_one_ordered_slab(forecasts):
+    query = geodata.ForecastMultiQuery("PM10", datetime(2025, 5, 10), [1, 0], None, {"north": 61, "south": 60, "west": -0.1, "east": 1})
+    slab = geodata.read_slab_nc(query)
+    assert slab.values.shape == (2, 3, 3)
+    df = geodata.get_dataframe(query)
+    assert df["leadtime"].tolist() == [0.0] * 9 + [1.0] * 9
+    single = geodata.get_dataframe(geodata.ForecastQuery("PM10", datetime(2025, 5, 10), 0, None, query.limits))
+    assert df.iloc[:9].equals(single)
+    with pytest.raises(ValueError):
+        geodata.read_slab_nc(geodata.ForecastQuery("PM10", datetime(2025, 5, 10), 5, None, None))
+
+
+def test_grid_window_wraps_longitudes_and_handles_descending_latitudes():
+    longitudes = np.array([359.85, 359.95, 0.05, 0.15])
+    latitudes = np.array([60.25, 60.15, 60.05])
+    values = np.arange(12).reshape(3, 4)
+    window = geodata.grid_window(longitudes, latitudes, {"north": 60.2, "south": 60.0, "west": -0.1, "east": 0.2})
+    assert window.longitudes.tolist() == pytest.approx([-0.05, 0.05, 0.15])
+    assert window.latitudes.tolist() == [60.15, 60.05]
+    assert values[window.lat, window.lon].tolist() == [[5, 6, 7], [9, 10, 11]]
+    assert np.shares_memory(values[window.lat, window.lon], values)
+
+
+def test_grid_window_bounds_are_strict():
+    longitudes = np.array([0.0, 1.0, 2.0, 3.0])
+    latitudes = np.array([3.0, 2.0, 1.0, 0.0])
+    window = geodata.grid_window(longitudes, latitudes, {"north": 3.0, "south": 0.0, "west": 0.0, "east": 3.0})
+    assert window.longitudes.tolist() == [1.0, 2.0]
+    assert window.latitudes.tolist() == [2.0, 1.0]
+
+
+def test_grid_window_across_the_seam_of_global_grid():
+    longitudes = np.arange(0.05, 360, 0.1)
+    latitudes = np.arange(89.95, -90, -0.1)
+    window = geodata.grid_window(longitudes, latitudes, {"north": 1, "south": -1, "west": -0.3, "east": 0.3})
+    assert np.round(window.longitudes, 2).tolist() == [-0.25, -0.15, -0.05, 0.05, 0.15, 0.25]
+    assert np.all(np.diff(window.longitudes) > 0)
+
+
+def test_grid_window_outside_grid_is_empty():
+    window = geodata.grid_window(np.array([0.05, 0.15]), np.array([60.15, 60.05]), {"north": 10, "south": 0, "west": 0, "east": 1})
+    assert len(window.latitudes) == 0
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    path = tmp_path / "AirQuality.db"
+    with sqlite3.connect(path) as conn:
+        conn.executescript((Path(__file__).parent.parent / "air_quality.schema").read_text())
+        conn.execute("INSERT INTO variables (short_name) VALUES ('PM10')")
+        conn.execute("INSERT INTO units (name) VALUES ('μg/m3')")
+        conn.execute("INSERT INTO runs (variable_name, unit_name, model, base_time) VALUES ('PM10', 'μg/m3', 'ENSEMBLE', ?)", (cams.unix_time(datetime(2025, 5, 10)),))
+        cells = [(int(cams.cell_id(lon, 60.05)), lon, 60.05) for lon in (20.05, 20.15)]
+        conn.executemany("INSERT INTO grid_cells (id, lon, lat) VALUES (?, ?, ?)", cells)
+        conn.executemany("INSERT INTO forecast_values VALUES (1, ?, ?, ?)", [(hour, id, hour + 1.0) for hour in (0, 1, 2) for id, _, _ in cells])
+    conn.close()
+    monkeypatch.setattr(geodata, "DB_POOL", geodata.DB_POOL)
+    monkeypatch.setattr(geodata, "RESULTS", geodata.ResultCache())
+    geodata.set_database(path)
+    return path
+
+
+def test_db_queries_reuse_thread_local_connections(database):
+    query = geodata.ForecastQuery("PM10", datetime(2025, 5, 10), [0, 2], None, None)
+    with ThreadPoolExecutor(2) as executor:
+        frames = list(executor.map(geodata.query_forecast_db, [query] * 6))
+    assert all(sorted(df["value"].tolist()) == [1.0, 1.0, 3.0, 3.0] for df in frames)
+    stats = geodata.pool_stats()
+    assert stats["queries"] == 6
+    assert stats["opened"] <= 2
+    assert stats["opened"] + stats["reused"] == 6
+    with sqlite3.connect(database) as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    conn.close()
+
+
+@pytest.fixture
+def analysis(database):
+    rows = []
+    for hour in range(72):
+        time = datetime(2025, 5, 10 + hour // 24, hour % 24).strftime("%Y/%m/%d %H:%M")
+        for lon, lat in ((20.05, 60.05), (20.15, 60.05), (30.05, 50.05)):
+            value = float(hour + lon)
+            rows.append(("PM10", "μg/m3", value, lon, lat, time, f"{time} {lon} {lat}"))
+    with sqlite3.connect(database) as conn:
+        conn.executemany("INSERT INTO analysis (variable_name, unit_name, value, lon, lat, datetime, hash) VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+    conn.close()
+    return pd.DataFrame(rows, columns=["variable", "unit", "value", "lon", "lat", "datetime", "hash"])
+
+
+def test_analysis_daily_mean_and_max_in_bbox(analysis):
+    query = geodata.AnalysisQuery("PM10", datetime(2025, 5, 10), datetime(2025, 5, 12), "daily", limits={"north": 61, "south": 59, "west": 20, "east": 21})
+    df = geodata.query_analysis(query)
+    assert df["time"].tolist() == [pd.Timestamp(2025, 5, 10), pd.Timestamp(2025, 5, 11)]
+    assert df["count"].tolist() == [48, 48]
+    assert df["max"].tolist() == pytest.approx([23 + 20.15, 47 + 20.15])
+    assert df["mean"].tolist() == pytest.approx([11.5 + 20.1, 35.5 + 20.1])
+
+
+def test_analysis_percentiles_stream_buckets_across_chunks(analysis):
+    query = geodata.AnalysisQuery("PM10", datetime(2025, 5, 10), datetime(2025, 6, 1), "daily", percentiles=(50, 95), per_cell=True)
+    chunks = list(geodata.iter_analysis(query, chunk_rows=7))
+    assert len(chunks) == 3 # A frame whenever a day is complete
+    df = pd.concat(chunks, ignore_index=True)
+    assert len(df) == 9 # 3 days x 3 cells
+    expected = analysis.assign(day=analysis["datetime"].str[:10]).groupby(["day", "lon", "lat"])["value"]
+    assert df["p50"].tolist() == pytest.approx(expected.quantile(0.5).tolist())
+    assert df["p95"].tolist() == pytest.approx(expected.quantile(0.95).tolist())
+    assert df["mean"].tolist() == pytest.approx(expected.mean().tolist())
+    for chunk_rows in (1, 72, 1000): # A row at a time, chunks that end on a day and one chunk
+        pd.testing.assert_frame_equal(pd.concat(geodata.iter_analysis(query, chunk_rows=chunk_rows), ignore_index=True), df)
+
+    monthly = geodata.query_analysis(geodata.AnalysisQuery("PM10", datetime(2025, 5, 10), datetime(2025, 6, 1), "monthly", percentiles=(50,)))
+    assert monthly["count"].tolist() == [216]
+
+
+def test_queries_are_hashable_and_equal_for_equal_limits():
+    first = geodata.ForecastMultiQuery("PM10", datetime(2025, 5, 10), [0, 1], None, {"north": 61, "south": 60, "west": 20, "east": 21})
+    second = geodata.ForecastMultiQuery("PM10", datetime(2025, 5, 10), (0, 1), None, geodata.Limits(61, 60, 20, 21))
+    assert first == second and hash(first) == hash(second)
+    assert first.limits["north"] == 61
+    with pytest.raises(AttributeError):
+        first.leadtimes = [2]
+
+
+def test_result_cache_bounds_ttl_and_generation(tmp_path, monkeypatch):
+    monkeypatch.setattr(geodata.generation, "STAMP", tmp_path / ".generation")
+    frame = pd.DataFrame({"value": np.arange(100, dtype=np.float64)})
+    cache = geodata.ResultCache(max_entries=2, max_bytes=10 * geodata.frame_bytes(frame))
+    cache.put("a", frame)
+    cache.put("b", frame)
+    assert cache.get("a").equals(frame)
+    cache.put("c", frame) # b is least recently used
+    assert cache.get("b") is None
+    assert cache.stats()["evictions"] == 1
+
+    copy = cache.get("a")
+    copy["value"] = 0 # Callers get copies
+    assert cache.get("a").equals(frame)
+
+    cache.put("short", frame, ttl=0) # Evicts c
+    assert cache.get("short") is None
+    assert cache.stats()["expirations"] == 1
+
+    geodata.generation.touch()
+    assert cache.get("a") is None
+    assert cache.stats()["invalidations"] == 1
+    assert cache.stats()["bytes"] == 0
+
+
+def test_get_dataframe_answers_repeated_queries_from_cache(forecasts):
+    query = geodata.ForecastQuery("PM10", datetime(2025, 5, 10), 0, None, {"north": 61, "south": 60, "west": -0.1, "east": 1})
+    first = geodata.get_dataframe(query)
+    misses = geodata.DATASETS.misses + geodata.DATASETS.hits
+    second = geodata.get_dataframe(geodata.ForecastQuery("PM10", datetime(2025, 5, 10), 0, None, dict(query.limits.__dict__)))
+    assert geodata.DATASETS.misses + geodata.DATASETS.hits == misses # Not read again
+    assert first.equals(second)
+    assert geodata.RESULTS.stats()["hits"] == 1
+
+
+def test_results_read_while_an_ingest_finishes_are_not_cached(forecasts, monkeypatch):
+    monkeypatch.setattr(geodata.generation, "STAMP", forecasts / ".generation") # Not touched yet, generation 0
+    query_dataframe, query_result = geodata._query_dataframe, geodata.query_result
+
+    def ingest_during(read):
+        def call(*args):
+            result = read(*args)
+            geodata.generation.touch() # The ingest finishes after the read, before the put
+            return result
+        return call
+
+    monkeypatch.setattr(geodata, "_query_dataframe", ingest_during(query_dataframe))
+    monkeypatch.setattr(geodata, "query_result", ingest_during(query_result))
+    query = geodata.ForecastQuery("PM10", datetime(2025, 5, 10), 0, None, None)
+    assert len(geodata.get_dataframe(query)) == 12 and len(geodata.get_result(query)) == 12
+    assert geodata.RESULTS.stats()["entries"] == 0
+
+    monkeypatch.setattr(geodata, "_query_dataframe", query_dataframe)
+    monkeypatch.setattr(geodata, "query_result", query_result)
+    geodata.get_dataframe(query)
+    geodata.get_result(query)
+    assert geodata.RESULTS.stats()["entries"] == 2
+
+
+def test_region_series_matches_the_frame(forecasts):
+    query = geodata.ForecastMultiQuery("PM10", datetime(2025, 5, 11), [0, 1], None, {"north": 61, "south": 60, "west": -1, "east": 1})
+    series = geodata.region_series(query, percentiles=(50,), weighted=False)
+    df = geodata.get_dataframe(query)
+    assert series.cells == 12
+    assert series.leadtimes.tolist() == [0, 1]
+    assert series.mean.tolist() == pytest.approx(df.groupby("leadtime")["value"].mean().tolist())
+    assert series.max.tolist() == pytest.approx(df.groupby("leadtime")["value"].max().tolist())
+    assert series.percentiles[50].tolist() == pytest.approx([3, 3])
+
+
+def test_polygon_mask_and_cos_lat_weights():
+    longitudes = np.array([0.0, 1.0, 2.0])
+    latitudes = np.array([2.0, 1.0, 0.0])
+    triangle = [(-0.5, -0.5), (3, -0.5), (-0.5, 3)]
+    assert geodata.polygon_mask(longitudes, latitudes, triangle).astype(int).tolist() == [[1, 0, 0], [1, 1, 0], [1, 1, 1]]
+
+    values = np.array([10.0, 20.0])
+    weights = np.cos(np.radians([0.0, 60.0])) # The cell at 60N has half the area
+    assert geodata._weighted_percentiles(values[np.newaxis], weights[np.newaxis], (0, 50, 100)).ravel().tolist() == pytest.approx([10, 40 / 3, 20])
+
+    values = np.random.default_rng(0).random((3, 50))
+    values[1, :10] = np.nan
+    values[2] = np.nan
+    expected = [np.percentile(row[~np.isnan(row)], (5, 50, 95), method="hazen") for row in values[:2]]
+    result = geodata._weighted_percentiles(values, np.where(np.isnan(values), 0.0, 1.0), (5, 50, 95))
+    assert np.allclose(result[:, :2].T, expected)
+    assert np.isnan(result[:, 2]).all()
+
+
+def test_region_means_match_region_series_and_are_cached_on_disk(forecasts, tmp_path, monkeypatch, write_forecast):
+    monkeypatch.setattr(geodata, "WEIGHTS_DIR", tmp_path / "weights")
+    monkeypatch.setattr(geodata, "_region_matrices", {})
+    values = np.arange(12, dtype=np.float32).reshape(3, 4)
+    values[0, 0] = np.nan
+    write_forecast(forecasts / "EU-forecast-PM10-2025-05-12-1" / "ENS_FORECAST.nc", values, date="20250512")
+    regions = {
+        "west": {"north": 61, "south": 60, "west": -1, "east": 0},
+        "north": {"north": 61, "south": 60.1, "west": -1, "east": 1},
+        "triangle": [(-0.2, 60.0), (0.2, 60.0), (-0.2, 60.3)],
+    }
+    query = geodata.ForecastQuery("PM10", datetime(2025, 5, 12), [0, 1], None, None)
+    means = geodata.region_means(query, regions)
+    assert means.index.tolist() == [0, 1]
+    assert means.columns.tolist() == list(regions)
+    for name, region in regions.items():
+        polygon = None if isinstance(region, dict) else region
+        limits = region if polygon is None else None
+        series = geodata.region_series(geodata.ForecastQuery("PM10", datetime(2025, 5, 12), [0, 1], None, limits), polygon=polygon)
+        assert means[name].tolist() == pytest.approx(series.mean.tolist())
+
+    assert len(list((tmp_path / "weights").glob("*.npz"))) == 1
+    geodata._region_matrices.clear()
+    assert geodata.region_means(query, regions).equals(means)
+
+
+def test_get_dataframes_keeps_order_and_reads_repeats_once(forecasts):
+    first = geodata.ForecastQuery("PM10", datetime(2025, 5, 10), 0, None, None)
+    second = geodata.ForecastQuery("PM10", datetime(2025, 5, 11), 0, None, None)
+    no2 = geodata.ForecastQuery("NO2", datetime(2025, 5, 10), [0, 1], None, None)
+    frames = geodata.get_dataframes([second, first, no2, second])
+    assert [frame["value"].iloc[0] for frame in frames] == [3, 1, 2, 3]
+    assert frames[0] is not frames[3] and frames[0].equals(frames[3])
+    assert geodata.RESULTS.misses == 3
+
+    frames = asyncio.run(geodata.get_dataframes_async([no2, first]))
+    assert [len(frame) for frame in frames] == [24, 12]
+    assert geodata.RESULTS.hits == 2
+
+
+def test_columnar_store_round_trips_to_the_nc_frame(forecasts, monkeypatch, write_varied):
+    import nc_to_db # Ingest script, imports its siblings from src
+    monkeypatch.chdir(forecasts) # columnar.ROOT is relative to the working directory
+    path = write_varied(forecasts / "EU-forecast-O3-2025-05-10-1" / "ENS_FORECAST.nc")
+    assert nc_to_db.store_columnar(str(path), Path("data") / "columnar") == (24, 96)
+
+    for limits in (
+        {"north": 61, "south": 60, "west": -1, "east": 1}, # Every cell, across the seam of the 0-360 grid
+        {"north": 60.2, "south": 60.0, "west": -0.1, "east": 0.1}, # Inside the descending latitudes, west of the seam
+        None,
+    ):
+        query = geodata.ForecastMultiQuery("O3", datetime(2025, 5, 10), [0, 1], None, limits)
+        columnar = geodata.get_dataframe(query, "columnar")
+        nc = geodata.get_dataframe(query, "nc")
+        pd.testing.assert_frame_equal(columnar, nc)
+        assert len(columnar) == 2 * (12 if limits is None or limits["west"] == -1 else 4)
+    assert columnar["lon"].tolist()[:4] == [-0.15, -0.05, 0.05, 0.15] and columnar["lat"].tolist()[::4][:3] == [60.25, 60.15, 60.05]
+    assert columnar["value"].tolist()[:4] == [0, 1, 2, 3] and columnar["value"].isna().sum() == 1
+
+
+def test_db_and_nc_frames_have_the_same_rows_columns_and_dtypes(forecasts, monkeypatch, write_varied):
+    import nc_to_db
+    monkeypatch.chdir(forecasts)
+    path = write_varied(forecasts / "EU-forecast-O3-2025-05-10-1" / "ENS_FORECAST.nc", missing=False) # The database has no rows for missing values
+    db = forecasts / "AirQuality.db"
+    with sqlite3.connect(db) as conn:
+        conn.executescript((Path(__file__).parent.parent / "air_quality.schema").read_text())
+    conn.close()
+    with nc_to_db._get_data_set(str(path)) as ds:
+        assert nc_to_db._store_chunks(ds, str(db)) == 24
+    monkeypatch.setattr(geodata, "DB_POOL", geodata.DB_POOL)
+    geodata.set_database(db)
+
+    for limits in ({"north": 61, "south": 60, "west": -1, "east": 1}, {"north": 60.2, "south": 60.0, "west": -0.1, "east": 0.1}, None):
+        for cell_ids in (False, True):
+            query = geodata.ForecastMultiQuery("O3", datetime(2025, 5, 10), [1, 0], None, limits)
+            db_frame = geodata.get_dataframe(query, "db", cell_ids)
+            nc_frame = geodata.get_dataframe(query, "nc", cell_ids)
+            assert db_frame.columns.tolist() == ["id", "value", "lon", "lat", "leadtime"]
+            pd.testing.assert_frame_equal(db_frame, nc_frame)
+
+
+def test_forecast_result_is_compact_and_converts_to_the_frame(forecasts):
+    query = geodata.ForecastQuery("PM10", datetime(2025, 5, 11), [0, 1], None, {"north": 61, "south": 60, "west": -1, "east": 0})
+    result = geodata.get_result(query)
+    assert result.values.dtype == np.float32 and result.values.shape == (2, 6)
+    assert result.leadtimes.dtype == np.int16 and result.lon.shape == (6,)
+    assert result.model == "ENSEMBLE" and len(result) == 12
+    assert geodata.get_result(query) is result
+    assert result.to_dataframe().equals(geodata.get_dataframe(query))
+
+    compact = result.to_dataframe(compact=True)
+    assert compact["id"].astype(str).tolist() == geodata.get_dataframe(query)["id"].tolist()
+    assert compact["value"].dtype == np.float32 and compact["leadtime"].dtype == np.int16
+    assert compact["lon"].astype(float).equals(result.to_dataframe()["lon"])
+    assert compact["variable"].cat.categories.tolist() == ["PM10"] and (compact["model"] == "ENSEMBLE").all()
+
+
+def test_forecast_result_of_database_rows(database):
+    with sqlite3.connect(database) as conn:
+        conn.execute("DELETE FROM forecast_values WHERE leadtime_hours=2 AND cell_id=(SELECT MIN(id) FROM grid_cells)")
+    conn.close()
+    query = geodata.ForecastQuery("PM10", datetime(2025, 5, 10), [0, 2], None, None)
+    result = geodata.query_result(query, "db")
+    assert result.model == "ENSEMBLE" and result.lon.tolist() == [20.05, 20.15]
+    assert result.present.tolist() == [[True, True], [False, True]]
+    df = result.to_dataframe(cell_ids=True)
+    pd.testing.assert_frame_equal(df, geodata.get_dataframe(query, "db", cell_ids=True))
+
+
+def test_db_query_without_model_reads_one_run(database):
+    with sqlite3.connect(database) as conn:
+        conn.execute("INSERT INTO runs (variable_name, unit_name, model, base_time) VALUES ('PM10', 'μg/m3', 'CHIMERE', ?)", (cams.unix_time(datetime(2025, 5, 10)),))
+        conn.execute("INSERT INTO forecast_values SELECT 2, leadtime_hours, cell_id, 99.0 FROM forecast_values WHERE run_id=1")
+    conn.close()
+    limits = {"north": 61, "south": 60, "west": 20, "east": 21}
+    for region in (None, limits):
+        query = geodata.ForecastQuery("PM10", datetime(2025, 5, 10), [0, 1, 2], None, region)
+        df = geodata.get_dataframe(query, "db", cache=False)
+        assert len(df) == 6 and df["value"].tolist() == [1.0, 1.0, 2.0, 2.0, 3.0, 3.0] # ENSEMBLE, not mixed with CHIMERE
+        assert geodata.query_result(query, "db").model == "ENSEMBLE"
+        chimere = geodata.ForecastQuery("PM10", datetime(2025, 5, 10), [0, 1, 2], "CHIMERE", region)
+        assert (geodata.get_dataframe(chimere, "db", cache=False)["value"] == 99.0).all()
+        variables = geodata.query_variables(geodata.ForecastVariablesQuery(["PM10"], datetime(2025, 5, 10), [0, 1, 2], None, region), "db")
+        assert variables.models == ("ENSEMBLE",) and variables["PM10"].tolist() == [[1.0, 1.0], [2.0, 2.0], [3.0, 3.0]]
+
+    with sqlite3.connect(database) as conn:
+        conn.execute("DELETE FROM forecast_values WHERE run_id=1")
+        conn.execute("DELETE FROM runs WHERE id=1")
+    conn.close()
+    query = geodata.ForecastQuery("PM10", datetime(2025, 5, 10), 0, None, None)
+    assert geodata.query_result(query, "db").model == "CHIMERE" and (geodata.get_dataframe(query, "db", cache=False)["value"] == 99.0).all()
+
+
+def test_variables_query_reads_aligned_variables_in_one_pass(forecasts):
+    limits = {"north": 61, "south": 60, "west": -1, "east": 1}
+    query = geodata.ForecastVariablesQuery(["PM10", "NO2"], datetime(2025, 5, 10), [0, 1], None, limits)
+    assert query.variables == ("PM10", "NO2")
+    assert query == geodata.ForecastVariablesQuery(("PM10", "NO2"), datetime(2025, 5, 10), (0, 1), None, limits)
+    result = geodata.get_result(query)
+    assert result.values.shape == (2, 2, 12) and result.values.dtype == np.float32
+    assert (result["PM10"] == 1).all() and (result["NO2"] == 2).all() and result.models == ("ENSEMBLE", "ENSEMBLE")
+
+    df = geodata.get_dataframe(query)
+    assert df.columns.tolist() == ["id", "lon", "lat", "leadtime", "PM10", "NO2"]
+    for variable in query.variables:
+        single = geodata.get_dataframe(geodata.ForecastQuery(variable, datetime(2025, 5, 10), [0, 1], None, limits))
+        assert df[["id", "lon", "lat", "leadtime"]].equals(single[["id", "lon", "lat", "leadtime"]])
+        assert df[variable].equals(single["value"].rename(variable))
+
+    with pytest.raises(ValueError):
+        geodata.ForecastVariablesQuery(["PM10", "PM10"], datetime(2025, 5, 10), 0, None, None)
+
+
+def test_variables_query_rejects_variables_on_other_grids(forecasts, write_forecast):
+    write_forecast(forecasts / "EU-forecast-O3-2025-05-10-1" / "ENS_FORECAST.nc", 4, variable="o3_conc")
+    path = forecasts / "EU-forecast-O3-2025-05-10-1" / "ENS_FORECAST.nc"
+    with xr.open_dataset(path) as ds:
+        shifted = ds.assign_coords(latitude=ds.latitude + 1).load()
+    shifted.to_netcdf(path)
+    query = geodata.ForecastVariablesQuery(["PM10", "O3"], datetime(2025, 5, 10), 0, None, None)
+    with pytest.raises(ValueError, match="grid"):
+        geodata.query_result(query)
+
+
+def test_variables_query_of_database_rows(database):
+    with sqlite3.connect(database) as conn:
+        conn.execute("INSERT INTO variables (short_name) VALUES ('NO2')")
+        conn.execute("INSERT INTO runs (variable_name, unit_name, model, base_time) VALUES ('NO2', 'μg/m3', 'ENSEMBLE', ?)", (cams.unix_time(datetime(2025, 5, 10)),))
+        conn.execute("INSERT INTO forecast_values SELECT 2, leadtime_hours, cell_id, -value FROM forecast_values WHERE leadtime_hours < 2 AND cell_id=(SELECT MIN(id) FROM grid_cells)")
+    conn.close()
+    query = geodata.ForecastVariablesQuery(["NO2", "PM10"], datetime(2025, 5, 10), [0, 1, 2], None, None)
+    result = geodata.query_result(query, "db")
+    assert result.lon.tolist() == [20.05, 20.15] and result.leadtimes.tolist() == [0, 1, 2]
+    assert np.array_equal(result["PM10"], [[1, 1], [2, 2], [3, 3]])
+    assert result.present[0].tolist() == [[True, False], [True, False], [False, False]]
+    df = result.to_dataframe()
+    assert len(df) == len(result) == 6
+    assert np.array_equal(df["NO2"], [-1, np.nan, -2, np.nan, np.nan, np.nan], equal_nan=True)
@@ -0,0 +1,66 @@
+import threading
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from src import hyperslab
+
+
+@pytest.fixture
+def field(tmp_path):
+    values = np.arange(10 * 1 * 6 * 8, dtype=np.float32).reshape(10, 1, 6, 8)
+    values[3, 0, 2, 5] = np.nan
+    path = tmp_path / "chunked.nc"
+    xr.Dataset({"pm10_conc": (("time", "level", "latitude", "longitude"), values)}).to_netcdf(
+        path, encoding={"pm10_conc": {"chunksizes": (4, 1, 3, 4), "zlib": True}}
+    )
+    with xr.open_dataset(path, cache=False) as ds:
+        yield ds["pm10_conc"]
+
+
+def test_read_matches_xarray_in_small_blocks(field):
+    assert hyperslab.disk_chunks(field) == (4, 1, 3, 4)
+    keys = [
+        (np.array([0, 1, 2, 5, 6, 9]), 0, slice(1, 5), slice(2, 7)),
+        (slice(2, 10), 0),
+        (np.array([7, 3]), 0, slice(None), np.array([6, 7, 0, 1])), # Window across the seam of a 0-360 grid
+        (4, 0, slice(0, 3)),
+    ]
+    for key in keys:
+        expected = field[key].values
+        for block_bytes in (1, 200, 2**20):
+            assert np.array_equal(hyperslab.read(field, key, max_block_bytes=block_bytes), expected, equal_nan=True)
+
+    out = np.zeros((2, 6, 8), dtype=np.float32)
+    assert hyperslab.read(field, (np.array([3, 4]), 0), out=out) is out
+    with pytest.raises(ValueError):
+        hyperslab.read(field, (np.array([3]), 0), out=out)
+
+
+def test_blocks_are_aligned_to_chunks():
+    indices = np.array([0, 1, 2, 3, 5, 8, 9, 10])
+    blocks = hyperslab.blocks(indices, chunk=4, rows=8)
+    assert [rows for rows, _ in blocks] == [slice(0, 5), slice(5, 8)]
+    assert np.array_equal(blocks[0][1], [0, 1, 2, 3, 5]) and blocks[1][1] == slice(8, 11)
+    assert [index for _, index in hyperslab.blocks(np.arange(10), chunk=4, rows=2)] == [slice(0, 2), slice(2, 4), slice(4, 6), slice(6, 8), slice(8, 10)]
+
+
+def test_budget_holds_reads_back_until_bytes_are_free():
+    budget = hyperslab.DecodedBudget(max_bytes=100)
+    released = threading.Event()
+    entered = []
+
+    def second():
+        with budget.reserve(60):
+            entered.append(released.is_set())
+
+    with budget.reserve(500): # Larger than the budget, runs alone
+        thread = threading.Thread(target=second)
+        thread.start()
+        thread.join(0.1)
+        assert thread.is_alive() and budget.in_use == 100
+        released.set()
+    thread.join()
+    assert entered == [True]
+    assert budget.stats()["waits"] == 1 and budget.peak == 100 and budget.in_use == 0
@@ -0,0 +1,57 @@
+import re
+import sqlite3
+from pathlib import Path
+from datetime import datetime
+
+import numpy as np
+import xarray as xr
+
+from src import cams
+from src import geodata
+
+
+MIGRATION = Path(__file__).parent.parent / "migrations" / "0002_normalized_forecasts.sql"
+
+# Cell centres in both longitude conventions, west and east of Greenwich
+LON_360 = np.array([335.05, 359.95, 0.05, 44.95])
+LON_180 = np.array([-24.95, -0.05, 0.05, 44.95])
+LAT = np.array([71.95, 60.05, 30.05, -0.05])
+
+
+def sql_cell_ids(lon:np.ndarray, lat:np.ndarray) -> list[int]:
+    """Ids the migration gives cells of the baseline rows, from its own SQL expressions."""
+    sql = MIGRATION.read_text()
+    wrap = re.search(r"(round\(CASE WHEN lon >= 180 THEN lon - 360 ELSE lon END, 2\)) AS lon", sql).group(1)
+    cell_id = re.search(r"(\(CAST\(round\(lat \* 100\) AS INTEGER\) \+ 9000\) \* 36000 \+ CAST\(round\(lon \* 100\) AS INTEGER\) \+ 18000)", sql).group(1)
+    with sqlite3.connect(":memory:") as conn:
+        conn.execute("CREATE TABLE cells (lon REAL, lat REAL)")
+        conn.executemany("INSERT INTO cells VALUES (?, ?)", zip(lon.tolist(), lat.tolist()))
+        ids = [id for id, in conn.execute(f"SELECT {cell_id} FROM (SELECT {wrap} AS lon, round(lat, 2) AS lat FROM cells) ORDER BY rowid")]
+    conn.close()
+    return ids
+
+
+def test_cell_id_is_the_same_in_python_and_sql_for_both_longitude_conventions():
+    ids = cams.cell_id(LON_180, LAT)
+    assert np.array_equal(cams.cell_id(LON_360, LAT), ids)
+    assert len(set(ids.tolist())) == len(ids)
+    assert sql_cell_ids(LON_360, LAT) == sql_cell_ids(LON_180, LAT) == ids.tolist()
+
+
+def test_feature_ids_are_the_strings_of_the_geojson_centroids():
+    assert geodata.feature_ids(LON_180, LAT).tolist() == [str([lon, lat]) for lon, lat in zip(LON_180.tolist(), LAT.tolist())]
+    assert geodata.feature_ids(LON_180, LAT).tolist()[:2] == ["[-24.95, 71.95]", "[-0.05, 60.05]"]
+
+
+def test_geojson_ids_match_the_ids_of_query_results(forecasts):
+    import create_geojson # Script, imports its siblings from src
+    path = forecasts / "EU-forecast-PM10-2025-05-10-1" / "ENS_FORECAST.nc" # Longitudes 359.85..0.15
+    query = geodata.ForecastQuery("PM10", datetime(2025, 5, 10), 0, None, None)
+    with xr.open_dataset(path) as ds:
+        for cell_ids in (False, True):
+            features = create_geojson._get_geodata(ds, cell_ids)["features"]
+            ids = geodata.get_dataframe(query, cell_ids=cell_ids)["id"].tolist()
+            assert sorted(feature["id"] for feature in features) == sorted(ids)
+            assert all(feature["geometry"]["centroid"][0] < 180 for feature in features)
+        strings = [feature["id"] for feature in create_geojson._get_geodata(ds, cell_ids=False)["features"]]
+    assert "[-0.15, 60.25]" in strings and "[0.15, 60.05]" in strings
@@ -0,0 +1,56 @@
+import os
+import sqlite3
+from pathlib import Path
+
+import pytest
+import xarray as xr
+
+import ingest_daemon
+
+
+@pytest.fixture
+def forecast(db, write_forecast):
+    def write(value:float, mtime_s:int, longitudes:int=4) -> Path:
+        """Writes data/netcdf/<dataset>/<request>/ENS_FORECAST.nc with its mtime mtime_s seconds after the epoch."""
+        path = Path("data") / "netcdf" / "EU-forecast" / "PM10-2025-05-10" / "ENS_FORECAST.nc"
+        write_forecast(path, value)
+        if longitudes < 4:
+            with xr.open_dataset(path) as ds:
+                smaller = ds.isel(longitude=slice(0, longitudes)).load()
+            smaller.to_netcdf(path)
+        os.utime(path, (mtime_s, mtime_s))
+        return path.absolute()
+    return write
+
+
+def test_scan_finds_new_and_changed_files_and_skips_touched_and_settling_ones(db, forecast):
+    path = forecast(1, 1_000_000)
+    with sqlite3.connect(db) as conn:
+        new, changed = ingest_daemon.scan(conn, settle_seconds=0)
+        assert [entry.path for entry in new] == [str(path)] and changed == []
+        ingest_daemon._record(conn, new)
+
+        assert ingest_daemon.scan(conn, settle_seconds=0) == ([], [])
+        os.utime(path, (2_000_000, 2_000_000)) # Touched, same content
+        assert ingest_daemon.scan(conn, settle_seconds=0) == ([], [])
+        assert ingest_daemon._manifest(conn)[str(path)].mtime_ns == 2_000_000 * 10**9
+
+        forecast(5, 3_000_000)
+        new, changed = ingest_daemon.scan(conn, settle_seconds=0)
+        assert new == [] and [entry.path for entry in changed] == [str(path)]
+        assert changed[0].checksum != ingest_daemon._manifest(conn)[str(path)].checksum
+
+        os.utime(path) # Modified now, may still be downloading
+        assert ingest_daemon.scan(conn, settle_seconds=30) == ([], [])
+    conn.close()
+
+
+def test_changed_file_replaces_the_rows_of_its_run(db, forecast, rows):
+    forecast(1, 1_000_000)
+    assert ingest_daemon.ingest_once(str(db), workers=1, settle_seconds=0) == 1
+    assert len(rows(db)) == 2 * 12
+
+    forecast(5, 2_000_000, longitudes=3) # The new grid covers fewer cells
+    assert ingest_daemon.ingest_once(str(db), workers=1, settle_seconds=0) == 1
+    assert len(rows(db)) == 2 * 9 and {value for *_, value in rows(db)} == {5.0}
+    assert ingest_daemon.ingest_once(str(db), workers=1, settle_seconds=0) == 0
@@ -0,0 +1,45 @@
+import sys
+import json
+import subprocess
+
+import pytest
+
+from src import metrics
+
+
+@pytest.fixture
+def sinks(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, "_settings", dict(metrics._settings))
+    monkeypatch.setattr(metrics, "_latest", {})
+    metrics.configure(console=False, json_log=str(tmp_path / "metrics.jsonl"), metrics_file=str(tmp_path / "metrics.prom"))
+    return tmp_path
+
+
+def test_progress_writes_json_lines_and_prometheus_textfile(sinks):
+    with metrics.Progress("ingest", total=3, interval=0) as progress: # Reports on every chunk
+        for rows in (10, 20, 30):
+            progress.chunk(rows, rows * 4)
+        progress.commit(0.25)
+
+    lines = [json.loads(line) for line in (sinks / "metrics.jsonl").read_text().splitlines()]
+    assert [line["rows"] for line in lines] == [10, 30, 60, 60]
+    assert [line["final"] for line in lines] == [False, False, False, True]
+    final = lines[-1]
+    assert (final["job"], final["total"], final["chunks"], final["bytes_read"]) == ("ingest", 3, 3, 240)
+    assert (final["commits"], final["commit_seconds_max"]) == (1, 0.25)
+
+    with metrics.Progress("download", interval=3600) as other:
+        other.add(rows=5)
+    prometheus = (sinks / "metrics.prom").read_text().splitlines()
+    assert 'cassini_rows{job="ingest"} 60.0' in prometheus and 'cassini_rows{job="download"} 5.0' in prometheus
+    assert 'cassini_chunks{job="ingest"} 3.0' in prometheus
+    assert not any(line.startswith(("cassini_job", "cassini_time", "cassini_final", 'cassini_total{job="download"}')) for line in prometheus)
+    assert all(len(line.split(" ")) == 2 and float(line.split(" ")[1]) >= 0 for line in prometheus)
+    assert not list(sinks.glob(".*.tmp"))
+
+
+@pytest.mark.skipif(metrics.resource is None, reason="resource is not available on Windows")
+def test_peak_rss_of_exited_children():
+    subprocess.run([sys.executable, "-c", "block = bytearray(64 * 2**20); block[::4096] = b'x' * len(block[::4096])"], check=True)
+    assert metrics.peak_rss(children=True) >= 64 * 2**20
+    assert metrics.peak_rss() > 0
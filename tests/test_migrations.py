@@ -0,0 +1,113 @@
+import re
+import sqlite3
+from pathlib import Path
+from datetime import datetime
+
+import pytest
+
+from src import cams
+
+
+MIGRATIONS = Path(__file__).parent.parent / "migrations"
+
+# air_quality.schema before the migrations: one row per value, longitudes as in the files (0..360)
+BASELINE_SCHEMA = """
+CREATE TABLE variables (
+    id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    short_name TEXT UNIQUE NOT NULL,
+    long_name TEXT UNIQUE,
+    description TEXT
+);
+CREATE TABLE units (
+    id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    name TEXT UNIQUE  NOT NULL
+);
+CREATE TABLE analysis (
+    id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    variable_name TEXT NOT NULL,
+    unit_name TEXT  NOT NULL,
+    value REAL  NOT NULL,
+    lon REAL  NOT NULL,
+    lat REAL  NOT NULL,
+    datetime NUMERIC,
+    hash TEXT UNIQUE NOT NULL,
+    FOREIGN KEY(variable_name) REFERENCES variables(short_name),
+    FOREIGN KEY(unit_name) REFERENCES units(name)
+);
+CREATE TABLE forecasts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    variable_name TEXT NOT NULL,
+    unit_name TEXT NOT NULL,
+    value REAL NOT NULL,
+    lon REAL NOT NULL,
+    lat REAL NOT NULL,
+    datetime NUMERIC,
+    leadtime NUMERIC,
+    model TEXT,
+    hash TEXT UNIQUE NOT NULL,
+    FOREIGN KEY(variable_name) REFERENCES variables(short_name),
+    FOREIGN KEY(unit_name) REFERENCES units(name)
+);
+INSERT INTO variables (short_name) VALUES ('PM10');
+INSERT INTO units (name) VALUES ('μg/m3');
+"""
+
+FORECASTS = [ # variable, value, lon, lat, datetime, leadtime, model
+    ("PM10", 1.0, 359.95, 60.05, "2025/05/10 00:00", "2025/05/10 00:00", None),
+    ("PM10", 2.0, 0.05, 60.05, "2025/05/10 00:00", "2025/05/10 00:00", None),
+    ("PM10", 3.0, 359.95, 60.05, "2025/05/10 00:00", "2025/05/10 01:00", None),
+    ("PM10", 4.0, 359.95, 60.05, "2025/05/10 00:00", "2025/05/10 01:00", "ENSEMBLE"), # Newer value of the row above
+    ("PM10", 5.0, 20.05, 59.95, "2025/05/11 00:00", "2025/05/11 03:00", "CHIMERE"),
+]
+
+
+@pytest.fixture
+def migrated(tmp_path):
+    path = tmp_path / "AirQuality.db"
+    with sqlite3.connect(path) as conn:
+        conn.executescript(BASELINE_SCHEMA)
+        conn.executemany(
+            "INSERT INTO forecasts (variable_name, unit_name, value, lon, lat, datetime, leadtime, model, hash) VALUES (?, 'μg/m3', ?, ?, ?, ?, ?, ?, ?)",
+            [(*row, str(i)) for i, row in enumerate(FORECASTS)]
+        )
+    conn.close()
+    conn = sqlite3.connect(path)
+    for migration in sorted(MIGRATIONS.glob("000[1-4]_*.sql")):
+        conn.executescript(migration.read_text())
+    yield conn
+    conn.close()
+
+
+def test_migrations_move_baseline_forecasts_into_runs_and_cells(migrated):
+    tables = {name for name, in migrated.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+    assert {"runs", "grid_cells", "forecast_values", "ingest_checkpoints", "ingest_manifest"} <= tables
+    assert "forecasts" not in tables
+
+    runs = migrated.execute("SELECT id, variable_name, unit_name, model, base_time FROM runs ORDER BY base_time").fetchall()
+    assert [run[1:] for run in runs] == [
+        ("PM10", "μg/m3", "ENSEMBLE", cams.unix_time(datetime(2025, 5, 10))),
+        ("PM10", "μg/m3", "CHIMERE", cams.unix_time(datetime(2025, 5, 11))),
+    ]
+
+    cells = migrated.execute("SELECT id, lon, lat FROM grid_cells ORDER BY lon").fetchall()
+    assert [(lon, lat) for _, lon, lat in cells] == [(-0.05, 60.05), (0.05, 60.05), (20.05, 59.95)] # Wrapped to -180..180
+    assert [id for id, _, _ in cells] == [int(cams.cell_id(lon, lat)) for _, lon, lat in cells]
+    assert int(cams.cell_id(359.95, 60.05)) == cells[0][0] # Same cell from either longitude convention
+
+    ensemble, chimere = runs[0][0], runs[1][0]
+    values = migrated.execute("SELECT run_id, leadtime_hours, cell_id, value FROM forecast_values").fetchall()
+    assert sorted(values) == sorted([
+        (ensemble, 0, cells[0][0], 1.0),
+        (ensemble, 0, cells[1][0], 2.0),
+        (ensemble, 1, cells[0][0], 4.0),
+        (chimere, 3, cells[2][0], 5.0),
+    ])
+    assert migrated.execute("PRAGMA foreign_key_check").fetchall() == []
+
+
+def test_migrations_create_the_secondary_indexes(migrated):
+    indexes = {name for name, in migrated.execute("SELECT name FROM sqlite_master WHERE type='index'")}
+    expected = set(re.findall(r"CREATE INDEX IF NOT EXISTS (\w+)", (MIGRATIONS.parent / "air_quality.indexes.sql").read_text()))
+    assert expected and expected <= indexes
+    plan = migrated.execute("EXPLAIN QUERY PLAN SELECT id FROM runs WHERE variable_name='PM10' AND base_time=0").fetchall()
+    assert any("runs_variable_base_time" in row[-1] for row in plan)
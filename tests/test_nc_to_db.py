@@ -0,0 +1,154 @@
+import os
+import sqlite3
+import threading
+
+import pytest
+
+import nc_to_db
+
+
+def indexes(db) -> set[str]:
+    with sqlite3.connect(db) as conn:
+        result = {name for name, in conn.execute("SELECT name FROM sqlite_master WHERE type='index' AND name NOT LIKE 'sqlite_%'")}
+    conn.close()
+    return result
+
+
+def die(path, queue, *args):
+    """Reader that is killed before it reports anything"""
+    os._exit(1)
+
+
+def test_store_files_writes_every_file_and_reports_the_failed_ones(db, tmp_path, write_forecast, rows):
+    paths = [tmp_path / "EU-forecast-PM10-2025-05-10-1" / "ENS_FORECAST.nc", tmp_path / "EU-forecast-NO2-2025-05-10-1" / "ENS_FORECAST.nc"]
+    write_forecast(paths[0], 1)
+    write_forecast(paths[1], 2, variable="no2_conc")
+    broken = tmp_path / "broken.nc"
+    broken.write_text("not netCDF")
+
+    result = nc_to_db.store_files([*paths, broken], str(db), workers=2)
+    assert result.failed == [str(broken)]
+    assert result.rows == len(rows(db)) == 2 * 2 * 12
+    assert {value for *_, value in rows(db)} == {1.0, 2.0}
+    assert {"runs_variable_base_time", "grid_cells_lat_lon"} <= indexes(db)
+
+
+def test_store_files_fails_files_of_dead_readers_and_keeps_indexes(db, tmp_path, monkeypatch, write_forecast):
+    path = tmp_path / "EU-forecast-PM10-2025-05-10-1" / "ENS_FORECAST.nc"
+    write_forecast(path, 1)
+    monkeypatch.setattr(nc_to_db, "_read_file", die) # Forked workers inherit it
+    monkeypatch.setattr(nc_to_db, "QUEUE_TIMEOUT", 0.1)
+
+    result = nc_to_db.store_files([path], str(db), workers=1)
+    assert result.failed == [str(path)] and result.rows == 0
+    assert {"runs_variable_base_time", "grid_cells_lat_lon"} <= indexes(db)
+
+
+def test_store_files_returns_when_the_writer_fails(db, tmp_path, monkeypatch, write_forecast):
+    paths = [tmp_path / f"EU-forecast-PM10-2025-05-1{day}-1" / "ENS_FORECAST.nc" for day in (0, 1)]
+    for day, path in enumerate(paths):
+        write_forecast(path, 1, date=f"2025051{day}")
+
+    def locked(*args):
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(nc_to_db, "_write_chunk", locked)
+    errors = []
+
+    def ingest():
+        try:
+            nc_to_db.store_files(paths, str(db), workers=1, max_chunk_bytes=1) # 12 chunks, the queue holds 2
+        except sqlite3.OperationalError as error:
+            errors.append(error)
+
+    thread = threading.Thread(target=ingest)
+    thread.start()
+    thread.join(60)
+    assert not thread.is_alive(), "store_files did not return after the writer failed"
+    assert [str(error) for error in errors] == ["database is locked"]
+    assert {"runs_variable_base_time", "grid_cells_lat_lon"} <= indexes(db)
+
+
+class Interrupted(Exception):
+    pass
+
+
+class Writes(list):
+    """(leadtime hours, cell id) of every row _write_chunk writes. Raises Interrupted after limit chunks."""
+
+    def __init__(self, write_chunk):
+        super().__init__()
+        self.write_chunk = write_chunk
+        self.limit = None
+        self.chunks = 0
+
+    def __call__(self, conn, run_id, meta, chunk, values, progress=None):
+        if self.limit is not None and self.chunks >= self.limit:
+            raise Interrupted
+        self.chunks += 1
+        self.extend((meta.leadtime_hours[chunk.leadtime_idx], int(cell)) for cell in meta.cell_grid[chunk.lat_start:chunk.lat_stop].ravel())
+        return self.write_chunk(conn, run_id, meta, chunk, values, progress)
+
+
+@pytest.fixture
+def writes(monkeypatch):
+    writes = Writes(nc_to_db._write_chunk)
+    monkeypatch.setattr(nc_to_db, "_write_chunk", writes)
+    return writes
+
+
+def store(path, db, max_chunk_bytes, restart=False) -> int:
+    with nc_to_db._get_data_set(str(path)) as ds:
+        return nc_to_db._store_chunks(ds, str(db), max_chunk_bytes, restart)
+
+
+def test_resume_with_other_chunk_size_writes_every_cell_once(db, tmp_path, writes, write_forecast, rows):
+    path = tmp_path / "EU-forecast-PM10-2025-05-10-1" / "ENS_FORECAST.nc"
+    write_forecast(path, 1)
+    row_bytes = 4 * nc_to_db.BYTES_PER_CELL # One latitude row of the 3x4 grid
+
+    writes.limit = 2 # Rows 0 and 1 of the first leadtime
+    with pytest.raises(Interrupted):
+        store(path, db, max_chunk_bytes=row_bytes)
+    assert len(rows(db)) == 8
+    assert {"runs_variable_base_time", "grid_cells_lat_lon"} <= indexes(db) # Rebuilt after the interrupted load
+
+    writes.limit = None
+    assert store(path, db, max_chunk_bytes=2 * row_bytes) == 16
+    assert len(writes) == len(set(writes)) == len(rows(db)) == 2 * 12
+    assert {(leadtime, cell) for _, leadtime, cell, _ in rows(db)} == set(writes)
+
+    assert store(path, db, max_chunk_bytes=row_bytes) == 0
+    assert len(writes) == 24
+
+
+def test_restart_clears_checkpoints_and_writes_again(db, tmp_path, writes, write_forecast, rows):
+    path = tmp_path / "EU-forecast-PM10-2025-05-10-1" / "ENS_FORECAST.nc"
+    write_forecast(path, 1)
+    assert store(path, db, nc_to_db.MAX_CHUNK_BYTES) == 24
+
+    write_forecast(path, 5)
+    assert store(path, db, nc_to_db.MAX_CHUNK_BYTES) == 0
+    assert store(path, db, nc_to_db.MAX_CHUNK_BYTES, restart=True) == 24
+    assert len(rows(db)) == 24 and {value for *_, value in rows(db)} == {5.0}
+    with sqlite3.connect(db) as conn:
+        assert conn.execute("SELECT leadtime_hours, lat_start, lat_stop FROM ingest_checkpoints ORDER BY 1").fetchall() == [(0, 0, 3), (1, 0, 3)]
+    conn.close()
+
+
+def test_ingesting_a_file_again_updates_rows_in_place(db, tmp_path, write_forecast, rows):
+    path = tmp_path / "EU-forecast-PM10-2025-05-10-1" / "ENS_FORECAST.nc"
+    write_forecast(path, 1)
+    assert nc_to_db.store_files([path], str(db), workers=1).rows == 24
+    before = rows(db)
+
+    write_forecast(path, 7) # Same run and cells, new values
+    assert nc_to_db.store_files([path], str(db), workers=1, restart=True).rows == 24
+    after = rows(db)
+    assert len(after) == len(before) == 24
+    assert [row[:3] for row in after] == [row[:3] for row in before]
+    assert {value for *_, value in after} == {7.0}
+    with sqlite3.connect(db) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM runs").fetchone() == (1,)
+        assert conn.execute("SELECT COUNT(*) FROM grid_cells").fetchone() == (12,)
+    conn.close()
@@ -1,8 +1,9 @@
 import pytest
+import numpy as np
 import pandas as pd
 from datetime import datetime
 
-from src.pollution import accumulation, Coordinate
+from src.pollution import accumulation, Coordinate, GridIndex, TimeSeries, find_nearest
 
 
 data = pd.DataFrame([[1, 20.25, 60.25, 0], [1, 20.25, 60.25, 1], [1, 20.25, 60.25, 2], [1, 20.25, 60.25, 3]], columns=["value", "lon", "lat", "leadtime"])
@@ -212,4 +213,96 @@ def test_order():
     exposure_start = datetime(2025, 5, 10, 1, 0)
     exposure_end = datetime(2025, 5, 10, 2, 0)
     result = accumulation(data, location, exposure_start, exposure_end, air_intake_cubics_per_minute=1)
-    assert result == 60
\ No newline at end of file
+    assert result == 60
+
+
+def grid_frame(lons, lats, leadtimes):
+    lon, lat, leadtime = (axis.ravel() for axis in np.meshgrid(lons, lats, leadtimes, indexing="ij"))
+    return pd.DataFrame({"value": lon * 10 + lat + leadtime * 100, "lon": lon, "lat": lat, "leadtime": leadtime})
+
+
+def test_grid_index_finds_the_same_cell_as_find_nearest():
+    frame = grid_frame(np.round(np.arange(-0.45, 0.5, 0.1), 2), np.round(np.arange(60.05, 61, 0.1), 2), [0, 1, 2])
+    index = GridIndex(frame)
+    assert index.regular
+    for lon, lat in [(0.02, 60.52), (-0.44, 60.06), (0.31, 60.89), (-3, 58), (5, 65)]:
+        nearest = frame[(frame["lon"] == find_nearest(frame["lon"], lon)) & (frame["lat"] == find_nearest(frame["lat"], lat))]
+        assert index.series(Coordinate(lon, lat)).tolist() == pytest.approx(nearest["value"].tolist())
+
+
+def test_grid_index_series_is_a_view():
+    index = GridIndex(grid_frame([0.0, 0.1], [60.0, 60.1], [0, 1]))
+    assert np.shares_memory(index.series(Coordinate(0.1, 60.0)), index.values)
+
+
+def test_grid_index_falls_back_to_kd_tree_on_irregular_points():
+    frame = pd.DataFrame([[1, 0.0, 0.0, 0], [2, 1.0, 0.3, 0], [3, 2.5, 2.0, 0], [4, 7.0, 1.0, 0]], columns=["value", "lon", "lat", "leadtime"])
+    index = GridIndex(frame)
+    assert not index.regular
+    assert index.series(Coordinate(2.2, 1.9)).tolist() == [3]
+    assert index.series(Coordinate(6.0, 0.0)).tolist() == [4]
+    with pytest.raises(ValueError):
+        index.series(Coordinate(6.0, 0.0), method="bilinear")
+
+
+def test_grid_index_bilinear():
+    index = GridIndex(grid_frame([0.0, 0.1], [60.0, 60.1], [0, 1]))
+    assert index.series(Coordinate(0.05, 60.05), method="bilinear").tolist() == pytest.approx([60.55, 160.55])
+    assert index.series(Coordinate(0.1, 60.0), method="bilinear").tolist() == pytest.approx([61.0, 161.0])
+    assert index.series(Coordinate(-1, 59), method="bilinear").tolist() == pytest.approx([60.0, 160.0])
+
+
+def test_accumulation_accepts_a_grid_index():
+    index = GridIndex(data)
+    exposure_start = datetime(2025, 5, 10, 0, 0)
+    exposure_end = datetime(2025, 5, 10, 2, 30)
+    assert accumulation(index, location, exposure_start, exposure_end, air_intake_cubics_per_minute=1) == 150
+    assert accumulation(index, location, exposure_start, exposure_end, air_intake_cubics_per_minute=1, method="bilinear") == 150
+
+
+def test_exposure_over_midnight_and_days():
+    two_days = pd.DataFrame([[hour, 20.25, 60.25, hour] for hour in range(48)], columns=["value", "lon", "lat", "leadtime"])
+    start = datetime(2025, 5, 10, 23, 30)
+    result = accumulation(two_days, location, start, datetime(2025, 5, 11, 0, 30), air_intake_cubics_per_minute=1)
+    assert result == 30 * 23 + 30 * 24
+    result = accumulation(two_days, location, datetime(2025, 5, 10, 12), datetime(2025, 5, 11, 12), air_intake_cubics_per_minute=1)
+    assert result == 60 * sum(range(12, 36))
+    # Forecast from the day before: leadtime 24 is midnight of the exposure day
+    result = accumulation(two_days, location, datetime(2025, 5, 11, 0), datetime(2025, 5, 11, 1), air_intake_cubics_per_minute=1, base_time=datetime(2025, 5, 10))
+    assert result == 60 * 24
+    result = accumulation(two_days, location, datetime(2025, 5, 10, 0), datetime(2025, 5, 10, 2), air_intake_cubics_per_minute=1, resampling="linear")
+    assert result == pytest.approx(120)
+    with pytest.raises(ValueError):
+        accumulation(two_days, location, start, datetime(2025, 5, 12, 1), air_intake_cubics_per_minute=1)
+
+
+def test_time_series_integrals_match_dense_sums():
+    rng = np.random.default_rng(1)
+    values = rng.uniform(0, 10, (6, 3))
+    values[3, 2] = np.nan
+    times = np.array([0, 1, 2, 4, 5, 6], dtype=float)
+    starts = np.array([0, 0.25, 1.5, 4.5, 2.0, 3.0])
+    ends = np.array([6, 0.75, 3.5, 6.0, 2.0, 4.0])
+    for resampling, end in (("step", 7), ("linear", 6)):
+        series = TimeSeries(times, values, resampling)
+        assert series.end == end
+        integral = series.integrate(starts, ends)
+        assert integral.shape == (6, 3)
+        for window, (start, stop) in enumerate(zip(starts, ends)):
+            midpoints = start + (np.arange(20000) + 0.5) * (stop - start) / 20000
+            expected = series.at(midpoints).mean(axis=0) * (stop - start) if stop > start else np.zeros(3)
+            assert np.allclose(integral[window], expected, rtol=1e-3, equal_nan=True)
+    assert np.isnan(TimeSeries(times, values, "step").integrate(4.5, 6)[0, 2])
+    assert not np.isnan(TimeSeries(times, values, "step").integrate(5, 6)[0, 2])
+    assert np.allclose(TimeSeries(times, values, "linear").at([0.5])[0], (values[0] + values[1]) / 2)
+    with pytest.raises(ValueError):
+        TimeSeries(times, values, "linear").integrate(5, 6.5)
+
+
+def test_time_series_of_grid_index_with_datetimes():
+    index = GridIndex(pd.DataFrame([[hour % 24, 20.25, 60.25, hour] for hour in range(48)], columns=["value", "lon", "lat", "leadtime"]))
+    series = TimeSeries.of(index, datetime(2025, 5, 10), [location, Coordinate(20.25, 60.25)])
+    days = [datetime(2025, 5, 10), datetime(2025, 5, 11)]
+    means = series.mean(days, [day + pd.Timedelta(days=1) for day in days])
+    assert np.array_equal(means, np.full((2, 2), 11.5))
+    assert series.at([datetime(2025, 5, 11, 3, 30)]).tolist() == [[3, 3]]
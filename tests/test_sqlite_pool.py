@@ -0,0 +1,29 @@
+import sqlite3
+
+from src import sqlite_pool
+
+
+def test_iterate_counts_its_time_and_closes_the_cursor_when_abandoned(tmp_path):
+    path = tmp_path / "pool.db"
+    with sqlite3.connect(path) as writer:
+        writer.execute("PRAGMA journal_mode=WAL")
+        writer.execute("CREATE TABLE numbers (n INTEGER)")
+        writer.executemany("INSERT INTO numbers VALUES (?)", [(n,) for n in range(1000)])
+    pool = sqlite_pool.ConnectionPool(path)
+
+    assert sum(len(rows) for rows in pool.iterate("SELECT n FROM numbers", size=100)) == 1000
+    stats = pool.stats()
+    assert stats["queries"] == 1 and stats["query_seconds"] > 0 and stats["mean_query_seconds"] == stats["query_seconds"]
+
+    chunks = pool.iterate("SELECT n FROM numbers", size=10)
+    assert len(next(chunks)) == 10
+    with writer:
+        writer.execute("INSERT INTO numbers VALUES (1000)")
+    _, log, checkpointed = writer.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+    assert checkpointed < log # The open cursor holds a read transaction on an older snapshot
+    chunks.close() # The caller stops early
+    _, log, checkpointed = writer.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+    assert checkpointed == log
+    assert pool.stats()["queries"] == 2
+    writer.close()
+    pool.close()